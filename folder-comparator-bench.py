@@ -0,0 +1,347 @@
+"""文件夹比较工具的性能基准测试
+
+生成可复现的合成文件夹对（文件数、目录深度、大小分布和重叠比例都可配置），
+分别测量比较引擎、报告写入、分类复制和图形界面表格填充的耗时，结果保存为 JSON，
+便于在不同版本之间跟踪性能变化。
+
+    python folder-comparator-bench.py --files 1k,10k,100k --output bench.json
+
+每个用例都在独立的子进程中运行，峰值内存只包含该用例本身
+（Linux 上读取 /proc/self/status 中 exec 后重新计算的 VmHWM，不受父进程内存影响）。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from folder_compare_engine import (FolderComparator, COPY_MODE_LABELS, REPORT_FORMATS, PHASE_ORDER,
+                                   format_size, peak_rss)
+
+# 合成文件夹对的参数说明写在这个文件里，参数相同时直接复用已生成的文件夹
+TREE_MANIFEST = "bench_tree.json"
+SIZE_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+# 每个叶子目录中的文件数和每层的子目录数
+FILES_PER_DIR = 100
+DIR_FANOUT = 16
+# 文件内容取自这段固定的伪随机数据，不同文件使用不同的偏移
+CONTENT_BLOCK_SIZE = 1 << 20
+
+# 用例名称 -> (说明, FolderComparator 选项)
+CASES = {
+    "engine": ("扫描并比较（同时扫描、边扫描边输出）", {}),
+    "engine_sorted": ("扫描完成后按类别和名称顺序比较", {"progressive": False}),
+    "content": ("比较共有文件的内容（不使用哈希缓存）", {"compare_content": True}),
+    "report": ("比较并写入全部格式的报告", {"save_report": True, "report_formats": REPORT_FORMATS}),
+    "copy": ("比较并分类复制文件", {"classify_files": True}),
+    "gui": ("图形界面: 后台线程比较并填充结果表格（offscreen 平台）", {}),
+}
+DEFAULT_CASES = ("engine", "engine_sorted", "content", "report", "copy", "gui")
+
+
+def parse_count(text):
+    """解析 1000、10k、1M 这样的文件数"""
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    if scale != 1:
+        text = text[:-1]
+    return int(float(text) * scale)
+
+
+def size_sampler(rng, distribution, mean_size, max_size):
+    """返回按指定分布生成文件大小的函数"""
+    if distribution == "fixed":
+        return lambda: mean_size
+    if distribution == "uniform":
+        return lambda: rng.randint(0, min(2 * mean_size, max_size))
+    # 对数正态分布: 大部分是小文件，偶尔有大文件，中位数约为 mean_size / 2
+    mu = max(1.0, mean_size / 2)
+    return lambda: min(int(rng.lognormvariate(0, 1.2) * mu), max_size)
+
+
+def relative_path(prefix, number, depth):
+    """按编号把文件分散到 depth 层子目录中，每个叶子目录最多 FILES_PER_DIR 个文件"""
+    leaf = number // FILES_PER_DIR
+    parts = []
+    for _ in range(depth):
+        parts.append(f"d{leaf % DIR_FANOUT:02d}")
+        leaf //= DIR_FANOUT
+    parts.append(f"{prefix}{number:07d}.dat")
+    return os.path.join(*parts)
+
+
+def write_file(path, block, offset, size, flip=False):
+    """从内容块的 offset 处取 size 字节写入文件；flip 为 True 时改动中间的一个字节"""
+    data = bytearray()
+    while len(data) < size:
+        data += block[offset:offset + size - len(data)]
+        offset = 0
+    if flip and size:
+        data[size // 2] ^= 0xFF
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def generate_pair(root, files, depth=2, distribution="lognormal", mean_size=4096, max_size=1 << 24,
+                  overlap=0.8, modified=0.1, seed=0):
+    """在 root/folder1 和 root/folder2 中生成合成文件夹对，返回 (folder1, folder2, 参数)
+
+    每侧 files 个文件，其中 overlap 比例是同名文件，同名文件中 modified 比例大小相同但内容不同。
+    同样的参数和种子总是生成同样的文件夹；root 中已有参数相同的文件夹时直接复用。"""
+    params = {"files": files, "depth": depth, "distribution": distribution, "mean_size": mean_size,
+              "max_size": max_size, "overlap": overlap, "modified": modified, "seed": seed}
+    folder1 = os.path.join(root, "folder1")
+    folder2 = os.path.join(root, "folder2")
+    manifest = os.path.join(root, TREE_MANIFEST)
+    try:
+        with open(manifest, encoding="utf-8") as f:
+            if json.load(f).get("params") == params:
+                return folder1, folder2, params
+    except (OSError, ValueError):
+        pass
+
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(folder1)
+    os.makedirs(folder2)
+    rng = random.Random(seed)
+    block = rng.randbytes(CONTENT_BLOCK_SIZE)
+    next_size = size_sampler(rng, distribution, mean_size, max_size)
+    common = round(files * overlap)
+    changed = round(common * modified)
+    total_bytes = 0
+
+    for number in range(files):
+        size = next_size()
+        offset = rng.randrange(CONTENT_BLOCK_SIZE)
+        if number < common:
+            path = relative_path("c", number, depth)
+            write_file(os.path.join(folder1, path), block, offset, size)
+            write_file(os.path.join(folder2, path), block, offset, size, flip=number < changed)
+            total_bytes += 2 * size
+        else:
+            write_file(os.path.join(folder1, relative_path("a", number, depth)), block, offset, size)
+            size2 = next_size()
+            write_file(os.path.join(folder2, relative_path("b", number, depth)), block, offset, size2)
+            total_bytes += size + size2
+
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "total_bytes": total_bytes}, f, indent=2)
+    return folder1, folder2, params
+
+
+def run_engine_case(case, folder1, folder2, output_root, copy_mode):
+    """在当前进程中运行一次引擎用例，返回 summary()"""
+    options = dict(CASES[case][1])
+    options.setdefault("use_cache", False)
+    comparator = FolderComparator(
+        folder1, folder2, options.pop("save_report", False), options.pop("classify_files", False),
+        recursive=True, copy_mode=copy_mode, output_root=output_root,
+        checkpoint_dir=os.path.join(output_root, "checkpoints"), **options)
+    return comparator.run()
+
+
+def run_gui_case(folder1, folder2):
+    """用 offscreen 平台打开主窗口，启动比较并等待结果表格填充完成，返回结果汇总"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    import importlib.util
+    from PyQt6.QtWidgets import QApplication
+
+    spec = importlib.util.spec_from_file_location(
+        "folder_comparator_gui", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                              "folder-comparator-gui.py"))
+    gui_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gui_module)
+
+    app = QApplication.instance() or QApplication([])
+    window = gui_module.FolderCompareGUI()
+    window.folder1_edit.setText(folder1)
+    window.folder2_edit.setText(folder2)
+    window.recursive_cb.setChecked(True)
+    window.use_cache_cb.setChecked(False)
+    window.resume_cb.setChecked(False)
+    window.save_report_cb.setChecked(False)
+    window.classify_files_cb.setChecked(False)
+    window.compare_content_cb.setChecked(False)
+
+    results = []
+    # 只计从点击“开始比较”到表格填充完成的时间，不含导入和创建窗口
+    start = time.perf_counter()
+    window.start_comparison()
+    if window.worker is None:
+        return None
+    # 在窗口自己的 on_finished 之后执行，此时 perf 中已包含界面填充耗时
+    window.worker.finished_signal.connect(lambda result: (results.append(result), app.quit()))
+    window.worker.finished.connect(lambda: results or app.quit())
+    app.exec()
+    window.worker.wait()
+    if not results:
+        return None
+    result = results[0]
+    result["seconds"] = time.perf_counter() - start
+    result["rows"] = sum(model.rowCount() for model in window.models.values())
+    return result
+
+
+def run_case(spec):
+    """子进程入口: 运行一个用例，返回耗时、性能统计和峰值内存"""
+    case = spec["case"]
+    output_root = tempfile.mkdtemp(prefix="bench_out_", dir=spec["work_dir"])
+    try:
+        start = time.perf_counter()
+        if case == "gui":
+            result = run_gui_case(spec["folder1"], spec["folder2"])
+        else:
+            result = run_engine_case(case, spec["folder1"], spec["folder2"], output_root,
+                                     spec["copy_mode"])
+        seconds = result.get("seconds", time.perf_counter() - start) if result else None
+    finally:
+        shutil.rmtree(output_root, ignore_errors=True)
+    if result is None:
+        return {"error": "比较失败或被中断"}
+    data = {"seconds": round(seconds, 6), "counts": result["counts"],
+            "status_counts": result["status_counts"], "perf": result.get("perf"),
+            "peak_rss_bytes": peak_rss()}
+    if "rows" in result:
+        data["rows"] = result["rows"]
+    return data
+
+
+def spawn_case(spec):
+    """在独立的子进程中运行用例，返回其结果"""
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(spec)],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        return {"error": (proc.stderr.strip().splitlines() or [f"退出码 {proc.returncode}"])[-1]}
+    return json.loads(lines[-1])
+
+
+def git_revision():
+    """返回当前代码的 git 提交号，不在 git 仓库中时返回 None"""
+    try:
+        proc = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    return proc.stdout.strip() or None
+
+
+def environment():
+    """记录运行环境，便于比较不同机器和版本的结果"""
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "git_revision": git_revision(),
+    }
+    # 在子进程中查询 Qt 版本: 本进程导入 PyQt6 后内存会变大，而 Linux 上子进程的 ru_maxrss 从父进程继承
+    try:
+        proc = subprocess.run([sys.executable, "-c", "from PyQt6.QtCore import PYQT_VERSION_STR, QT_VERSION_STR; "
+                               "print(PYQT_VERSION_STR, QT_VERSION_STR)"],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        versions = proc.stdout.split()
+    except OSError:
+        versions = []
+    if len(versions) == 2:
+        info["pyqt"], info["qt"] = versions
+    else:
+        info["pyqt"] = None
+    return info
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="文件夹比较工具的性能基准测试: 生成合成文件夹对，测量比较、报告、复制和界面填充的耗时。",
+        epilog="可用用例: " + ", ".join(f"{name}（{label}）" for name, (label, _) in CASES.items()))
+    parser.add_argument("--files", default="1k,10k", help="每侧文件数，逗号分隔，支持 k/M 后缀（默认 1k,10k）")
+    parser.add_argument("--depth", type=int, default=2, help="子目录层数（默认 2）")
+    parser.add_argument("--size-dist", choices=SIZE_DISTRIBUTIONS, default="lognormal", help="文件大小分布")
+    parser.add_argument("--mean-size", type=int, default=4096, help="平均文件大小（字节）")
+    parser.add_argument("--max-size", type=int, default=1 << 24, help="单个文件的最大大小（字节）")
+    parser.add_argument("--overlap", type=float, default=0.8, help="同名文件所占比例（0-1）")
+    parser.add_argument("--modified", type=float, default=0.1, help="同名文件中内容不同的比例（0-1）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，相同的种子生成相同的文件夹")
+    parser.add_argument("--cases", default=",".join(DEFAULT_CASES), help="要运行的用例，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例的运行次数，记录最短耗时（默认 3）")
+    parser.add_argument("--copy-mode", choices=list(COPY_MODE_LABELS), default="copy", help="copy 用例的复制方式")
+    parser.add_argument("--work-dir", default=None,
+                        help="存放合成文件夹的目录，参数相同时复用（默认系统临时目录下的 folder_compare_bench）")
+    parser.add_argument("--output", default=None, help="结果 JSON 文件（默认 基准测试_时间戳.json）")
+    parser.add_argument("--run-case", default=None, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return 0
+
+    cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"未知的用例: {', '.join(unknown)}")
+    try:
+        sizes = [parse_count(text) for text in args.files.split(",") if text.strip()]
+    except ValueError:
+        parser.error(f"无法解析文件数: {args.files}")
+    if not 0 <= args.overlap <= 1 or not 0 <= args.modified <= 1:
+        parser.error("--overlap 和 --modified 必须在 0 到 1 之间")
+
+    work_dir = os.path.abspath(args.work_dir or os.path.join(tempfile.gettempdir(), "folder_compare_bench"))
+    os.makedirs(work_dir, exist_ok=True)
+    output = args.output or f"基准测试_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    data = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "options": {"cases": cases, "repeat": args.repeat, "copy_mode": args.copy_mode},
+        "results": [],
+    }
+
+    for files in sizes:
+        start = time.perf_counter()
+        folder1, folder2, params = generate_pair(
+            os.path.join(work_dir, f"tree_{files}"), files, args.depth, args.size_dist, args.mean_size,
+            args.max_size, args.overlap, args.modified, args.seed)
+        print(f"📁 {files} 个文件/侧: 合成文件夹就绪 ({time.perf_counter() - start:.2f}s) {folder1}",
+              file=sys.stderr)
+
+        for case in cases:
+            spec = {"case": case, "folder1": folder1, "folder2": folder2, "work_dir": work_dir,
+                    "copy_mode": args.copy_mode}
+            runs = [spawn_case(spec) for _ in range(max(1, args.repeat))]
+            ok = [run for run in runs if "error" not in run]
+            entry = {"case": case, "tree": params, "runs": [run.get("seconds") for run in runs]}
+            if not ok:
+                entry["error"] = runs[-1]["error"]
+                print(f"  ❌ {case}: {entry['error']}", file=sys.stderr)
+            else:
+                best = min(ok, key=lambda run: run["seconds"])
+                entry.update(best)
+                entry["runs"] = [run["seconds"] for run in ok]
+                entry["files_per_second"] = round(2 * files / best["seconds"], 1) if best["seconds"] else None
+                phases = (best.get("perf") or {}).get("phases", {})
+                detail = ", ".join(f"{name} {phases[name]:.2f}s" for name in PHASE_ORDER if phases.get(name))
+                print(f"  ⏱ {case}: {best['seconds']:.3f}s  峰值内存 {format_size(best['peak_rss_bytes'] or 0)}"
+                      f"  [{detail}]", file=sys.stderr)
+            data["results"].append(entry)
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"✅ 基准测试结果已保存: {output}", file=sys.stderr)
+    return 1 if any("error" in entry for entry in data["results"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import argparse
+import os
+import sys
+
+from folder_compare_engine import (FolderComparator, MultiFolderComparator, IgnoreRules, COPY_MODE_LABELS,
+                                   DEFAULT_WORKERS, DEFAULT_IO_LIMIT, DIFFERENT_STATUSES, REPORT_FORMATS,
+                                   MAX_FOLDERS, format_variants, is_snapshot, parse_age, parse_size)
+
+# 逐行输出比较结果时使用的标记
+MARKS = {
+    "folder1_unique": "<",
+    "folder2_unique": ">",
+    "renamed": "~",
+}
+
+
+def mark_of(record):
+    """结果行的输出标记"""
+    mark = MARKS.get(record.category)
+    if mark is None:
+        mark = "!" if record.status in DIFFERENT_STATUSES else "="
+    return mark
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="文件夹内容比较工具（命令行版），与图形界面使用同一比较引擎。"
+                    "任意一侧都可以是用 --save-snapshot 保存的快照文件。",
+        epilog="输出标记: < 只在文件夹1, > 只在文件夹2, = 共有文件, ! 共有但大小或内容不同, "
+               "~ 重命名或移动（原路径 → 新路径）。"
+               "--watch 时变化的结果行前加 - （撤下）或 + （新增或更新）。"
+               "指定三个及以上文件夹时进行多文件夹比较，每行前面每个文件夹一个字符: "
+               ". 不存在, ! 无法读取, 字母相同表示版本相同（比较内容时为内容相同，否则为大小相同）。"
+               "退出码: 0 表示没有差异, 1 表示存在差异, 2 表示比较失败或被中断。")
+    parser.add_argument("folder1", help="文件夹1路径")
+    parser.add_argument("folder2", nargs="?", help="文件夹2路径（保存快照时不需要）")
+    parser.add_argument("more_folders", nargs="*", metavar="folderN",
+                        help="更多文件夹: 同时比较所有文件夹，每个文件只扫描一次")
+    parser.add_argument("-r", "--recursive", action="store_true", help="包含子文件夹")
+    parser.add_argument("--max-depth", type=int, default=None, help="子文件夹的最大深度（默认不限）")
+    parser.add_argument("--no-follow-symlinks", action="store_true", help="跳过符号链接")
+    parser.add_argument("--ignore", action="append", default=[], metavar="PATTERN",
+                        help="忽略匹配的文件和文件夹，规则与 .gitignore 相同（如 '*.tmp'、'build/'、'!keep.log'），可重复指定")
+    parser.add_argument("--ignore-file", action="append", default=[], metavar="FILE",
+                        help="从文件中读取忽略规则（.gitignore 格式），可重复指定")
+    parser.add_argument("--min-size", default=None, metavar="SIZE", help="忽略小于此大小的文件（如 10K、1.5M）")
+    parser.add_argument("--max-size", default=None, metavar="SIZE", help="忽略大于此大小的文件（如 500M、2G）")
+    parser.add_argument("--newer-than", default=None, metavar="AGE",
+                        help="只比较在此时间内修改过的文件（如 12h、7d、2w，不带单位按天）")
+    parser.add_argument("--older-than", default=None, metavar="AGE",
+                        help="只比较在此时间之前修改的文件（格式同 --newer-than）")
+    parser.add_argument("-c", "--content", action="store_true", help="比较同名文件的内容")
+    parser.add_argument("--detect-renames", action="store_true",
+                        help="在两侧独有的文件中按大小和哈希找出重命名或移动的文件，单独列出且只复制一份")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="工作线程数")
+    parser.add_argument("--io-limit", type=int, default=DEFAULT_IO_LIMIT, help="每个文件夹的并发读取数")
+    parser.add_argument("--sorted", action="store_true",
+                        help="扫描完两个文件夹后再按类别和名称顺序输出（默认同时扫描并边扫描边输出）")
+    parser.add_argument("--sort-chunk", type=int, default=None, metavar="N",
+                        help="流式归并模式: 按名称外部排序，每侧内存中最多保留 N 条记录")
+    parser.add_argument("--no-cache", action="store_true", help="不使用哈希缓存")
+    parser.add_argument("--report", action="store_true", help="保存分析报告")
+    parser.add_argument("--report-format", action="append", choices=REPORT_FORMATS, default=None,
+                        help="报告格式，可重复指定（默认 txt）")
+    parser.add_argument("--classify", action="store_true", help="分类复制文件")
+    parser.add_argument("--copy-mode", choices=list(COPY_MODE_LABELS), default="copy", help="分类复制方式")
+    parser.add_argument("--output-root", default=None, help="输出目录的上级目录（默认当前目录）")
+    parser.add_argument("--incremental", metavar="DIR", default=None, help="增量输出到固定目录")
+    parser.add_argument("--keep-stale", action="store_true", help="增量模式下不删除已不存在的文件")
+    parser.add_argument("--resume", action="store_true",
+                        help="从上次中断（Ctrl+C 或出错）的检查点继续比较内容和分类复制")
+    parser.add_argument("--save-snapshot", metavar="FILE", default=None,
+                        help="不进行比较，把文件夹1的文件列表保存为快照文件")
+    parser.add_argument("--snapshot-hashes", action="store_true",
+                        help="保存快照时同时计算每个文件的完整哈希，之后可与快照比较内容")
+    parser.add_argument("--watch", action="store_true",
+                        help="比较完成后持续监视两个文件夹，文件变化时只更新受影响的结果，按 Ctrl+C 结束")
+    parser.add_argument("--poll-interval", type=float, default=None, metavar="SECONDS",
+                        help="监视时不使用 inotify，改为按此间隔（秒）轮询")
+    parser.add_argument("--perf-json", metavar="FILE", default=None,
+                        help="把各阶段耗时、吞吐量、系统调用次数和峰值内存保存为 JSON")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不输出日志，只输出比较结果")
+    parser.add_argument("--summary-only", action="store_true", help="不逐行输出比较结果")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.save_snapshot is None and args.folder2 is None:
+        parser.error("需要指定文件夹2，或使用 --save-snapshot 保存快照")
+    folders = [args.folder1] if args.save_snapshot else [args.folder1, args.folder2] + args.more_folders
+    if args.more_folders:
+        if len(folders) > MAX_FOLDERS:
+            parser.error(f"最多同时比较 {MAX_FOLDERS} 个文件夹")
+        for option, used in (("--classify", args.classify), ("--detect-renames", args.detect_renames),
+                             ("--watch", args.watch), ("--resume", args.resume),
+                             ("--sort-chunk", args.sort_chunk)):
+            if used:
+                parser.error(f"多文件夹比较不支持 {option}")
+    for folder in folders:
+        if not os.path.isdir(folder) and (args.save_snapshot or not is_snapshot(folder)):
+            print(f"❌ 文件夹不存在: {folder}", file=sys.stderr)
+            return 2
+    try:
+        ignore = IgnoreRules(args.ignore, args.ignore_file,
+                             min_size=parse_size(args.min_size or ""), max_size=parse_size(args.max_size or ""),
+                             newer_than=parse_age(args.newer_than or ""), older_than=parse_age(args.older_than or ""))
+    except ValueError as e:
+        parser.error(str(e))
+    except OSError as e:
+        print(f"❌ 无法读取忽略文件: {e}", file=sys.stderr)
+        return 2
+
+    def log(msg, color):
+        if not args.quiet or color == "red":
+            print(msg, file=sys.stderr)
+
+    def on_records(records):
+        if args.summary_only:
+            return
+        sys.stdout.writelines(f"{mark_of(record)} {record.filename}\n" for record in records)
+    
+    def on_multi_records(records):
+        if args.summary_only:
+            return
+        sys.stdout.writelines(f"{format_variants(record.variants)} {record.filename}\n" for record in records)
+    
+    def on_changes(old_rows, new_rows):
+        if args.summary_only:
+            return
+        kept = {(record.category, record.filename) for record in new_rows}
+        lines = [f"- {mark_of(record)} {record.filename}\n" for record in old_rows
+                 if (record.category, record.filename) not in kept]
+        lines.extend(f"+ {mark_of(record)} {record.filename}\n" for record in new_rows)
+        sys.stdout.writelines(lines)
+        sys.stdout.flush()
+
+    if args.more_folders:
+        comparator = MultiFolderComparator(
+            folders, args.report,
+            recursive=args.recursive,
+            follow_symlinks=not args.no_follow_symlinks,
+            max_depth=args.max_depth,
+            ignore=ignore,
+            compare_content=args.content,
+            workers=args.workers,
+            io_limit=args.io_limit,
+            use_cache=not args.no_cache,
+            incremental_dir=args.incremental,
+            output_root=args.output_root,
+            report_formats=args.report_format or ("txt",),
+            perf_json=args.perf_json,
+            log=log,
+            on_records=on_multi_records)
+        try:
+            result = comparator.run()
+        except KeyboardInterrupt:
+            comparator.cancel()
+            return 2
+        if result is None:
+            return 2
+        different = (result["counts"]["partial"]
+                     or any(result["status_counts"].get(status) for status in DIFFERENT_STATUSES))
+        return 1 if different else 0
+    
+    comparator = FolderComparator(
+        args.folder1, args.folder2, args.report, args.classify,
+        recursive=args.recursive,
+        follow_symlinks=not args.no_follow_symlinks,
+        max_depth=args.max_depth,
+        ignore=ignore,
+        compare_content=args.content,
+        workers=args.workers,
+        io_limit=args.io_limit,
+        use_cache=not args.no_cache,
+        copy_mode=args.copy_mode,
+        copy_workers=args.workers,
+        incremental_dir=args.incremental,
+        remove_stale=not args.keep_stale,
+        output_root=args.output_root,
+        report_formats=args.report_format or ("txt",),
+        sort_chunk=args.sort_chunk,
+        resume=args.resume,
+        progressive=not args.sorted,
+        perf_json=args.perf_json,
+        detect_renames=args.detect_renames,
+        watch=args.watch,
+        poll_interval=args.poll_interval,
+        log=log,
+        on_records=on_records,
+        on_changes=on_changes)
+    try:
+        if args.save_snapshot:
+            return 0 if comparator.save_snapshot(args.save_snapshot, args.snapshot_hashes) is not None else 2
+        result = comparator.run()
+    except KeyboardInterrupt:
+        comparator.cancel()
+        return 2
+    if result is None:
+        return 2
+    if args.watch:
+        sys.stdout.flush()
+        try:
+            comparator.run_watch()
+        except KeyboardInterrupt:
+            comparator.cancel()
+        # 退出码反映监视结束时的状态
+        result = comparator.summary()
+
+    counts = result["counts"]
+    different = (counts["folder1_unique"] or counts["folder2_unique"] or counts["renamed"]
+                 or any(result["status_counts"].get(status) for status in DIFFERENT_STATUSES))
+    return 1 if different else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
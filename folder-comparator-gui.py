@@ -1,224 +1,605 @@
 import os
+import re
 import sys
-import shutil
-from pathlib import Path
+import json
+import time
 import datetime
+import threading
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
 from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                             QLineEdit, QPushButton, QCheckBox, QTextEdit, QTableWidget, 
-                             QTableWidgetItem, QFileDialog, QHeaderView, QAbstractItemView, 
-                             QFrame, QGroupBox, QSplitter, QProgressBar)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
+                             QLineEdit, QPushButton, QCheckBox, QTextEdit, QTableView, 
+                             QFileDialog, QHeaderView, QAbstractItemView, QMenu, 
+                             QFrame, QGroupBox, QSplitter, QProgressBar, QSpinBox,
+                             QComboBox)
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal, QAbstractTableModel, QModelIndex
 from PyQt6.QtGui import QDesktopServices, QColor, QFont, QIcon
 
+from folder_compare_engine import (FolderComparator, MultiFolderComparator, format_size, format_variants, default_cache_path, REPORT_FORMATS,
+                                   STATUS_UNCHECKED, STATUS_SAME, STATUS_SIZE_DIFFERS,
+                                   STATUS_CONTENT_DIFFERS, STATUS_ERROR, STATUS_LABELS,
+                                   DEFAULT_WORKERS, DEFAULT_IO_LIMIT, COPY_MODE_LABELS,
+                                   SNAPSHOT_EXTENSION, PHASE_LABELS, IgnoreRules, parse_age, parse_size)
+
 # ----------------------
 # Worker线程
 # ----------------------
-class FolderCompareThread(QThread):
+class ComparatorThread(QThread):
+    """在后台线程中运行比较器，并把回调转换为 Qt 信号；子类负责创建 self.comparator"""
     update_progress = pyqtSignal(int, int, str)
     log_signal = pyqtSignal(str, str)
-    file_signal = pyqtSignal(dict)
+    files_signal = pyqtSignal(list)
     finished_signal = pyqtSignal(dict)
     
-    def __init__(self, folder1, folder2, save_report=False, classify_files=False):
+    def cancel(self):
+        """请求取消正在进行的比较"""
+        self.comparator.cancel()
+    
+    def toggle_pause(self):
+        """暂停或继续，返回切换后是否处于暂停状态"""
+        if self.comparator.is_paused:
+            self.comparator.resume_run()
+        else:
+            self.comparator.pause()
+        return self.comparator.is_paused
+    
+    def run(self):
+        result = self.comparator.run()
+        if result is not None:
+            self.finished_signal.emit(result)
+            if self.comparator.watch:
+                # 监视到取消为止，线程在此期间保持运行
+                self.comparator.run_watch()
+
+
+class FolderCompareThread(ComparatorThread):
+    """比较两个文件夹"""
+    # 复制进度: 已复制字节, 总字节, 速度（字节/秒）
+    copy_progress = pyqtSignal(float, float, float)
+    # 监视模式下的变化: 受影响的旧结果行, 新的结果行
+    changes_signal = pyqtSignal(list, list)
+    
+    def __init__(self, folder1, folder2, save_report=False, classify_files=False, **options):
         super().__init__()
-        self.folder1 = folder1
-        self.folder2 = folder2
-        self.save_report = save_report
-        self.classify_files = classify_files
-        self.output_dir = None
-        
+        # 非增量模式下输出目录创建在脚本所在目录
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.comparator = FolderComparator(
+            folder1, folder2, save_report, classify_files,
+            output_root=script_dir,
+            log=self.log_signal.emit,
+            progress=self.update_progress.emit,
+            copy_progress=self.copy_progress.emit,
+            on_records=self.files_signal.emit,
+            on_changes=self.changes_signal.emit,
+            **options)
+
+
+class MultiCompareThread(ComparatorThread):
+    """使用 MultiFolderComparator 同时比较多个文件夹"""
+    
+    def __init__(self, folders, save_report=False, **options):
+        super().__init__()
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.comparator = MultiFolderComparator(
+            folders, save_report,
+            output_root=script_dir,
+            log=self.log_signal.emit,
+            progress=self.update_progress.emit,
+            on_records=self.files_signal.emit,
+            **options)
+
+
+class SnapshotSaveThread(ComparatorThread):
+    """扫描文件夹并保存为快照"""
+    
+    def __init__(self, folder, path, with_digests=False, **options):
+        super().__init__()
+        self.path = path
+        self.with_digests = with_digests
+        self.comparator = FolderComparator(
+            folder, None,
+            log=self.log_signal.emit,
+            progress=self.update_progress.emit,
+            **options)
+    
     def run(self):
-        try:
-            # 获取脚本所在目录
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            
-            # 获取文件夹1中的文件列表
-            self.log_signal.emit(f"正在扫描文件夹1: {self.folder1}", "blue")
-            try:
-                files1 = {f.name: f for f in Path(self.folder1).iterdir() if f.is_file()}
-            except Exception as e:
-                self.log_signal.emit(f"❌ 无法访问文件夹1: {e}", "red")
+        self.comparator.save_snapshot(self.path, self.with_digests)
+
+# ----------------------
+# 结果表格模型
+# ----------------------
+class ResultTableModel(QAbstractTableModel):
+    """比较结果模型: 数据按列存放在紧凑数组中，显示文本只为可见行按需生成"""
+    HEADERS = ["文件名", "路径", "大小", "操作"]
+    COLORS = {
+        "folder1_unique": "#4CAF50",  # 绿色
+        "folder2_unique": "#2196F3",  # 蓝色
+        "common": "#757575",  # 灰色
+        "renamed": "#9C27B0",  # 紫色
+        "multi": "#795548",  # 棕色
+    }
+    # 这些类别的每一行对应两侧各一个文件
+    PAIRED_CATEGORIES = ("common", "renamed")
+    
+    STATUS_CODES = (STATUS_UNCHECKED, STATUS_SAME, STATUS_SIZE_DIFFERS,
+                    STATUS_CONTENT_DIFFERS, STATUS_ERROR)
+    
+    def __init__(self, category, parent=None):
+        super().__init__(parent)
+        self.category = category
+        self.color = QColor(self.COLORS.get(category, "#000000"))
+        self.warn_color = QColor(255, 0, 0)
+        self.error_color = QColor(255, 140, 0)
+        self.link_color = QColor("#1565C0")
+        # filtered 为 True 时 order 只包含过滤结果，新追加的行要等下一次过滤才显示；
+        # sort_state 为最近一次排序的 (列, 顺序)，过滤结果按它排序
+        self.filtered = False
+        self.sort_state = None
+        self.clear()
+    
+    def clear(self):
+        """清空所有数据"""
+        self.beginResetModel()
+        self.names = []
+        self.paths1 = []
+        self.paths2 = []
+        self.sizes1 = array("q")
+        self.sizes2 = array("q")
+        # 共有文件的内容状态，存放 STATUS_CODES 中的下标
+        self.statuses = array("B")
+        # 显示行号 -> 数据下标
+        self.order = array("q")
+        self.name_index = NameIndex()
+        # 监视模式下撤下的数据下标（数据列只追加不删除），以及按需建立的 名称 -> 数据下标
+        self.removed = set()
+        self.name_positions = None
+        # 显示顺序是否已按 sort_state 排好；引擎按名称顺序发送时重新启用排序不必重排
+        self.in_order = True
+        self.endResetModel()
+    
+    def track_order(self, names):
+        """追加 names 之前调用: 按名称升序显示时检查新行是否仍保持顺序"""
+        if self.filtered or not self.in_order:
+            return
+        if self.sort_state != (0, Qt.SortOrder.AscendingOrder):
+            self.in_order = False
+            return
+        previous = self.names[self.order[-1]] if self.order else ""
+        for name in names:
+            if name < previous:
+                self.in_order = False
                 return
-            
-            # 获取文件夹2中的文件列表
-            self.log_signal.emit(f"正在扫描文件夹2: {self.folder2}", "blue")
+            previous = name
+    
+    def append_rows(self, infos):
+        """批量追加文件记录，每个批次只通知视图一次"""
+        if not infos:
+            return
+        self.track_order(record.filename for record in infos)
+        first = len(self.order)
+        if not self.filtered:
+            self.beginInsertRows(QModelIndex(), first, first + len(infos) - 1)
+        common = self.category in self.PAIRED_CATEGORIES
+        for record in infos:
+            if not self.filtered:
+                self.order.append(len(self.names))
+            if self.name_positions is not None:
+                self.name_positions[record.filename] = len(self.names)
+            self.names.append(record.filename)
+            if common:
+                self.paths1.append(record.file1.path)
+                self.paths2.append(record.file2.path)
+                self.sizes1.append(record.file1.size)
+                self.sizes2.append(record.file2.size)
+                self.statuses.append(self.STATUS_CODES.index(record.status or STATUS_UNCHECKED))
+            else:
+                file = record.file1 or record.file2
+                self.paths1.append(file.path)
+                self.sizes1.append(file.size)
+        if not self.filtered:
+            self.endInsertRows()
+    
+    def set_rows(self, count, rows, filtered):
+        """显示过滤线程算出的行（数据下标，已排序）；count 为计算时的数据行数，
+        未过滤时补上计算期间新追加的行"""
+        self.beginResetModel()
+        self.order = rows
+        # 过滤线程已按 sort_state 排序，计算期间新追加的行则没有
+        self.in_order = self.sort_state is not None and (filtered or count == len(self.names))
+        if not filtered:
+            self.order.extend(range(count, len(self.names)))
+        if self.removed:
+            self.order = array("q", (i for i in self.order if i not in self.removed))
+        self.filtered = filtered
+        self.endResetModel()
+    
+    def live_count(self):
+        """数据行数（不含监视模式下已撤下的行）"""
+        return len(self.names) - len(self.removed)
+    
+    def positions(self):
+        """名称 -> 数据下标（不含已撤下的行），第一次需要时才建立"""
+        if self.name_positions is None:
+            self.name_positions = {name: i for i, name in enumerate(self.names) if i not in self.removed}
+        return self.name_positions
+    
+    def update_rows(self, removed, records):
+        """监视模式: 撤下名称在 removed 中的行，records 中已有同名行的原地更新，其余追加"""
+        positions = self.positions()
+        for name in removed:
+            i = positions.pop(name, None)
+            if i is None:
+                continue
+            self.removed.add(i)
             try:
-                files2 = {f.name: f for f in Path(self.folder2).iterdir() if f.is_file()}
-            except Exception as e:
-                self.log_signal.emit(f"❌ 无法访问文件夹2: {e}", "red")
+                row = self.order.index(i)
+            except ValueError:
+                continue
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.order[row]
+            self.endRemoveRows()
+        
+        added = []
+        common = self.category in self.PAIRED_CATEGORIES
+        for record in records:
+            i = positions.get(record.filename)
+            if i is None:
+                added.append(record)
+                continue
+            if common:
+                self.paths1[i] = record.file1.path
+                self.paths2[i] = record.file2.path
+                self.sizes1[i] = record.file1.size
+                self.sizes2[i] = record.file2.size
+                self.statuses[i] = self.STATUS_CODES.index(record.status or STATUS_UNCHECKED)
+            else:
+                file = record.file1 or record.file2
+                self.paths1[i] = file.path
+                self.sizes1[i] = file.size
+            if self.sort_state is not None and self.sort_state[0] != 0:
+                # 名称不变，但按路径或大小排序时原地更新可能打乱顺序
+                self.in_order = False
+            try:
+                row = self.order.index(i)
+            except ValueError:
+                continue
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+        self.append_rows(added)
+    
+    def file_path(self, row):
+        """返回显示行对应的文件路径（共有文件取文件夹1中的路径）"""
+        if 0 <= row < len(self.order):
+            return self.paths1[self.order[row]]
+        return ""
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+    
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        i = self.order[index.row()]
+        column = index.column()
+        common = self.category in self.PAIRED_CATEGORIES
+        
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return self.names[i]
+            if column == 1:
+                if common:
+                    return f"文件夹1: {self.paths1[i]}\n文件夹2: {self.paths2[i]}"
+                return self.paths1[i]
+            if column == 2:
+                if common:
+                    size1, size2 = self.sizes1[i], self.sizes2[i]
+                    status = self.STATUS_CODES[self.statuses[i]]
+                    if status == STATUS_SIZE_DIFFERS:
+                        return f"⚠ 大小不同\n{format_size(size1)} vs {format_size(size2)}"
+                    if status in (STATUS_CONTENT_DIFFERS, STATUS_ERROR):
+                        return f"⚠ {STATUS_LABELS[status]}\n{format_size(size1)}"
+                    return f"{STATUS_LABELS[status]}: {format_size(size1)}"
+                return format_size(self.sizes1[i])
+            if column == 3:
+                return "打开位置" if self.paths1[i] else ""
+        elif role == Qt.ItemDataRole.ForegroundRole:
+            if column == 2 and common:
+                status = self.STATUS_CODES[self.statuses[i]]
+                if status in (STATUS_SIZE_DIFFERS, STATUS_CONTENT_DIFFERS):
+                    return self.warn_color
+                if status == STATUS_ERROR:
+                    return self.error_color
+            if column == 3:
+                return self.link_color
+            return self.color
+        elif role == Qt.ItemDataRole.ToolTipRole:
+            if column == 1:
+                return self.data(index)
+            if column == 3:
+                return "双击或右键打开文件所在位置"
+        return None
+    
+    def columns(self):
+        """返回可排序的列（文件名, 路径, 大小）；clear() 会换成新的对象，已取得的引用不受影响"""
+        return self.names, self.paths1, self.sizes1
+    
+    @staticmethod
+    def sorted_rows(rows, columns, column, order):
+        """按 columns 中的第 column 列排序数据下标（过滤线程中也会调用）"""
+        return array("q", sorted(rows, key=columns[column].__getitem__,
+                                 reverse=order == Qt.SortOrder.DescendingOrder))
+    
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """在模型自身的数组上排序当前显示的行，只重排显示顺序"""
+        if column > 2:
+            return
+        if (column, order) == self.sort_state and self.in_order:
+            return
+        self.sort_state = (column, order)
+        self.layoutAboutToBeChanged.emit()
+        self.order = self.sorted_rows(self.order, self.columns(), column, order)
+        self.in_order = True
+        self.layoutChanged.emit()
+
+
+class MultiResultTableModel(ResultTableModel):
+    """多文件夹比较结果模型: 每行一个名称，第二列为各文件夹中的版本（见 format_variants）"""
+    HEADERS = ["文件名", "各文件夹中的版本", "大小", "操作"]
+    
+    def __init__(self, category, parent=None):
+        super().__init__(category, parent)
+        self.mono_font = QFont("Consolas")
+        self.mono_font.setStyleHint(QFont.StyleHint.Monospace)
+    
+    def clear(self):
+        super().clear()
+        # 每行一个字符串，每个文件夹一个字符
+        self.variants = []
+    
+    def append_rows(self, infos):
+        """批量追加 MultiRecord，每个批次只通知视图一次"""
+        if not infos:
+            return
+        self.track_order(record.filename for record in infos)
+        first = len(self.order)
+        if not self.filtered:
+            self.beginInsertRows(QModelIndex(), first, first + len(infos) - 1)
+        for record in infos:
+            if not self.filtered:
+                self.order.append(len(self.names))
+            # 路径和大小取第一个包含该文件的文件夹中的版本
+            file = next(file for file in record.files if file is not None)
+            self.names.append(record.filename)
+            self.paths1.append(file.path)
+            self.sizes1.append(file.size)
+            self.variants.append(format_variants(record.variants))
+            self.statuses.append(self.STATUS_CODES.index(record.status or STATUS_UNCHECKED))
+        if not self.filtered:
+            self.endInsertRows()
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        i = self.order[index.row()]
+        column = index.column()
+        status = self.STATUS_CODES[self.statuses[i]]
+        
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return self.names[i]
+            if column == 1:
+                return self.variants[i]
+            if column == 2:
+                if status in (STATUS_SIZE_DIFFERS, STATUS_CONTENT_DIFFERS, STATUS_ERROR):
+                    return f"⚠ {STATUS_LABELS[status]}"
+                return format_size(self.sizes1[i])
+            if column == 3:
+                return "打开位置"
+        elif role == Qt.ItemDataRole.ForegroundRole:
+            if column == 2:
+                if status in (STATUS_SIZE_DIFFERS, STATUS_CONTENT_DIFFERS):
+                    return self.warn_color
+                if status == STATUS_ERROR:
+                    return self.error_color
+            if column == 3:
+                return self.link_color
+            return self.color
+        elif role == Qt.ItemDataRole.FontRole and column == 1:
+            return self.mono_font
+        elif role == Qt.ItemDataRole.ToolTipRole:
+            if column == 1:
+                return "每个文件夹一个字符: . 不存在, ! 无法读取, 字母相同表示版本相同"
+            if column == 3:
+                return "双击或右键打开第一个包含该文件的文件夹"
+        return None
+    
+    def columns(self):
+        """可排序的列为 (文件名, 各文件夹中的版本, 大小)"""
+        return self.names, self.variants, self.sizes1
+
+
+# ----------------------
+# 结果过滤
+# ----------------------
+FILTER_MODES = {"substring": "包含", "glob": "通配符", "regex": "正则"}
+# 输入停止后等待多久再开始过滤（毫秒）
+FILTER_DEBOUNCE_MS = 150
+
+
+def glob_to_regex(pattern):
+    """把通配符（* ? [...] [!...]）转换为正则，规则与 fnmatch 相同，* 也匹配路径分隔符"""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "*":
+            parts.append(".*")
+        elif c == "?":
+            parts.append(".")
+        elif c == "[" and pattern.find("]", i + 1) > i + 1:
+            end = pattern.find("]", i + 1)
+            body = pattern[i + 1:end].replace("\\", "\\\\").replace("[", "\\[")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            elif body.startswith("^"):
+                body = "\\" + body
+            parts.append(f"[{body}]")
+            i = end
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return "".join(parts)
+
+
+class NameIndex:
+    """结果表格的名称索引: 大小写折叠后的名称和扩展名编号两列
+    
+    由过滤线程按需补齐，追加结果时主线程不做额外计算。过滤时把前 count 个名称
+    拼接成一整块以换行分隔的文本（按行数缓存），子串在这块文本上由 str.find 扫描，
+    再用行首偏移二分查找得到行号，不必对每一行执行 Python 代码。
+    """
+    
+    def __init__(self):
+        self.folded = []
+        self.ext_ids = array("I")
+        self.ext_codes = {}
+        self._text = None
+        # 上一次过滤尚未结束时可能有两个线程同时补齐
+        self.lock = threading.Lock()
+    
+    def sync(self, names, count):
+        """补齐前 count 个名称的索引"""
+        with self.lock:
+            new = names[len(self.folded):count]
+            if not new:
                 return
-            
-            # 计算文件差异
-            self.log_signal.emit("正在比较文件...", "blue")
-            common_files = sorted(files1.keys() & files2.keys())
-            unique_in_folder1 = sorted(files1.keys() - files2.keys())
-            unique_in_folder2 = sorted(files2.keys() - files1.keys())
-            
-            # 发送文件信息到主界面
-            total_files = len(common_files) + len(unique_in_folder1) + len(unique_in_folder2)
-            processed = 0
-            
-            # 发送文件夹1独有的文件
-            for filename in unique_in_folder1:
-                processed += 1
-                self.update_progress.emit(processed, total_files, "正在处理文件夹1独有文件...")
-                self.file_signal.emit({
-                    "filename": filename,
-                    "category": "folder1_unique",
-                    "path": str(files1[filename]),
-                    "size": os.path.getsize(files1[filename]) if os.path.exists(files1[filename]) else 0
-                })
-            
-            # 发送文件夹2独有的文件
-            for filename in unique_in_folder2:
-                processed += 1
-                self.update_progress.emit(processed, total_files, "正在处理文件夹2独有文件...")
-                self.file_signal.emit({
-                    "filename": filename,
-                    "category": "folder2_unique",
-                    "path": str(files2[filename]),
-                    "size": os.path.getsize(files2[filename]) if os.path.exists(files2[filename]) else 0
-                })
-            
-            # 发送共有文件
-            for filename in common_files:
-                processed += 1
-                self.update_progress.emit(processed, total_files, "正在处理共有文件...")
-                self.file_signal.emit({
-                    "filename": filename,
-                    "category": "common",
-                    "path1": str(files1[filename]),
-                    "path2": str(files2[filename]),
-                    "size1": os.path.getsize(files1[filename]) if os.path.exists(files1[filename]) else 0,
-                    "size2": os.path.getsize(files2[filename]) if os.path.exists(files2[filename]) else 0
-                })
-            
-            # 创建输出目录（如果需要）
-            result = {
-                "folder1": self.folder1,
-                "folder2": self.folder2,
-                "common_files": common_files,
-                "unique_in_folder1": unique_in_folder1,
-                "unique_in_folder2": unique_in_folder2,
-                "files1": files1,
-                "files2": files2,
-                "output_dir": None
-            }
-            
-            if self.save_report or self.classify_files:
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                self.output_dir = os.path.join(script_dir, f"文件夹比较分析_{timestamp}")
-                result["output_dir"] = self.output_dir
-                
-                try:
-                    os.makedirs(self.output_dir, exist_ok=True)
-                    
-                    # 保存报告
-                    if self.save_report:
-                        report_path = os.path.join(self.output_dir, f"文件夹比较报告_{timestamp}.txt")
-                        self.save_report_to_file(result, report_path)
-                        self.log_signal.emit(f"✅ 报告已保存: {report_path}", "green")
-                    
-                    # 分类复制文件
-                    if self.classify_files:
-                        self.copy_and_classify_files(result, self.output_dir)
-                        self.log_signal.emit(f"✅ 文件分类复制完成!", "green")
-                        
-                except Exception as e:
-                    self.log_signal.emit(f"❌ 创建输出目录失败: {e}", "red")
-            
-            self.log_signal.emit(f"✅ 比较完成! 共处理 {total_files} 个文件", "green")
-            self.finished_signal.emit(result)
-            
-        except Exception as e:
-            self.log_signal.emit(f"❌ 比较过程中出现错误: {e}", "red")
+            codes = self.ext_codes
+            self.folded.extend(name.casefold() for name in new)
+            self.ext_ids.extend(codes.setdefault(os.path.splitext(name)[1][1:].casefold(), len(codes))
+                                for name in new)
     
-    def save_report_to_file(self, result, report_path):
-        """保存报告到文件"""
-        try:
-            with open(report_path, 'w', encoding='utf-8') as f:
-                f.write("文件夹比较结果报告\n")
-                f.write("=" * 60 + "\n")
-                f.write(f"生成时间: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"文件夹1: {result['folder1']}\n")
-                f.write(f"文件夹2: {result['folder2']}\n")
-                f.write("=" * 60 + "\n\n")
-                
-                f.write("只在文件夹1中的文件:\n")
-                if result['unique_in_folder1']:
-                    for file in result['unique_in_folder1']:
-                        f.write(f"  {file}\n")
-                else:
-                    f.write("  (无)\n")
-                
-                f.write("\n只在文件夹2中的文件:\n")
-                if result['unique_in_folder2']:
-                    for file in result['unique_in_folder2']:
-                        f.write(f"  {file}\n")
-                else:
-                    f.write("  (无)\n")
-                
-                f.write("\n两个文件夹都有的文件:\n")
-                if result['common_files']:
-                    for file in result['common_files']:
-                        f.write(f"  {file}\n")
+    def text(self, count):
+        """返回 (前 count 个名称拼接成的文本, 各行起始偏移)"""
+        with self.lock:
+            cached = self._text
+            if cached is None or cached[0] != count:
+                names = self.folded[:count]
+                starts = array("q", accumulate((len(name) + 1 for name in names), initial=0))
+                cached = self._text = (count, "\n".join(names) + "\n", starts)
+            return cached[1], cached[2]
+    
+    def find_rows(self, needle, count, limit):
+        """返回名称中包含 needle 的行号（升序）；超过 limit 行时返回 None，此时逐行检查更快"""
+        text, starts = self.text(count)
+        rows = []
+        pos = text.find(needle)
+        while pos >= 0:
+            if len(rows) >= limit:
+                return None
+            row = bisect_right(starts, pos) - 1
+            rows.append(row)
+            pos = text.find(needle, starts[row + 1])
+        return rows
+
+
+class ResultFilter:
+    """过滤条件: 名称（包含 / 通配符 / 正则，不区分大小写）、扩展名和大小范围，各条件同时满足"""
+    # 在整块文本中查找的命中行数超过总行数的这个比例时，改为逐行检查
+    DENSE_RATIO = 1 / 32
+    
+    def __init__(self, text="", mode="substring", extensions="", min_size="", max_size=""):
+        self.text = text.strip()
+        self.mode = mode
+        self.extensions = {ext.lstrip(".").casefold() for ext in re.split(r"[\s,;]+", extensions) if ext}
+        self.min_size = parse_size(min_size)
+        self.max_size = parse_size(max_size)
+        self.needle = self.text.casefold()
+        self.name_regex = None
+        if self.text and mode == "glob":
+            # 通配符匹配完整的相对路径；先用其中最长的一段普通文字在整块文本中查找候选行
+            self.name_regex = re.compile(glob_to_regex(self.needle) + "\\Z", re.DOTALL)
+            self.needle = max(re.split(r"\*|\?|\[[^\]]*\]", self.needle), key=len)
+        elif self.text and mode == "regex":
+            self.name_regex = re.compile(self.text, re.IGNORECASE)
+    
+    @property
+    def active(self):
+        return bool(self.text or self.extensions or self.min_size is not None or self.max_size is not None)
+    
+    def rows(self, columns, index, count):
+        """返回前 count 行中满足条件的数据下标（升序）；columns 为模型的 (文件名, 路径, 大小) 列"""
+        if not self.active:
+            return array("q", range(count))
+        index.sync(columns[0], count)
+        rows = None
+        if self.extensions:
+            wanted = {index.ext_codes[ext] for ext in self.extensions if ext in index.ext_codes}
+            ext_ids = index.ext_ids
+            rows = [i for i in range(count) if ext_ids[i] in wanted]
+        if self.min_size is not None or self.max_size is not None:
+            low = self.min_size if self.min_size is not None else 0
+            high = self.max_size if self.max_size is not None else float("inf")
+            sizes = columns[2]
+            rows = [i for i in (range(count) if rows is None else rows) if low <= sizes[i] <= high]
+        if self.text:
+            rows = self.match_names(columns[0], index, count, rows)
+        return array("q", rows)
+    
+    def match_names(self, names, index, count, rows):
+        """在 rows（None 表示全部）中按名称过滤"""
+        if self.mode == "regex":
+            # 用户的正则可能跨行匹配，只能逐个名称检查
+            search = self.name_regex.search
+            return [i for i in (range(count) if rows is None else rows) if search(names[i])]
+        candidates = range(count) if rows is None else rows
+        if self.needle and (rows is None or len(rows) * 8 >= count):
+            # 其他条件没有筛掉大部分行时，先在整块文本中查找
+            found = index.find_rows(self.needle, count, max(1, int(count * self.DENSE_RATIO)))
+            if found is not None:
+                if rows is None:
+                    candidates = found
                 else:
-                    f.write("  (无)\n")
-                
-                f.write("\n" + "=" * 60 + "\n")
-                f.write("统计:\n")
-                f.write(f"文件夹1中的文件总数: {len(result['unique_in_folder1']) + len(result['common_files'])}\n")
-                f.write(f"文件夹2中的文件总数: {len(result['unique_in_folder2']) + len(result['common_files'])}\n")
-                f.write(f"共同文件数: {len(result['common_files'])}\n")
-                f.write(f"差异文件数: {len(result['unique_in_folder1']) + len(result['unique_in_folder2'])}\n")
-                
-            return True
-        except Exception as e:
-            self.log_signal.emit(f"❌ 保存报告失败: {e}", "red")
-            return False
+                    wanted = set(rows)
+                    candidates = [i for i in found if i in wanted]
+                if self.name_regex is None:
+                    return candidates
+        folded = index.folded
+        if self.name_regex is not None:
+            match = self.name_regex.match
+            return [i for i in candidates if match(folded[i])]
+        needle = self.needle
+        return [i for i in candidates if needle in folded[i]]
+
+
+class FilterThread(QThread):
+    """在后台线程中为每个表格计算过滤结果并按当前排序方式排序"""
+    result_signal = pyqtSignal(int, dict)
     
-    def copy_and_classify_files(self, result, output_dir):
-        """将文件分类复制到新目录"""
-        try:
-            # 创建子目录
-            dir1_unique = os.path.join(output_dir, "文件夹1独有的文件")
-            dir2_unique = os.path.join(output_dir, "文件夹2独有的文件")
-            dir_common = os.path.join(output_dir, "共有的文件")
-            
-            for dir_path in [dir1_unique, dir2_unique, dir_common]:
-                os.makedirs(dir_path, exist_ok=True)
-            
-            # 复制文件夹1独有的文件
-            for filename in result['unique_in_folder1']:
-                src = result['files1'][filename]
-                dst = os.path.join(dir1_unique, filename)
-                try:
-                    shutil.copy2(src, dst)
-                except Exception as e:
-                    self.log_signal.emit(f"⚠ 复制失败 {filename}: {e}", "orange")
-            
-            # 复制文件夹2独有的文件
-            for filename in result['unique_in_folder2']:
-                src = result['files2'][filename]
-                dst = os.path.join(dir2_unique, filename)
-                try:
-                    shutil.copy2(src, dst)
-                except Exception as e:
-                    self.log_signal.emit(f"⚠ 复制失败 {filename}: {e}", "orange")
-            
-            # 复制共有的文件（默认复制文件夹1中的版本）
-            for filename in result['common_files']:
-                src = result['files1'][filename]  # 使用文件夹1中的文件
-                dst = os.path.join(dir_common, filename)
-                try:
-                    shutil.copy2(src, dst)
-                except Exception as e:
-                    self.log_signal.emit(f"⚠ 复制失败 {filename}: {e}", "orange")
-            
-            return True
-        except Exception as e:
-            self.log_signal.emit(f"❌ 文件分类复制失败: {e}", "red")
-            return False
+    def __init__(self, generation, result_filter, models):
+        super().__init__()
+        self.generation = generation
+        self.result_filter = result_filter
+        # (类别, 列, 名称索引, 行数, 排序方式) 都在主线程中取得，之后追加的行不参与本次过滤
+        self.jobs = [(category, model.columns(), model.name_index, len(model.names), model.sort_state)
+                     for category, model in models.items()]
+    
+    def run(self):
+        results = {}
+        for category, columns, index, count, sort_state in self.jobs:
+            rows = self.result_filter.rows(columns, index, count)
+            if sort_state is not None:
+                rows = ResultTableModel.sorted_rows(rows, columns, *sort_state)
+            results[category] = (count, rows)
+        self.result_signal.emit(self.generation, results)
+
 
 # ----------------------
 # GUI界面
@@ -264,6 +645,10 @@ class FolderCompareGUI(QWidget):
         self.browse_btn1 = QPushButton("浏览")
         self.browse_btn1.clicked.connect(lambda: self.browse_folder(1))
         folder1_layout.addWidget(self.browse_btn1, 1)
+        self.snapshot_btn1 = QPushButton("快照")
+        self.snapshot_btn1.setToolTip("选择之前保存的快照文件代替文件夹1")
+        self.snapshot_btn1.clicked.connect(lambda: self.browse_snapshot(1))
+        folder1_layout.addWidget(self.snapshot_btn1, 1)
         control_layout.addLayout(folder1_layout)
         
         # 文件夹2输入
@@ -275,30 +660,202 @@ class FolderCompareGUI(QWidget):
         self.browse_btn2 = QPushButton("浏览")
         self.browse_btn2.clicked.connect(lambda: self.browse_folder(2))
         folder2_layout.addWidget(self.browse_btn2, 1)
+        self.snapshot_btn2 = QPushButton("快照")
+        self.snapshot_btn2.setToolTip("选择之前保存的快照文件代替文件夹2")
+        self.snapshot_btn2.clicked.connect(lambda: self.browse_snapshot(2))
+        folder2_layout.addWidget(self.snapshot_btn2, 1)
         control_layout.addLayout(folder2_layout)
         
+        # 更多文件夹: 填写后同时比较所有文件夹
+        more_layout = QHBoxLayout()
+        more_layout.addWidget(QLabel("更多文件夹:"))
+        self.more_folders_edit = QLineEdit()
+        self.more_folders_edit.setPlaceholderText("可选: 更多文件夹或快照路径，用 ; 分隔，填写后同时比较所有文件夹")
+        self.more_folders_edit.setClearButtonEnabled(True)
+        self.more_folders_edit.textChanged.connect(self.update_tables)
+        more_layout.addWidget(self.more_folders_edit, 4)
+        self.add_folder_btn = QPushButton("添加")
+        self.add_folder_btn.clicked.connect(self.add_more_folder)
+        more_layout.addWidget(self.add_folder_btn, 2)
+        control_layout.addLayout(more_layout)
+        
         # 选项
         options_layout = QHBoxLayout()
         self.save_report_cb = QCheckBox("保存分析报告")
         self.save_report_cb.setChecked(True)
+        self.report_format_combo = QComboBox()
+        self.report_format_combo.addItem("TXT", ("txt",))
+        self.report_format_combo.addItem("CSV", ("csv",))
+        self.report_format_combo.addItem("JSONL", ("jsonl",))
+        self.report_format_combo.addItem("TXT + CSV + JSONL", REPORT_FORMATS)
+        self.report_format_combo.setToolTip("报告格式: CSV 和 JSONL 包含每个文件的大小、修改时间和内容状态")
+        self.save_report_cb.toggled.connect(self.report_format_combo.setEnabled)
         self.classify_files_cb = QCheckBox("分类复制文件")
         self.classify_files_cb.setChecked(True)
+        self.compare_content_cb = QCheckBox("比较文件内容")
+        self.compare_content_cb.setToolTip("对同名文件依次比较大小、首尾块哈希和完整内容")
+        self.compare_content_cb.setChecked(False)
+        self.recursive_cb = QCheckBox("包含子文件夹")
+        self.recursive_cb.setChecked(False)
+        self.follow_symlinks_cb = QCheckBox("跟随符号链接")
+        self.follow_symlinks_cb.setChecked(True)
+        self.max_depth_spin = QSpinBox()
+        self.max_depth_spin.setRange(0, 999)
+        self.max_depth_spin.setSpecialValueText("不限")
+        self.max_depth_spin.setToolTip("子文件夹的最大深度，0 表示不限")
+        self.max_depth_spin.setEnabled(False)
+        self.recursive_cb.toggled.connect(self.max_depth_spin.setEnabled)
+        self.detect_renames_cb = QCheckBox("检测重命名/移动")
+        self.detect_renames_cb.setToolTip("在两侧独有的文件中按大小和哈希找出内容相同的文件，"
+                                          "单独列出，分类复制时只复制一份")
+        self.detect_renames_cb.setChecked(False)
+        self.watch_cb = QCheckBox("完成后监视变化")
+        self.watch_cb.setToolTip("比较完成后持续监视两个文件夹（Linux 上使用 inotify，其他系统定时轮询），"
+                                 "文件变化时只更新受影响的结果行，无需重新比较；点击“停止监视”结束")
+        self.watch_cb.setChecked(False)
         options_layout.addWidget(self.save_report_cb)
+        options_layout.addWidget(self.report_format_combo)
         options_layout.addWidget(self.classify_files_cb)
+        options_layout.addWidget(self.compare_content_cb)
+        options_layout.addWidget(self.detect_renames_cb)
+        options_layout.addWidget(self.watch_cb)
+        options_layout.addWidget(self.recursive_cb)
+        options_layout.addWidget(self.follow_symlinks_cb)
+        options_layout.addWidget(QLabel("最大深度:"))
+        options_layout.addWidget(self.max_depth_spin)
         options_layout.addStretch()
         control_layout.addLayout(options_layout)
         
+        # 忽略规则: 扫描时直接跳过，被忽略的文件夹不会进入
+        ignore_layout = QHBoxLayout()
+        self.ignore_edit = QLineEdit()
+        self.ignore_edit.setPlaceholderText("忽略规则（.gitignore 格式，用 ; 分隔），如 *.tmp; node_modules/; !keep.log")
+        self.ignore_edit.setClearButtonEnabled(True)
+        self.ignore_file_edit = QLineEdit()
+        self.ignore_file_edit.setPlaceholderText("忽略文件（可留空）")
+        self.ignore_file_btn = QPushButton("浏览")
+        self.ignore_file_btn.clicked.connect(self.browse_ignore_file)
+        self.min_size_edit = QLineEdit()
+        self.min_size_edit.setPlaceholderText("最小")
+        self.min_size_edit.setToolTip("忽略小于此大小的文件，如 10K、1.5M")
+        self.min_size_edit.setMaximumWidth(70)
+        self.max_size_edit = QLineEdit()
+        self.max_size_edit.setPlaceholderText("最大")
+        self.max_size_edit.setToolTip("忽略大于此大小的文件，如 500M、2G")
+        self.max_size_edit.setMaximumWidth(70)
+        self.newer_than_edit = QLineEdit()
+        self.newer_than_edit.setPlaceholderText("如 7d")
+        self.newer_than_edit.setToolTip("只比较在此时间内修改过的文件，如 12h、7d、2w，不带单位按天")
+        self.newer_than_edit.setMaximumWidth(70)
+        self.older_than_edit = QLineEdit()
+        self.older_than_edit.setPlaceholderText("如 30d")
+        self.older_than_edit.setToolTip("只比较在此时间之前修改的文件，如 2w、30d，不带单位按天")
+        self.older_than_edit.setMaximumWidth(70)
+        ignore_layout.addWidget(QLabel("忽略:"))
+        ignore_layout.addWidget(self.ignore_edit, 4)
+        ignore_layout.addWidget(self.ignore_file_edit, 2)
+        ignore_layout.addWidget(self.ignore_file_btn)
+        ignore_layout.addWidget(QLabel("大小:"))
+        ignore_layout.addWidget(self.min_size_edit)
+        ignore_layout.addWidget(QLabel("-"))
+        ignore_layout.addWidget(self.max_size_edit)
+        ignore_layout.addWidget(QLabel("修改于最近:"))
+        ignore_layout.addWidget(self.newer_than_edit)
+        ignore_layout.addWidget(QLabel("早于:"))
+        ignore_layout.addWidget(self.older_than_edit)
+        control_layout.addLayout(ignore_layout)
+        
+        # 增量输出
+        incremental_layout = QHBoxLayout()
+        self.incremental_cb = QCheckBox("增量输出到:")
+        self.incremental_cb.setToolTip("输出到固定目录，只复制新增或变化的文件")
+        self.incremental_dir_edit = QLineEdit()
+        self.incremental_dir_edit.setPlaceholderText("固定输出目录，留空则使用程序目录下的 文件夹比较分析_增量")
+        self.incremental_dir_edit.setEnabled(False)
+        self.remove_stale_cb = QCheckBox("删除已不存在的文件")
+        self.remove_stale_cb.setToolTip("不勾选时只将这些文件记录到 已移除的文件.txt")
+        self.remove_stale_cb.setChecked(True)
+        self.remove_stale_cb.setEnabled(False)
+        self.incremental_cb.toggled.connect(self.incremental_dir_edit.setEnabled)
+        self.incremental_cb.toggled.connect(self.remove_stale_cb.setEnabled)
+        incremental_layout.addWidget(self.incremental_cb)
+        incremental_layout.addWidget(self.incremental_dir_edit, 4)
+        incremental_layout.addWidget(self.remove_stale_cb)
+        control_layout.addLayout(incremental_layout)
+        
+        # 性能选项
+        perf_layout = QHBoxLayout()
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 256)
+        self.workers_spin.setValue(DEFAULT_WORKERS)
+        self.workers_spin.setToolTip("内容比较和分类复制使用的工作线程数")
+        self.io_limit_spin = QSpinBox()
+        self.io_limit_spin.setRange(1, 256)
+        self.io_limit_spin.setValue(DEFAULT_IO_LIMIT)
+        self.io_limit_spin.setToolTip("每个文件夹同时读取的文件数上限，机械硬盘和网络共享可调小")
+        perf_layout.addWidget(QLabel("工作线程:"))
+        perf_layout.addWidget(self.workers_spin)
+        perf_layout.addWidget(QLabel("每个文件夹并发读取:"))
+        perf_layout.addWidget(self.io_limit_spin)
+        self.sort_chunk_spin = QSpinBox()
+        self.sort_chunk_spin.setRange(0, 10000)
+        self.sort_chunk_spin.setSpecialValueText("关闭")
+        self.sort_chunk_spin.setSuffix(" 万条")
+        self.sort_chunk_spin.setToolTip("流式归并模式: 按名称外部排序后边读边比较，每侧内存中最多保留这么多条记录，"
+                                        "适合超大文件夹；0 表示关闭")
+        perf_layout.addWidget(QLabel("外部排序:"))
+        perf_layout.addWidget(self.sort_chunk_spin)
+        self.use_cache_cb = QCheckBox("使用哈希缓存")
+        self.use_cache_cb.setToolTip(f"在 {default_cache_path()} 中缓存文件哈希，未修改的文件再次比较时无需重新读取")
+        self.use_cache_cb.setChecked(True)
+        perf_layout.addWidget(self.use_cache_cb)
+        self.copy_mode_combo = QComboBox()
+        for mode, label in COPY_MODE_LABELS.items():
+            self.copy_mode_combo.addItem(label, mode)
+        self.copy_mode_combo.setToolTip("分类复制方式: 硬链接和符号链接不复制数据，只引用源文件")
+        perf_layout.addWidget(QLabel("分类方式:"))
+        perf_layout.addWidget(self.copy_mode_combo)
+        perf_layout.addStretch()
+        control_layout.addLayout(perf_layout)
+        
         # 按钮和进度条
         button_layout = QHBoxLayout()
         self.start_btn = QPushButton("开始比较")
         self.start_btn.clicked.connect(self.start_comparison)
         button_layout.addWidget(self.start_btn)
         
+        self.resume_cb = QCheckBox("从中断处继续")
+        self.resume_cb.setToolTip("相同的文件夹和选项上次被取消或中断时，沿用已比较和已复制的结果继续运行")
+        button_layout.addWidget(self.resume_cb)
+        
+        self.pause_btn = QPushButton("暂停")
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.pause_btn.setEnabled(False)
+        button_layout.addWidget(self.pause_btn)
+        
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.setToolTip("停止当前运行；比较内容和分类复制的进度会保存到检查点")
+        self.cancel_btn.clicked.connect(self.cancel_run)
+        self.cancel_btn.setEnabled(False)
+        button_layout.addWidget(self.cancel_btn)
+        
+        self.save_snapshot_btn = QPushButton("保存文件夹1快照")
+        self.save_snapshot_btn.setToolTip("把文件夹1的文件列表保存为快照，之后可代替任意一侧文件夹参与比较；"
+                                          "勾选“比较文件内容”时同时保存文件哈希")
+        self.save_snapshot_btn.clicked.connect(self.save_snapshot)
+        button_layout.addWidget(self.save_snapshot_btn)
+        
         self.open_dir_btn = QPushButton("打开生成目录")
         self.open_dir_btn.clicked.connect(self.open_output_dir)
         self.open_dir_btn.setEnabled(False)
         button_layout.addWidget(self.open_dir_btn)
         
+        self.export_perf_btn = QPushButton("导出性能数据")
+        self.export_perf_btn.setToolTip("把上一次比较的各阶段耗时、吞吐量、系统调用次数和峰值内存保存为 JSON")
+        self.export_perf_btn.clicked.connect(self.export_perf)
+        self.export_perf_btn.setEnabled(False)
+        button_layout.addWidget(self.export_perf_btn)
+        
         button_layout.addStretch()
         
         self.progress = QProgressBar()
@@ -321,15 +878,65 @@ class FolderCompareGUI(QWidget):
         main_layout.addWidget(control_frame)
         
         # -------------------
-        # 表格区域 - 使用QSplitter分割三个区域
+        # 过滤栏: 输入停止 FILTER_DEBOUNCE_MS 毫秒后在后台线程中过滤所有表格
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("过滤:"))
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("文件名（不区分大小写）")
+        self.filter_edit.setClearButtonEnabled(True)
+        filter_layout.addWidget(self.filter_edit, 3)
+        self.filter_mode_combo = QComboBox()
+        for mode, label in FILTER_MODES.items():
+            self.filter_mode_combo.addItem(label, mode)
+        self.filter_mode_combo.setToolTip("包含: 名称中包含输入的文字; 通配符: 匹配完整相对路径，如 *.jpg、report_??.txt; "
+                                          "正则: Python 正则表达式")
+        filter_layout.addWidget(self.filter_mode_combo)
+        self.filter_ext_edit = QLineEdit()
+        self.filter_ext_edit.setPlaceholderText("扩展名，如 jpg png")
+        self.filter_ext_edit.setClearButtonEnabled(True)
+        filter_layout.addWidget(self.filter_ext_edit, 1)
+        filter_layout.addWidget(QLabel("大小:"))
+        self.filter_min_size_edit = QLineEdit()
+        self.filter_min_size_edit.setPlaceholderText("最小，如 10K")
+        filter_layout.addWidget(self.filter_min_size_edit, 1)
+        filter_layout.addWidget(QLabel("-"))
+        self.filter_max_size_edit = QLineEdit()
+        self.filter_max_size_edit.setPlaceholderText("最大，如 1.5G")
+        filter_layout.addWidget(self.filter_max_size_edit, 1)
+        self.filter_status_label = QLabel("")
+        filter_layout.addWidget(self.filter_status_label, 1)
+        main_layout.addLayout(filter_layout)
+        
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(FILTER_DEBOUNCE_MS)
+        self.filter_timer.timeout.connect(self.apply_filter)
+        for edit in (self.filter_edit, self.filter_ext_edit, self.filter_min_size_edit, self.filter_max_size_edit):
+            edit.textChanged.connect(self.filter_timer.start)
+        self.filter_mode_combo.currentIndexChanged.connect(self.filter_timer.start)
+        # 每次过滤递增，只应用最新一次过滤的结果
+        self.filter_generation = 0
+        self.active_filter = None
+        # 仍在运行的过滤线程，关闭窗口时等待它们结束
+        self.filter_threads = set()
+        # 比较已完成、后台线程正在监视文件变化
+        self.watching = False
+        
+        # -------------------
+        # 表格区域 - 使用QSplitter分割各个区域
         self.splitter = QSplitter(Qt.Orientation.Vertical)
         
-        # 创建三个分类的表格
+        # 创建各个分类的表格（重命名/移动只在勾选检测时显示，多文件夹比较结果只在填写了更多文件夹时显示）
         self.tables = {}
+        self.models = {}
+        self.group_boxes = {}
         categories = [
             ("folder1_unique", "文件夹1独有的文件", "#4CAF50", "只在第一个文件夹中存在的文件"),
             ("folder2_unique", "文件夹2独有的文件", "#2196F3", "只在第二个文件夹中存在的文件"),
-            ("common", "共有的文件", "#9E9E9E", "两个文件夹中都存在的文件")
+            ("common", "共有的文件", "#9E9E9E", "两个文件夹中都存在的文件"),
+            ("renamed", "重命名或移动的文件", "#9C27B0", "内容相同但路径不同的文件（原路径 → 新路径）"),
+            ("multi", "多文件夹比较结果", "#795548",
+             "每个名称在各文件夹中的版本: . 不存在, 字母相同表示版本相同（比较内容时为内容相同，否则为大小相同）")
         ]
         
         for cat_id, cat_name, color, description in categories:
@@ -345,40 +952,58 @@ class FolderCompareGUI(QWidget):
             desc_label.setStyleSheet(f"color: {color}; font-size: 12px; padding-bottom: 5px;")
             group_layout.addWidget(desc_label)
             
-            # 创建表格
-            table = QTableWidget()
-            table.setColumnCount(4)  # 文件名、路径、大小、操作
-            table.setHorizontalHeaderLabels(["文件名", "路径", "大小", "操作"])
-            table.horizontalHeader().setStretchLastSection(True)
-            table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)  # 文件名列
-            table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)  # 路径列自适应
-            table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)  # 大小列
-            table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeMode.ResizeToContents)  # 操作列
+            # 创建表格（模型/视图，只渲染可见行）
+            model = (MultiResultTableModel if cat_id == "multi" else ResultTableModel)(cat_id, self)
+            table = QTableView()
+            table.setModel(model)
+            header = table.horizontalHeader()
+            header.setStretchLastSection(False)
+            header.setSectionResizeMode(0, QHeaderView.ResizeMode.Interactive)  # 文件名列
+            header.setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)  # 路径列自适应
+            header.setSectionResizeMode(2, QHeaderView.ResizeMode.Interactive)  # 大小列
+            header.setSectionResizeMode(3, QHeaderView.ResizeMode.Fixed)  # 操作列
+            table.setColumnWidth(0, 260)
+            table.setColumnWidth(2, 180)
+            table.setColumnWidth(3, 80)
+            # 固定行高，避免按内容逐行测量
+            line_height = table.fontMetrics().height()
+            table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+            paired = cat_id in ResultTableModel.PAIRED_CATEGORIES
+            table.verticalHeader().setDefaultSectionSize(line_height * (2 if paired else 1) + 8)
+            table.setWordWrap(False)
+            # QTableView 的排序指示默认为降序，先设为按文件名升序，与引擎发送结果的顺序一致
+            table.horizontalHeader().setSortIndicator(0, Qt.SortOrder.AscendingOrder)
             table.setSortingEnabled(True)
             table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
             table.setAlternatingRowColors(True)
             
-            # 根据分类设置行颜色
-            if cat_id == "folder1_unique":
-                table.setStyleSheet("QTableWidget::item { color: #4CAF50; }")
-            elif cat_id == "folder2_unique":
-                table.setStyleSheet("QTableWidget::item { color: #2196F3; }")
-            else:
-                table.setStyleSheet("QTableWidget::item { color: #757575; }")
+            # 打开位置: 双击操作列或使用右键菜单
+            table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+            table.customContextMenuRequested.connect(
+                lambda pos, t=table: self.show_table_menu(t, pos))
+            table.doubleClicked.connect(
+                lambda index, t=table: self.on_table_double_clicked(t, index))
             
             group_layout.addWidget(table)
             group_box.setLayout(group_layout)
             
             self.splitter.addWidget(group_box)
             self.tables[cat_id] = table
+            self.models[cat_id] = model
+            self.group_boxes[cat_id] = group_box
+        
+        self.detect_renames_cb.toggled.connect(self.update_tables)
+        self.update_tables()
         
         # 设置分割器各部分的初始大小
-        self.splitter.setSizes([300, 300, 300])
+        self.splitter.setSizes([300] * len(categories))
         main_layout.addWidget(self.splitter, 1)
         
         self.setLayout(main_layout)
         self.output_dir = None
         self.result_data = None
+        # 当前运行的后台线程（比较或保存快照），同一时间只允许一个
+        self.worker = None
     
     # 拖拽支持
     def dragEnterEvent(self, event):
@@ -415,7 +1040,145 @@ class FolderCompareGUI(QWidget):
             else:
                 self.folder2_edit.setText(folder)
     
+    def add_more_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "添加文件夹")
+        if folder:
+            text = self.more_folders_edit.text().strip().rstrip(";")
+            self.more_folders_edit.setText(f"{text}; {folder}" if text else folder)
+    
+    def more_folders(self):
+        """更多文件夹输入框中的路径列表"""
+        return [path.strip().strip('"\'') for path in self.more_folders_edit.text().split(";") if path.strip()]
+    
+    def update_tables(self):
+        """填写了更多文件夹时只显示多文件夹比较结果，否则显示两两比较的各个分类"""
+        multi = bool(self.more_folders())
+        for cat_id, group_box in self.group_boxes.items():
+            if cat_id == "multi":
+                group_box.setVisible(multi)
+            elif cat_id == "renamed":
+                group_box.setVisible(not multi and self.detect_renames_cb.isChecked())
+            else:
+                group_box.setVisible(not multi)
+    
+    def browse_ignore_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "选择忽略文件", "", "忽略文件 (*ignore *.txt);;所有文件 (*)")
+        if path:
+            self.ignore_file_edit.setText(path)
+    
+    def ignore_rules(self):
+        """按忽略规则、忽略文件和阈值输入框创建 IgnoreRules，输入有误时记录错误并返回 False"""
+        patterns = [pattern.strip() for pattern in self.ignore_edit.text().split(";") if pattern.strip()]
+        ignore_file = self.ignore_file_edit.text().strip().strip('"\'')
+        try:
+            return IgnoreRules(patterns, [ignore_file] if ignore_file else [],
+                               min_size=parse_size(self.min_size_edit.text()),
+                               max_size=parse_size(self.max_size_edit.text()),
+                               newer_than=parse_age(self.newer_than_edit.text()),
+                               older_than=parse_age(self.older_than_edit.text()))
+        except ValueError as e:
+            self.log_text.append(f"❌ {e}")
+        except OSError as e:
+            self.log_text.append(f"❌ 无法读取忽略文件: {e}")
+        return False
+    
+    def browse_snapshot(self, folder_num):
+        path, _ = QFileDialog.getOpenFileName(self, f"选择代替文件夹{folder_num}的快照", "",
+                                              f"文件夹快照 (*{SNAPSHOT_EXTENSION});;所有文件 (*)")
+        if path:
+            if folder_num == 1:
+                self.folder1_edit.setText(path)
+            else:
+                self.folder2_edit.setText(path)
+    
+    def save_snapshot(self):
+        """扫描文件夹1并保存为快照文件"""
+        folder = self.folder1_edit.text().strip().strip('"\'')
+        if not os.path.isdir(folder):
+            self.log_text.append(f"❌ 文件夹1不存在: {folder}")
+            return
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        default_name = f"{os.path.basename(os.path.normpath(folder))}_{timestamp}{SNAPSHOT_EXTENSION}"
+        path, _ = QFileDialog.getSaveFileName(self, "保存快照", default_name,
+                                              f"文件夹快照 (*{SNAPSHOT_EXTENSION})")
+        if not path or self.is_busy():
+            return
+        ignore = self.ignore_rules()
+        if ignore is False:
+            return
+        
+        self.worker = SnapshotSaveThread(
+            folder, path, self.compare_content_cb.isChecked(),
+            recursive=self.recursive_cb.isChecked(),
+            follow_symlinks=self.follow_symlinks_cb.isChecked(),
+            max_depth=self.max_depth_spin.value() or None,
+            ignore=ignore,
+            workers=self.workers_spin.value(),
+            io_limit=self.io_limit_spin.value(),
+            use_cache=self.use_cache_cb.isChecked())
+        self.worker.update_progress.connect(self.on_progress)
+        self.worker.log_signal.connect(self.on_log)
+        self.start_worker()
+    
+    def is_busy(self):
+        """已有后台任务在运行时提示并返回 True"""
+        if self.worker is not None and self.worker.isRunning():
+            self.log_text.append("❌ 已有任务正在运行，请等待完成或先取消")
+            return True
+        return False
+    
+    def start_worker(self):
+        """启动 self.worker，运行期间只允许暂停和取消"""
+        self.worker.finished.connect(self.on_worker_stopped)
+        self.set_running(True)
+        self.worker.start()
+    
+    def set_running(self, running):
+        self.start_btn.setEnabled(not running)
+        self.save_snapshot_btn.setEnabled(not running)
+        self.pause_btn.setEnabled(running)
+        self.pause_btn.setText("暂停")
+        self.cancel_btn.setText("取消")
+        self.cancel_btn.setEnabled(running)
+    
+    def toggle_pause(self):
+        if self.worker is None or not self.worker.isRunning():
+            return
+        paused = self.worker.toggle_pause()
+        self.pause_btn.setText("继续" if paused else "暂停")
+        if paused:
+            self.status_label.setText("已暂停")
+    
+    def cancel_run(self):
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.pause_btn.setEnabled(False)
+            self.status_label.setText("正在停止监视..." if self.watching else "正在取消...")
+    
+    def on_worker_stopped(self):
+        """后台线程结束（完成、失败或取消）后恢复按钮和表格排序"""
+        self.set_running(False)
+        for table in self.tables.values():
+            table.setSortingEnabled(True)
+        if self.watching:
+            self.watching = False
+            self.status_label.setText("已停止监视")
+        elif self.worker is not None and self.worker.comparator.cancel_event.is_set():
+            self.status_label.setText("已取消")
+    
+    def closeEvent(self, event):
+        """关闭窗口时取消正在运行的任务并等待其保存检查点"""
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.cancel()
+            self.worker.wait()
+        for thread in list(self.filter_threads):
+            thread.wait()
+        super().closeEvent(event)
+    
     def start_comparison(self):
+        if self.is_busy():
+            return
         folder1 = self.folder1_edit.text().strip()
         folder2 = self.folder2_edit.text().strip()
         
@@ -426,6 +1189,7 @@ class FolderCompareGUI(QWidget):
         folder1 = folder1.strip('"\'')
         folder2 = folder2.strip('"\'')
         
+        # 任意一侧都可以是快照文件
         if not os.path.exists(folder1):
             self.log_text.append(f"❌ 文件夹1不存在: {folder1}")
             return
@@ -434,26 +1198,96 @@ class FolderCompareGUI(QWidget):
             self.log_text.append(f"❌ 文件夹2不存在: {folder2}")
             return
         
-        # 清空所有表格
-        for table in self.tables.values():
-            table.setRowCount(0)
+        more_folders = self.more_folders()
+        for k, folder in enumerate(more_folders, 3):
+            if not os.path.exists(folder):
+                self.log_text.append(f"❌ 文件夹{k}不存在: {folder}")
+                return
+        
+        ignore = self.ignore_rules()
+        if ignore is False:
+            return
+        
+        incremental_dir = None
+        if self.incremental_cb.isChecked():
+            incremental_dir = self.incremental_dir_edit.text().strip().strip('"\'') or os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "文件夹比较分析_增量")
+        
+        # 清空所有表格，比较期间关闭排序，避免每个批次都重新排序
+        for cat_id, table in self.tables.items():
+            table.setSortingEnabled(False)
+            self.models[cat_id].clear()
+        # 丢弃针对旧结果的过滤；有过滤条件时新结果到达后重新过滤
+        self.filter_generation += 1
         
         self.progress.setValue(0)
         self.output_dir = None
         self.open_dir_btn.setEnabled(False)
+        self.export_perf_btn.setEnabled(False)
         self.log_text.clear()
+        # 界面填充（插入结果和排序）的累计耗时
+        self.gui_time = 0.0
+        
+        if more_folders:
+            self.start_multi_comparison([folder1, folder2] + more_folders, incremental_dir, ignore)
+            return
         
         self.worker = FolderCompareThread(
             folder1,
             folder2,
             self.save_report_cb.isChecked(),
-            self.classify_files_cb.isChecked()
+            self.classify_files_cb.isChecked(),
+            recursive=self.recursive_cb.isChecked(),
+            follow_symlinks=self.follow_symlinks_cb.isChecked(),
+            max_depth=self.max_depth_spin.value() or None,
+            ignore=ignore,
+            compare_content=self.compare_content_cb.isChecked(),
+            workers=self.workers_spin.value(),
+            io_limit=self.io_limit_spin.value(),
+            use_cache=self.use_cache_cb.isChecked(),
+            copy_mode=self.copy_mode_combo.currentData(),
+            copy_workers=self.workers_spin.value(),
+            incremental_dir=incremental_dir,
+            remove_stale=self.remove_stale_cb.isChecked(),
+            report_formats=self.report_format_combo.currentData(),
+            sort_chunk=self.sort_chunk_spin.value() * 10000 or None,
+            resume=self.resume_cb.isChecked(),
+            detect_renames=self.detect_renames_cb.isChecked(),
+            watch=self.watch_cb.isChecked()
         )
         self.worker.update_progress.connect(self.on_progress)
+        self.worker.copy_progress.connect(self.on_copy_progress)
         self.worker.log_signal.connect(self.on_log)
-        self.worker.file_signal.connect(self.on_file)
+        self.worker.files_signal.connect(self.on_files)
         self.worker.finished_signal.connect(self.on_finished)
-        self.worker.start()
+        self.worker.changes_signal.connect(self.on_changes)
+        self.start_worker()
+    
+    def start_multi_comparison(self, folders, incremental_dir, ignore):
+        """同时比较多个文件夹，结果显示在多文件夹比较结果表格中"""
+        ignored = [cb.text() for cb in (self.classify_files_cb, self.detect_renames_cb, self.watch_cb, self.resume_cb)
+                   if cb.isChecked()]
+        if ignored:
+            self.log_text.append(f"⚠ 多文件夹比较不支持: {'、'.join(ignored)}，已忽略")
+        self.worker = MultiCompareThread(
+            folders,
+            self.save_report_cb.isChecked(),
+            recursive=self.recursive_cb.isChecked(),
+            follow_symlinks=self.follow_symlinks_cb.isChecked(),
+            max_depth=self.max_depth_spin.value() or None,
+            ignore=ignore,
+            compare_content=self.compare_content_cb.isChecked(),
+            workers=self.workers_spin.value(),
+            io_limit=self.io_limit_spin.value(),
+            use_cache=self.use_cache_cb.isChecked(),
+            incremental_dir=incremental_dir,
+            report_formats=self.report_format_combo.currentData()
+        )
+        self.worker.update_progress.connect(self.on_progress)
+        self.worker.log_signal.connect(self.on_log)
+        self.worker.files_signal.connect(self.on_multi_files)
+        self.worker.finished_signal.connect(self.on_finished)
+        self.start_worker()
     
     def on_progress(self, current, total, status):
         self.status_label.setText(status)
@@ -461,6 +1295,15 @@ class FolderCompareGUI(QWidget):
             percent = int(current / total * 100)
             self.progress.setFormat(f"[{current}/{total}] {percent}%")
             self.progress.setValue(percent)
+        else:
+            # 总数未知（仍在扫描），只显示已处理的数量
+            self.progress.setFormat(f"[{current}]")
+    
+    def on_copy_progress(self, done, total, speed):
+        self.status_label.setText("正在分类复制文件...")
+        percent = int(done / total * 100) if total > 0 else 100
+        self.progress.setFormat(f"[{format_size(done)}/{format_size(total)}] {percent}% {format_size(speed)}/s")
+        self.progress.setValue(percent)
     
     def on_log(self, msg, color):
         if color == "red":
@@ -477,66 +1320,91 @@ class FolderCompareGUI(QWidget):
         self.log_text.append(msg)
         self.log_text.moveCursor(self.log_text.textCursor().MoveOperation.End)
     
-    def on_file(self, file_info):
-        category = file_info["category"]
-        table = self.tables.get(category)
-        if not table:
-            return
-        
-        row = table.rowCount()
-        table.insertRow(row)
+    def on_files(self, batch):
+        """批量追加结果: 每个批次每个模型只插入一次"""
+        start = time.perf_counter()
+        grouped = {}
+        for record in batch:
+            grouped.setdefault(record.category, []).append(record)
         
-        # 文件名
-        filename_item = QTableWidgetItem(file_info["filename"])
-        
-        # 根据分类设置颜色
-        if category == "folder1_unique":
-            filename_item.setForeground(QColor("#4CAF50"))  # 绿色
-        elif category == "folder2_unique":
-            filename_item.setForeground(QColor("#2196F3"))  # 蓝色
-        else:
-            filename_item.setForeground(QColor("#757575"))  # 灰色
-        
-        table.setItem(row, 0, filename_item)
-        
-        # 路径
-        if category == "common":
-            path_text = f"文件夹1: {file_info.get('path1', '')}\n文件夹2: {file_info.get('path2', '')}"
-            path_item = QTableWidgetItem(path_text)
-        else:
-            path_item = QTableWidgetItem(file_info.get("path", ""))
-        
-        table.setItem(row, 1, path_item)
-        
-        # 大小
-        if category == "common":
-            size1 = file_info.get("size1", 0)
-            size2 = file_info.get("size2", 0)
-            size_text = f"文件夹1: {self.format_size(size1)}\n文件夹2: {self.format_size(size2)}"
-            
-            # 如果大小不同，用红色标记
-            if size1 != size2:
-                size_item = QTableWidgetItem(f"⚠ 大小不同\n{self.format_size(size1)} vs {self.format_size(size2)}")
-                size_item.setForeground(QColor(255, 0, 0))
-            else:
-                size_item = QTableWidgetItem(f"相同大小: {self.format_size(size1)}")
-        else:
-            size = file_info.get("size", 0)
-            size_item = QTableWidgetItem(self.format_size(size))
-        
-        table.setItem(row, 2, size_item)
-        
-        # 操作按钮
-        if category == "common":
-            path = file_info.get("path1", "")
+        for category, infos in grouped.items():
+            model = self.models.get(category)
+            if model is not None:
+                model.append_rows(infos)
+        self.gui_time += time.perf_counter() - start
+        self.schedule_filter()
+    
+    def on_multi_files(self, batch):
+        """批量追加多文件夹比较的结果"""
+        start = time.perf_counter()
+        self.models["multi"].append_rows(batch)
+        self.gui_time += time.perf_counter() - start
+        self.schedule_filter()
+    
+    def schedule_filter(self):
+        """有过滤条件时安排重新过滤（例如追加了新结果）；已在等待时不推迟"""
+        if self.active_filter is not None and self.active_filter.active and not self.filter_timer.isActive():
+            self.filter_timer.start()
+    
+    def apply_filter(self):
+        """按过滤栏的条件启动后台过滤，之前未完成的过滤结果会被丢弃"""
+        try:
+            result_filter = ResultFilter(self.filter_edit.text(), self.filter_mode_combo.currentData(),
+                                         self.filter_ext_edit.text(), self.filter_min_size_edit.text(),
+                                         self.filter_max_size_edit.text())
+        except (re.error, ValueError) as e:
+            self.filter_status_label.setText(f"⚠ {e}")
+            self.filter_status_label.setStyleSheet("color: red;")
+            return
+        if self.active_filter is None and not result_filter.active:
+            return
+        self.filter_generation += 1
+        self.active_filter = result_filter
+        thread = FilterThread(self.filter_generation, result_filter, self.models)
+        thread.result_signal.connect(self.on_filter_result)
+        thread.finished.connect(lambda: self.filter_threads.discard(thread))
+        self.filter_threads.add(thread)
+        self.filter_status_label.setText("正在过滤...")
+        self.filter_status_label.setStyleSheet("color: #666;")
+        thread.start()
+    
+    def on_filter_result(self, generation, results):
+        if generation != self.filter_generation:
+            return
+        filtered = self.active_filter.active
+        for category, (count, rows) in results.items():
+            self.models[category].set_rows(count, rows, filtered)
+        if filtered:
+            shown = sum(len(model.order) for model in self.models.values())
+            total = sum(model.live_count() for model in self.models.values())
+            self.filter_status_label.setText(f"显示 {shown} / {total} 个文件")
         else:
-            path = file_info.get("path", "")
-        
-        if path and os.path.exists(path):
-            open_btn = QPushButton("打开位置")
-            open_btn.clicked.connect(lambda checked, p=os.path.dirname(path): self.open_file_location(p))
-            open_btn.setMaximumWidth(80)
-            table.setCellWidget(row, 3, open_btn)
+            self.filter_status_label.setText("")
+            self.active_filter = None
+        if any(len(self.models[category].names) > count for category, (count, _) in results.items()):
+            # 过滤期间又追加了结果
+            self.schedule_filter()
+    
+    def show_table_menu(self, table, pos):
+        """表格右键菜单"""
+        index = table.indexAt(pos)
+        if not index.isValid():
+            return
+        path = table.model().file_path(index.row())
+        if not path:
+            return
+        menu = QMenu(table)
+        open_action = menu.addAction("打开位置")
+        open_action.triggered.connect(lambda checked=False, p=os.path.dirname(path): self.open_file_location(p))
+        menu.exec(table.viewport().mapToGlobal(pos))
+    
+    def on_table_double_clicked(self, table, index):
+        """双击操作列时打开文件所在位置"""
+        if index.column() != 3:
+            return
+        path = table.model().file_path(index.row())
+        if path:
+            self.open_file_location(os.path.dirname(path))
     
     def on_finished(self, result):
         self.result_data = result
@@ -545,31 +1413,85 @@ class FolderCompareGUI(QWidget):
         if self.output_dir:
             self.open_dir_btn.setEnabled(True)
         
-        # 显示统计信息
-        total1 = len(result["unique_in_folder1"]) + len(result["common_files"])
-        total2 = len(result["unique_in_folder2"]) + len(result["common_files"])
-        common_count = len(result["common_files"])
-        diff_count = len(result["unique_in_folder1"]) + len(result["unique_in_folder2"])
+        start = time.perf_counter()
+        for table in self.tables.values():
+            table.setSortingEnabled(True)
+        self.gui_time += time.perf_counter() - start
+        self.schedule_filter()
+        perf = result.get("perf")
+        if perf is not None:
+            perf["phases"]["gui"] = round(self.gui_time, 6)
+            self.log_text.append(f"⏱ {PHASE_LABELS['gui']}: {self.gui_time:.2f}s")
+            self.export_perf_btn.setEnabled(True)
         
-        stats_text = f"✅ 比较完成! 统计: 文件夹1有 {total1} 个文件, 文件夹2有 {total2} 个文件, 共同文件 {common_count} 个, 差异文件 {diff_count} 个"
-        self.log_text.append(stats_text)
+        # 显示统计信息
+        counts = result["counts"]
+        if "folders" in result:
+            statuses = result["status_counts"]
+            differs = statuses.get(STATUS_SIZE_DIFFERS, 0) + statuses.get(STATUS_CONTENT_DIFFERS, 0)
+            self.log_text.append(f"✅ 比较完成! 统计: {len(result['folders'])} 个文件夹共 "
+                                 f"{counts['in_all'] + counts['partial']} 个名称, 所有文件夹都有 {counts['in_all']} 个, "
+                                 f"只在部分文件夹中 {counts['partial']} 个, 各文件夹版本不同 {differs} 个")
+            self.log_text.append("  按所在文件夹统计的名称数:")
+            for folders, count in list(result["subset_counts"].items())[:10]:
+                self.log_text.append(f"    文件夹 {folders}: {count} 个")
+        else:
+            renamed = counts.get("renamed", 0)
+            total1 = counts["folder1_unique"] + counts["common"] + renamed
+            total2 = counts["folder2_unique"] + counts["common"] + renamed
+            common_count = counts["common"]
+            diff_count = counts["folder1_unique"] + counts["folder2_unique"]
+            
+            stats_text = f"✅ 比较完成! 统计: 文件夹1有 {total1} 个文件, 文件夹2有 {total2} 个文件, 共同文件 {common_count} 个, 差异文件 {diff_count} 个"
+            if result.get("detect_renames"):
+                stats_text += f", 重命名或移动 {renamed} 个"
+            self.log_text.append(stats_text)
         
         # 更新进度条
         self.progress.setValue(100)
         self.status_label.setText("完成")
+        if self.worker is not None and self.worker.comparator.watch:
+            self.watching = True
+            self.status_label.setText("正在监视变化...")
+            self.cancel_btn.setText("停止监视")
+    
+    def on_changes(self, old_rows, new_rows):
+        """监视模式: 撤下消失的结果行，原地更新或追加新的结果行"""
+        kept = {(record.category, record.filename) for record in new_rows}
+        removed = {}
+        for record in old_rows:
+            if (record.category, record.filename) not in kept:
+                removed.setdefault(record.category, []).append(record.filename)
+        grouped = {}
+        for record in new_rows:
+            grouped.setdefault(record.category, []).append(record)
+        for category, model in self.models.items():
+            if category in removed or category in grouped:
+                model.update_rows(removed.get(category, ()), grouped.get(category, ()))
+        self.status_label.setText(f"正在监视变化... {datetime.datetime.now():%H:%M:%S} 已更新")
+        self.schedule_filter()
+    
+    def export_perf(self):
+        """把上一次比较的性能统计（含界面填充耗时）保存为 JSON"""
+        if not self.result_data or not self.result_data.get("perf"):
+            return
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path, _ = QFileDialog.getSaveFileName(self, "导出性能数据", f"性能统计_{timestamp}.json",
+                                              "JSON (*.json)")
+        if not path:
+            return
+        data = {key: self.result_data[key] for key in ("folders", "folder1", "folder2", "counts", "perf")
+                if key in self.result_data}
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            self.log_text.append(f"✅ 性能数据已保存: {path}")
+        except OSError as e:
+            self.log_text.append(f"❌ 保存性能数据失败: {e}")
     
     def format_size(self, size_bytes):
         """格式化文件大小"""
-        if size_bytes == 0:
-            return "0 B"
-        
-        size_names = ["B", "KB", "MB", "GB", "TB"]
-        i = 0
-        while size_bytes >= 1024 and i < len(size_names) - 1:
-            size_bytes /= 1024.0
-            i += 1
-        
-        return f"{size_bytes:.2f} {size_names[i]}"
+        return format_size(size_bytes)
     
     def open_file_location(self, path):
         """打开文件所在位置"""
@@ -0,0 +1,3972 @@
+"""文件夹比较引擎（不依赖 Qt）
+
+扫描、比较、内容校验、报告和分类复制的全部逻辑都在这里，
+图形界面（folder-comparator-gui.py）和命令行（folder-comparator-cli.py）共用同一引擎。
+"""
+import os
+import sys
+import shutil
+import struct
+import tempfile
+import csv
+import ctypes
+import ctypes.util
+import datetime
+import errno
+import hashlib
+import heapq
+import io
+import json
+import mmap
+import queue
+import re
+import select
+import sqlite3
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from array import array
+from collections import Counter, deque, namedtuple
+from contextlib import contextmanager
+
+# ----------------------
+# 目录扫描
+# ----------------------
+# 扫描时一次性采集的文件元数据，之后一路传递到界面，不再重复访问文件系统；
+# digest 只在来自快照的记录中出现，为保存快照时计算的完整内容哈希
+FileRecord = namedtuple("FileRecord", ["path", "size", "mtime", "inode", "mode", "digest"],
+                        defaults=[None])
+# 发送给界面的比较结果，file1/file2 为对应文件夹中的 FileRecord（不存在时为 None），
+# status 为共有文件的内容状态（见下方 STATUS_*）
+CompareRecord = namedtuple("CompareRecord", ["category", "filename", "file1", "file2", "status"],
+                           defaults=[None])
+
+
+class SyscallCounter:
+    """统计扫描过程中发出的文件系统调用次数和耗时（秒）"""
+    
+    def __init__(self):
+        self.scandir = 0
+        self.stat = 0
+        self.scandir_time = 0.0
+        self.stat_time = 0.0
+        # 被忽略规则排除的条目数（被排除的目录只计一次，其中的条目不会被访问）
+        self.ignored = 0
+    
+    def add(self, other):
+        """累加另一个计数器（例如并发扫描时各线程的计数器）"""
+        self.scandir += other.scandir
+        self.stat += other.stat
+        self.scandir_time += other.scandir_time
+        self.stat_time += other.stat_time
+        self.ignored += other.ignored
+    
+    @property
+    def total(self):
+        return self.scandir + self.stat
+    
+    def __str__(self):
+        return f"scandir {self.scandir} 次, stat {self.stat} 次, 共 {self.total} 次"
+
+
+# Windows 上 DirEntry.stat() 直接使用目录读取时的数据，不产生额外调用
+ENTRY_STAT_IS_CACHED = os.name == "nt"
+
+
+def walk_files(root, recursive=False, follow_symlinks=True, max_depth=None, onerror=None,
+               counter=None, check=None, ignore=None, rel_root=""):
+    """基于 os.scandir 的单遍目录遍历，逐个产出 (相对路径, FileRecord)
+    
+    每个文件只调用一次 entry.stat()（Windows 上直接复用目录读取结果），
+    大小、修改时间、inode 和权限位都在这里一次性采集。
+    max_depth 为 None 表示不限深度，0 表示只看顶层。
+    check 在读取每个目录前调用，可用于暂停或通过抛出异常取消遍历。
+    ignore 为 IgnoreRules 时在遍历中直接应用: 被排除的目录不会进入，按名称排除的文件不会被 stat。
+    只扫描子树时 rel_root 为 root 相对于比较根目录的路径，产出的路径和规则匹配都以比较根目录为准。
+    """
+    if not recursive:
+        max_depth = 0
+    if counter is None:
+        counter = SyscallCounter()
+    ignored = ignore.ignored if ignore is not None and ignore.has_patterns else None
+    accepts = ignore.accepts if ignore is not None and ignore.has_thresholds else None
+    visited = set()
+    stack = [(root, rel_root, 0)]
+    while stack:
+        dir_path, rel_dir, depth = stack.pop()
+        if check is not None:
+            check()
+        try:
+            if follow_symlinks and recursive:
+                # 跟随符号链接时记录已访问目录，防止链接成环
+                counter.stat += 1
+                start = time.perf_counter()
+                st = os.stat(dir_path)
+                counter.stat_time += time.perf_counter() - start
+                key = (st.st_dev, st.st_ino)
+                if key in visited:
+                    continue
+                visited.add(key)
+            counter.scandir += 1
+            start = time.perf_counter()
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+            counter.scandir_time += time.perf_counter() - start
+        except OSError as e:
+            if not depth:
+                raise
+            if onerror is not None:
+                onerror(e)
+            continue
+        
+        for entry in entries:
+            rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+            try:
+                if not follow_symlinks and entry.is_symlink():
+                    continue
+                if entry.is_file(follow_symlinks=follow_symlinks):
+                    if ignored is not None and ignored(rel_path, entry.name, False):
+                        counter.ignored += 1
+                        continue
+                    if not ENTRY_STAT_IS_CACHED or entry.is_symlink():
+                        counter.stat += 1
+                    start = time.perf_counter()
+                    st = entry.stat(follow_symlinks=follow_symlinks)
+                    counter.stat_time += time.perf_counter() - start
+                    if accepts is not None and not accepts(st.st_size, st.st_mtime):
+                        counter.ignored += 1
+                        continue
+                    yield rel_path, FileRecord(entry.path, st.st_size, st.st_mtime,
+                                               st.st_ino, st.st_mode)
+                elif (max_depth is None or depth < max_depth) and entry.is_dir(follow_symlinks=follow_symlinks):
+                    if ignored is not None and ignored(rel_path, entry.name, True):
+                        counter.ignored += 1
+                        continue
+                    stack.append((entry.path, rel_path, depth + 1))
+            except OSError as e:
+                if onerror is not None:
+                    onerror(e)
+
+
+class RootScanError(Exception):
+    """并发扫描时某个根目录无法访问，side 为根目录的序号"""
+    
+    def __init__(self, side, error):
+        super().__init__(str(error))
+        self.side = side
+        self.error = error
+
+
+# 并发扫描时每个批次的最大条目数，以及扫描线程与调用方之间最多排队的批次数
+SCAN_BATCH_SIZE = 1000
+SCAN_QUEUE_SIZE = 64
+
+
+def scan_concurrently(roots, recursive=False, follow_symlinks=True, max_depth=None, onerror=None,
+                      counters=None, check=None, ignore=None, on_idle=None):
+    """在各自的线程中同时遍历多个根目录，按到达顺序产出 (根目录序号, [(相对路径, FileRecord), ...])
+    
+    每读完一个目录就把已找到的文件交给调用方，慢速网络共享上也能很快拿到第一批结果。
+    队列有上限，调用方处理不过来时扫描线程会等待。根目录无法访问时抛出 RootScanError；
+    调用方停止读取（取消或出错）后扫描线程随之退出。
+    等待扫描线程（例如慢速目录读取）期间每隔 PROGRESS_INTERVAL 秒在调用方线程中调用一次 on_idle()。
+    """
+    results = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+    stop = threading.Event()
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=PROGRESS_INTERVAL)
+                return
+            except queue.Full:
+                pass
+        raise CompareCancelled()
+    
+    def scan(side, root):
+        batch = []
+        
+        def before_dir():
+            # 读取下一个目录（可能很慢）之前先交出已找到的文件
+            if check is not None:
+                check()
+            if stop.is_set():
+                raise CompareCancelled()
+            if batch:
+                put((side, batch[:], None))
+                batch.clear()
+        
+        try:
+            counter = counters[side] if counters is not None else None
+            for item in walk_files(root, recursive, follow_symlinks, max_depth, onerror, counter, before_dir,
+                                   ignore):
+                batch.append(item)
+                if len(batch) >= SCAN_BATCH_SIZE:
+                    put((side, batch[:], None))
+                    batch.clear()
+            put((side, batch, None))
+            put((side, None, None))
+        except BaseException as e:
+            try:
+                put((side, None, e))
+            except CompareCancelled:
+                pass
+    
+    threads = [threading.Thread(target=scan, args=(side, root), daemon=True)
+               for side, root in enumerate(roots)]
+    for thread in threads:
+        thread.start()
+    remaining = len(threads)
+    try:
+        while remaining:
+            try:
+                side, batch, error = results.get(timeout=PROGRESS_INTERVAL)
+            except queue.Empty:
+                if on_idle is not None:
+                    on_idle()
+                continue
+            if error is not None:
+                if isinstance(error, CompareCancelled):
+                    raise error
+                raise RootScanError(side, error)
+            if batch is None:
+                remaining -= 1
+            elif batch:
+                yield side, batch
+    finally:
+        # 正常结束时线程都已退出；提前停止时扫描线程在读取下一个目录前退出，不必等待
+        stop.set()
+
+
+# ----------------------
+# 忽略规则
+# ----------------------
+SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "kb": 1024, "m": 1024 ** 2, "mb": 1024 ** 2,
+              "g": 1024 ** 3, "gb": 1024 ** 3, "t": 1024 ** 4, "tb": 1024 ** 4}
+AGE_UNITS = {"": 86400, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_size(text):
+    """解析 512、10K、1.5MB、2G 这样的大小（按 1024 进位），空白返回 None"""
+    text = text.strip().lower().replace(" ", "")
+    if not text:
+        return None
+    match = re.fullmatch(r"(\d+(?:\.\d*)?)([a-z]*)", text)
+    if match is None or match.group(2) not in SIZE_UNITS:
+        raise ValueError(f"无法识别的大小: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_age(text):
+    """解析 90s、30m、12h、7d、2w 这样的时长（秒），不带单位按天计算，空白返回 None"""
+    text = text.strip().lower().replace(" ", "")
+    if not text:
+        return None
+    match = re.fullmatch(r"(\d+(?:\.\d*)?)([a-z]*)", text)
+    if match is None or match.group(2) not in AGE_UNITS:
+        raise ValueError(f"无法识别的时长: {text}")
+    return float(match.group(1)) * AGE_UNITS[match.group(2)]
+
+
+def ignore_pattern_regex(pattern):
+    """把一条 gitignore 风格的模式转换为正则: * 和 ? 不匹配 /，** 匹配任意层目录，[...] 为字符集合"""
+    parts = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/") and (i + 2 == n or pattern[i + 2] == "/"):
+                # 开头或中间的 **/ 匹配零层或多层目录，结尾的 /** 匹配其下的一切
+                parts.append("(?:.*/)?" if i + 2 < n else ".*")
+                i += 3
+                continue
+            parts.append("[^/]*")
+        elif c == "?":
+            parts.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end < 0:
+                parts.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                negate = body[0] in "!^"
+                body = "".join("\\" + ch if ch in "\\[" else ch for ch in body[negate:])
+                parts.append(("[^" if negate else "[") + body + "]")
+                i = end + 1
+                continue
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return "".join(parts)
+
+
+class _IgnoreMatcher:
+    """一组模式的编译结果: 纯名称放入集合，*.扩展名 放入后缀元组，其余合并为两个正则"""
+    
+    def __init__(self):
+        self.names = set()
+        self.suffixes = []
+        self.name_patterns = []
+        self.path_patterns = []
+        self.name_regex = None
+        self.path_regex = None
+    
+    def add(self, pattern, anchored):
+        if anchored:
+            self.path_patterns.append(ignore_pattern_regex(pattern))
+        elif not any(c in pattern for c in "*?[\\"):
+            self.names.add(pattern)
+        elif pattern[0] == "*" and len(pattern) > 1 and not any(c in pattern[1:] for c in "*?[\\"):
+            self.suffixes.append(pattern[1:])
+        else:
+            self.name_patterns.append(ignore_pattern_regex(pattern))
+    
+    def compile(self):
+        self.suffixes = tuple(self.suffixes)
+        if self.name_patterns:
+            self.name_regex = re.compile("|".join(f"(?:{p})" for p in self.name_patterns), re.DOTALL)
+        if self.path_patterns:
+            self.path_regex = re.compile("|".join(f"(?:{p})" for p in self.path_patterns), re.DOTALL)
+    
+    def match(self, rel_path, name):
+        if name in self.names or (self.suffixes and name.endswith(self.suffixes)):
+            return True
+        if self.name_regex is not None and self.name_regex.fullmatch(name):
+            return True
+        if self.path_regex is not None:
+            if os.sep != "/":
+                rel_path = rel_path.replace(os.sep, "/")
+            return self.path_regex.fullmatch(rel_path) is not None
+        return False
+
+
+class IgnoreRules:
+    """gitignore 风格的忽略规则，以及按大小和修改时间排除文件的阈值
+    
+    规则与 .gitignore 相同: 空行和 # 开头的行被忽略，! 开头表示重新包含，/ 结尾只匹配目录，
+    开头或中间含 / 时相对于比较根目录匹配，否则匹配任意一层的名称；后面的规则优先。
+    被排除的目录不会进入，其中的文件也不能再用 ! 重新包含。
+    构造时把正负相同的连续规则编译为一组，每个条目只需几次集合查找和至多两次正则匹配。
+    大小和修改时间阈值只作用于文件（newer_than/older_than 为距现在的秒数），在 stat 之后判断。
+    """
+    
+    def __init__(self, patterns=(), ignore_files=(), min_size=None, max_size=None,
+                 newer_than=None, older_than=None):
+        # 忽略文件中的规则在前，直接给出的规则在后（优先）
+        self.lines = []
+        for path in ignore_files:
+            with open(path, "r", encoding="utf-8-sig") as f:
+                self.lines.extend(f.read().splitlines())
+        self.lines.extend(patterns)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.newer_than = newer_than
+        self.older_than = older_than
+        now = time.time()
+        self.min_mtime = None if newer_than is None else now - newer_than
+        self.max_mtime = None if older_than is None else now - older_than
+        # [(是否为 ! 规则, 匹配文件和目录的规则, 只匹配目录的规则)]
+        self.groups = []
+        self.count = 0
+        for line in self.lines:
+            self.add(line)
+        for _, matcher, dir_matcher in self.groups:
+            matcher.compile()
+            dir_matcher.compile()
+    
+    def add(self, line):
+        """解析并加入一行规则"""
+        line = line.rstrip("\n\r")
+        # 行尾空格被忽略，除非用 \ 转义
+        while line.endswith(" ") and not line.endswith("\\ "):
+            line = line[:-1]
+        if not line or line.startswith("#"):
+            return
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            return
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if not self.groups or self.groups[-1][0] != negate:
+            self.groups.append((negate, _IgnoreMatcher(), _IgnoreMatcher()))
+        self.groups[-1][2 if dir_only else 1].add(line, anchored)
+        self.count += 1
+    
+    @property
+    def has_patterns(self):
+        return bool(self.groups)
+    
+    @property
+    def has_thresholds(self):
+        return (self.min_size is not None or self.max_size is not None
+                or self.min_mtime is not None or self.max_mtime is not None)
+    
+    def __bool__(self):
+        return self.has_patterns or self.has_thresholds
+    
+    def ignored(self, rel_path, name, is_dir):
+        """按规则判断一个条目是否被排除（调用方保证其上级目录没有被排除）"""
+        for negate, matcher, dir_matcher in reversed(self.groups):
+            if matcher.match(rel_path, name) or (is_dir and dir_matcher.match(rel_path, name)):
+                return not negate
+        return False
+    
+    def accepts(self, size, mtime):
+        """文件的大小和修改时间是否在阈值范围内"""
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.min_mtime is not None and mtime < self.min_mtime:
+            return False
+        if self.max_mtime is not None and mtime > self.max_mtime:
+            return False
+        return True
+    
+    def excludes(self, rel_path, size=None, mtime=None, is_dir=False):
+        """逐级检查上级目录后判断一个条目是否被排除，用于快照中的记录和监视到的单个路径"""
+        if self.groups:
+            parts = rel_path.split(os.sep)
+            for k in range(1, len(parts)):
+                if self.ignored(os.sep.join(parts[:k]), parts[k - 1], True):
+                    return True
+            if self.ignored(rel_path, parts[-1], is_dir):
+                return True
+        return size is not None and not self.accepts(size, mtime)
+    
+    def describe(self):
+        parts = []
+        if self.count:
+            parts.append(f"{self.count} 条规则")
+        if self.min_size is not None:
+            parts.append(f"大小 ≥ {format_size(self.min_size)}")
+        if self.max_size is not None:
+            parts.append(f"大小 ≤ {format_size(self.max_size)}")
+        if self.newer_than is not None:
+            parts.append(f"{format_age(self.newer_than)}内修改")
+        if self.older_than is not None:
+            parts.append(f"{format_age(self.older_than)}前修改")
+        return ", ".join(parts) or "无"
+    
+    def key(self):
+        """影响比较结果的设置，用于检查点文件名"""
+        return [self.lines, self.min_size, self.max_size, self.newer_than, self.older_than]
+
+
+# ----------------------
+# 文件索引
+# ----------------------
+class FileIndex:
+    """紧凑的文件索引: 所有相对路径按 UTF-8 编码存放在一块连续缓冲区中（加偏移量数组），
+    大小、修改时间、inode 和权限位分别存放在 array 列中。
+    
+    每个文件只占几十字节加上名称本身，不再为每个文件保留 Path、dict 或 FileRecord 对象；
+    FileRecord 只在需要时由 record() 临时生成。
+    """
+    # 编码相对路径时使用 surrogatepass，可以无损保存 surrogateescape 解码出的非法字节
+    ENCODING_ERRORS = "surrogatepass"
+    
+    def __init__(self, root):
+        self.root = root
+        self.names = bytearray()
+        self.offsets = array("Q", [0])
+        self.sizes = array("q")
+        self.mtimes = array("d")
+        self.inodes = array("Q")
+        self.modes = array("I")
+        # 来自快照的记录带有完整哈希，按顺序拼接存放；没有这样的记录时为 None
+        self.digests = None
+        self.digest_size = 0
+        self.is_sorted = True
+    
+    def __len__(self):
+        return len(self.sizes)
+    
+    def add(self, rel_path, record):
+        """追加一个文件"""
+        key = rel_path.encode("utf-8", self.ENCODING_ERRORS)
+        if self.is_sorted and len(self) and key < self.key(len(self) - 1):
+            self.is_sorted = False
+        self.names += key
+        self.offsets.append(len(self.names))
+        self.sizes.append(record.size)
+        self.mtimes.append(record.mtime)
+        self.inodes.append(record.inode)
+        self.modes.append(record.mode)
+        if record.digest is not None and self.digests is None:
+            # 第一次遇到带哈希的记录时才创建哈希列，之前的文件补零
+            self.digest_size = len(record.digest)
+            self.digests = bytearray(self.digest_size * (len(self) - 1))
+        if self.digests is not None:
+            self.digests += record.digest or bytes(self.digest_size)
+    
+    @property
+    def has_digests(self):
+        return self.digests is not None
+    
+    def key(self, i):
+        """第 i 个文件的排序键（UTF-8 字节序与 Unicode 码点顺序一致）"""
+        return bytes(self.names[self.offsets[i]:self.offsets[i + 1]])
+    
+    def name(self, i):
+        """第 i 个文件的相对路径"""
+        return self.names[self.offsets[i]:self.offsets[i + 1]].decode("utf-8", self.ENCODING_ERRORS)
+    
+    def path(self, i):
+        return os.path.join(self.root, self.name(i))
+    
+    def digest(self, i):
+        """第 i 个文件的完整哈希，没有或保存快照时读取失败为 None"""
+        if self.digests is None:
+            return None
+        digest = bytes(self.digests[i * self.digest_size:(i + 1) * self.digest_size])
+        return None if digest == bytes(self.digest_size) else digest
+    
+    def record(self, i):
+        """按需生成第 i 个文件的 FileRecord"""
+        return FileRecord(self.path(i), self.sizes[i], self.mtimes[i], self.inodes[i], self.modes[i],
+                          self.digest(i))
+    
+    def items(self):
+        """按名称顺序产出 (排序键, FileRecord)，可直接用于 merge_join"""
+        self.sort()
+        for i in range(len(self)):
+            yield self.key(i), self.record(i)
+    
+    def sort(self):
+        """按名称排序（就地重排所有列）"""
+        if self.is_sorted:
+            return
+        order = sorted(range(len(self)), key=self.key)
+        names = bytearray()
+        offsets = array("Q", [0])
+        for i in order:
+            names += self.names[self.offsets[i]:self.offsets[i + 1]]
+            offsets.append(len(names))
+        self.names = names
+        self.offsets = offsets
+        self.sizes = array("q", (self.sizes[i] for i in order))
+        self.mtimes = array("d", (self.mtimes[i] for i in order))
+        self.inodes = array("Q", (self.inodes[i] for i in order))
+        self.modes = array("I", (self.modes[i] for i in order))
+        if self.digests is not None:
+            size = self.digest_size
+            self.digests = bytearray().join(self.digests[i * size:(i + 1) * size] for i in order)
+        self.is_sorted = True
+
+
+def merge_join(listing1, listing2):
+    """对两个按键有序的 (键, 值) 序列做一次归并
+    
+    按键的顺序产出 (类别, 键, 值1, 值2)，类别为 folder1_unique / folder2_unique / common，
+    两侧都只需顺序读取一遍，可以直接用于外部排序的结果或已保存的有序列表。
+    """
+    it1, it2 = iter(listing1), iter(listing2)
+    a, b = next(it1, None), next(it2, None)
+    while a is not None and b is not None:
+        if a[0] == b[0]:
+            yield "common", a[0], a[1], b[1]
+            a, b = next(it1, None), next(it2, None)
+        elif a[0] < b[0]:
+            yield "folder1_unique", a[0], a[1], None
+            a = next(it1, None)
+        else:
+            yield "folder2_unique", b[0], None, b[1]
+            b = next(it2, None)
+    while a is not None:
+        yield "folder1_unique", a[0], a[1], None
+        a = next(it1, None)
+    while b is not None:
+        yield "folder2_unique", b[0], None, b[1]
+        b = next(it2, None)
+
+
+def diff_indexes(index1, index2):
+    """对两个索引排序后做一次归并，返回 (只在1中, 只在2中, 共有的1中下标, 共有的2中下标)
+    
+    四个结果都是按名称有序的 array 下标列，不创建任何集合或字典。
+    """
+    index1.sort()
+    index2.sort()
+    only1, only2 = array("q"), array("q")
+    common1, common2 = array("q"), array("q")
+    keyed1 = ((index1.key(i), i) for i in range(len(index1)))
+    keyed2 = ((index2.key(j), j) for j in range(len(index2)))
+    for category, _, i, j in merge_join(keyed1, keyed2):
+        if category == "common":
+            common1.append(i)
+            common2.append(j)
+        elif category == "folder1_unique":
+            only1.append(i)
+        else:
+            only2.append(j)
+    return only1, only2, common1, common2
+
+
+# 外部排序时每个临时文件中的一条记录: 名称长度, 大小, 修改时间, inode, 权限位, 然后是名称
+RUN_RECORD = struct.Struct("<IqdQI")
+# 默认每批在内存中排序的条目数，超过后写入临时文件
+DEFAULT_SORT_CHUNK = 1000000
+
+
+class SortedListing:
+    """按名称排序的文件列表，条目过多时使用外部排序
+    
+    读入 (相对路径, FileRecord) 序列，每 chunk_size 条在内存中排序后写入临时文件，
+    items() 用 heapq.merge 归并所有临时文件，产出 (排序键, FileRecord)。
+    内存中最多只保留 chunk_size 条记录，可以处理远大于内存的列表。
+    """
+    
+    def __init__(self, root, pairs, chunk_size=DEFAULT_SORT_CHUNK, tmp_dir=None):
+        self.root = root
+        self.chunk_size = max(1, chunk_size)
+        self.tmp_dir = tmp_dir
+        self.count = 0
+        self.runs = []
+        chunk = []
+        for rel_path, record in pairs:
+            chunk.append((rel_path.encode("utf-8", FileIndex.ENCODING_ERRORS), record.size,
+                          record.mtime, record.inode, record.mode))
+            if len(chunk) >= self.chunk_size:
+                self._spill(chunk)
+                chunk = []
+            self.count += 1
+        chunk.sort()
+        self.chunk = chunk
+    
+    def __len__(self):
+        return self.count
+    
+    @property
+    def is_external(self):
+        return bool(self.runs)
+    
+    def _spill(self, chunk):
+        """将一批排序后的记录写入临时文件"""
+        chunk.sort()
+        run = tempfile.TemporaryFile(dir=self.tmp_dir)
+        pack = RUN_RECORD.pack
+        for key, size, mtime, inode, mode in chunk:
+            run.write(pack(len(key), size, mtime, inode, mode))
+            run.write(key)
+        run.flush()
+        self.runs.append(run)
+    
+    def _read_run(self, run):
+        run.seek(0)
+        reader = io.BufferedReader(run, REPORT_BUFFER_SIZE) if not isinstance(run, io.BufferedReader) else run
+        unpack = RUN_RECORD.unpack
+        header_size = RUN_RECORD.size
+        while True:
+            header = reader.read(header_size)
+            if len(header) < header_size:
+                return
+            length, size, mtime, inode, mode = unpack(header)
+            yield (reader.read(length), size, mtime, inode, mode)
+    
+    def items(self):
+        """按名称顺序产出 (排序键, FileRecord)"""
+        if self.runs:
+            sources = [self._read_run(run) for run in self.runs] + [iter(self.chunk)]
+            items = heapq.merge(*sources)
+        else:
+            items = iter(self.chunk)
+        root = self.root
+        for key, size, mtime, inode, mode in items:
+            path = os.path.join(root, key.decode("utf-8", FileIndex.ENCODING_ERRORS))
+            yield key, FileRecord(path, size, mtime, inode, mode)
+    
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+        self.chunk = []
+
+
+# ----------------------
+# 内容比较
+# ----------------------
+STATUS_UNCHECKED = "unchecked"  # 大小相同，未比较内容
+STATUS_SAME = "same"  # 内容相同
+STATUS_SIZE_DIFFERS = "size_differs"  # 大小不同
+STATUS_CONTENT_DIFFERS = "content_differs"  # 大小相同但内容不同
+STATUS_ERROR = "error"  # 读取失败
+STATUS_LABELS = {
+    STATUS_UNCHECKED: "相同大小",
+    STATUS_SAME: "内容相同",
+    STATUS_SIZE_DIFFERS: "大小不同",
+    STATUS_CONTENT_DIFFERS: "内容不同",
+    STATUS_ERROR: "无法读取",
+}
+
+# 首尾块哈希读取的块大小
+PARTIAL_BLOCK_SIZE = 64 * 1024
+# 完整比较时每次读取的块大小
+FULL_CHUNK_SIZE = 1024 * 1024
+
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+def partial_digest(path, size, block_size=PARTIAL_BLOCK_SIZE, buf=None):
+    """计算文件首块和末块的哈希；文件不超过两个块时即为完整内容的哈希"""
+    if buf is None:
+        buf = bytearray(block_size)
+    view = memoryview(buf)[:block_size]
+    h = new_hasher()
+    with open(path, "rb") as f:
+        n = f.readinto(view)
+        h.update(view[:n])
+        if size > block_size:
+            f.seek(max(size - block_size, block_size))
+            n = f.readinto(view)
+            h.update(view[:n])
+    return h.digest()
+
+
+def full_compare(path1, path2, chunk_size=FULL_CHUNK_SIZE, buffers=None, cancel_event=None,
+                 hasher=None, resume_event=None):
+    """同步分块读取两个文件并逐块比较，遇到不同的块立即返回 False
+    
+    传入 hasher 时同时计算内容哈希（两文件相同时即为两者共同的完整哈希）。
+    """
+    if buffers is None:
+        buffers = (bytearray(chunk_size), bytearray(chunk_size))
+    buf1, buf2 = buffers
+    view1 = memoryview(buf1)[:chunk_size]
+    view2 = memoryview(buf2)[:chunk_size]
+    with open(path1, "rb") as f1, open(path2, "rb") as f2:
+        while True:
+            if cancel_event is not None:
+                wait_while_paused(cancel_event, resume_event)
+            n1 = f1.readinto(view1)
+            n2 = f2.readinto(view2)
+            if n1 != n2 or view1[:n1] != view2[:n2]:
+                return False
+            if n1 == 0:
+                return True
+            if hasher is not None:
+                hasher.update(view1[:n1])
+
+
+def full_digest(path, chunk_size=FULL_CHUNK_SIZE, buf=None, cancel_event=None, resume_event=None):
+    """流式计算文件的完整哈希"""
+    if buf is None:
+        buf = bytearray(chunk_size)
+    view = memoryview(buf)[:chunk_size]
+    h = new_hasher()
+    with open(path, "rb") as f:
+        while True:
+            if cancel_event is not None:
+                wait_while_paused(cancel_event, resume_event)
+            n = f.readinto(view)
+            if n == 0:
+                return h.digest()
+            h.update(view[:n])
+
+
+class CompareCancelled(Exception):
+    """比较被用户取消"""
+
+
+def wait_while_paused(cancel_event, resume_event=None):
+    """resume_event 被清除（暂停）时阻塞，直到继续或取消；已取消时抛出 CompareCancelled"""
+    if resume_event is not None:
+        while not resume_event.wait(PROGRESS_INTERVAL):
+            if cancel_event.is_set():
+                break
+    if cancel_event.is_set():
+        raise CompareCancelled()
+
+
+# ----------------------
+# 哈希缓存
+# ----------------------
+# 缓存数据库的默认大小上限（字节），超出后淘汰最久未使用的记录
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# 累积多少条写入（或最近使用时间的更新）后提交一次
+CACHE_FLUSH_SIZE = 1000
+
+
+def default_cache_path():
+    """返回用户缓存目录中的哈希缓存数据库路径"""
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        cache_dir = os.path.join(base, "FolderComparator", "cache")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        cache_dir = os.path.join(base, "folder-comparator")
+    return os.path.join(cache_dir, "hash_cache.sqlite3")
+
+
+class HashCache:
+    """持久化的文件哈希缓存（SQLite），多次运行之间共享
+    
+    以路径为主键，同时保存 (大小, 修改时间, inode) 签名；签名不一致时视为未命中，
+    下次写入时覆盖，因此文件被修改后缓存自动失效。可在多个线程中使用。
+    """
+    
+    def __init__(self, path=None, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.path = path or default_cache_path()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._touched = []
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS file_hashes (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            inode INTEGER NOT NULL,
+            block_size INTEGER NOT NULL,
+            partial BLOB,
+            full BLOB,
+            last_used REAL NOT NULL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON file_hashes(last_used)")
+        self._conn.commit()
+    
+    def _lookup(self, record, block_size):
+        row = self._pending.get(record.path)
+        if row is None:
+            row = self._conn.execute(
+                "SELECT path, size, mtime, inode, block_size, partial, full FROM file_hashes WHERE path = ?",
+                (record.path,)).fetchone()
+            if row is not None:
+                self._touched.append(record.path)
+                # 与待写入的哈希一样分批提交，大量命中时不在内存中无限累积
+                if len(self._touched) >= CACHE_FLUSH_SIZE:
+                    self._flush()
+        if row is None or row[1:4] != (record.size, record.mtime, record.inode):
+            return None, None
+        partial = row[5] if row[4] == block_size else None
+        return partial, row[6]
+    
+    def get(self, record, block_size=PARTIAL_BLOCK_SIZE):
+        """返回 (首尾块哈希, 完整哈希)，未缓存或已失效的部分为 None"""
+        with self._lock:
+            partial, full = self._lookup(record, block_size)
+            if partial is None and full is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return partial, full
+    
+    def put(self, record, block_size=PARTIAL_BLOCK_SIZE, partial=None, full=None):
+        """写入哈希，与同一签名下已缓存的另一种哈希合并"""
+        with self._lock:
+            old_partial, old_full = self._lookup(record, block_size)
+            self._pending[record.path] = (
+                record.path, record.size, record.mtime, record.inode, block_size,
+                partial or old_partial, full or old_full)
+            if len(self._pending) >= CACHE_FLUSH_SIZE:
+                self._flush()
+    
+    def _flush(self):
+        now = time.time()
+        if self._pending:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [row + (now,) for row in self._pending.values()])
+            self._pending.clear()
+        if self._touched:
+            self._conn.executemany("UPDATE file_hashes SET last_used = ? WHERE path = ?",
+                                   [(now, path) for path in self._touched])
+            self._touched.clear()
+        self._conn.commit()
+    
+    def flush(self):
+        with self._lock:
+            self._flush()
+    
+    def evict(self):
+        """数据库超过大小上限时，删除最久未使用的记录"""
+        with self._lock:
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            db_bytes = page_size * page_count
+            if db_bytes <= self.max_bytes:
+                return 0
+            total = self._conn.execute("SELECT COUNT(*) FROM file_hashes").fetchone()[0]
+            # 按平均每条记录的大小估算需要删除的条数，多删一些留出余量
+            keep = int(total * self.max_bytes / db_bytes * 0.8)
+            removed = total - keep
+            self._conn.execute(
+                "DELETE FROM file_hashes WHERE path IN "
+                "(SELECT path FROM file_hashes ORDER BY last_used LIMIT ?)", (removed,))
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+            return removed
+    
+    def close(self):
+        """写入未提交的数据、按需淘汰并关闭数据库"""
+        self.flush()
+        self.evict()
+        self._conn.close()
+    
+    def summary(self):
+        return f"命中 {self.hits} 个, 未命中 {self.misses} 个"
+
+
+# 内容比较的默认工作线程数和每个文件夹的并发读取数
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+DEFAULT_IO_LIMIT = 4
+
+
+class _StopSignal:
+    """用户取消或 _ordered 提前结束时都视为已设置，供工作线程中的读取循环检查"""
+    
+    def __init__(self, cancel_event, stop_event):
+        self.cancel_event = cancel_event
+        self.stop_event = stop_event
+    
+    def is_set(self):
+        return self.cancel_event.is_set() or self.stop_event.is_set()
+
+
+class ContentComparer:
+    """分阶段比较共有文件的内容: 大小 → 首尾块哈希 → 完整分块比较
+    
+    每一阶段只处理上一阶段仍无法区分的文件，大部分文件无需完整读取。
+    compare_many 使用线程池并发比较（文件读取和哈希计算都会释放 GIL），
+    并用信号量分别限制对两个文件夹的并发读取数；每个工作线程复用自己的读缓冲区。
+    传入 HashCache 时优先使用缓存的哈希，未修改的文件无需再次读取；
+    来自快照的记录带有保存时的完整哈希，只需计算另一侧文件的完整哈希。
+    stats 记录在各阶段得出结论的文件数。
+    """
+    
+    def __init__(self, block_size=PARTIAL_BLOCK_SIZE, chunk_size=FULL_CHUNK_SIZE,
+                 workers=DEFAULT_WORKERS, io_limit=DEFAULT_IO_LIMIT, cancel_event=None, cache=None,
+                 resume_event=None):
+        self.block_size = block_size
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.io_limits = (threading.BoundedSemaphore(max(1, io_limit)),
+                          threading.BoundedSemaphore(max(1, io_limit)))
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        # 清除时暂停: 不再开始新的比较，进行中的读取在下一个块之前等待
+        self.resume_event = resume_event
+        self.cache = cache
+        self.stats = {"size": 0, "partial": 0, "full": 0, "error": 0, "resumed": 0}
+        # 读取文件的累计字节数（按读取的范围估算）和各工作线程累计的读取/哈希耗时
+        self.bytes_read = 0
+        self.busy_time = 0.0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        # 等待耗时较长的任务时，每隔 PROGRESS_INTERVAL 秒在调用方线程中调用一次
+        self.on_idle = None
+    
+    def _count(self, stage):
+        with self._stats_lock:
+            self.stats[stage] += 1
+    
+    def _add_io(self, nbytes, seconds):
+        with self._stats_lock:
+            self.bytes_read += nbytes
+            self.busy_time += seconds
+    
+    def _halt(self):
+        """当前线程的读取循环应检查的停止信号: _ordered 的工作线程中为该次调用的 _StopSignal"""
+        return getattr(self._local, "halt", self.cancel_event)
+    
+    def _buffers(self):
+        """返回当前线程专用的读缓冲区"""
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = (bytearray(self.chunk_size), bytearray(self.chunk_size))
+            self._local.buffers = buffers
+        return buffers
+    
+    def _cached(self, file):
+        """返回 (首尾块哈希, 完整哈希): 快照中保存的哈希优先，其次是哈希缓存"""
+        if file.digest is not None:
+            return None, file.digest
+        if self.cache is not None:
+            return self.cache.get(file, self.block_size)
+        return None, None
+    
+    def _partial(self, file, cached, io, buf):
+        """返回首尾块哈希，优先使用缓存"""
+        if cached[0] is not None:
+            return cached[0]
+        with io:
+            start = time.perf_counter()
+            digest = partial_digest(file.path, file.size, self.block_size, buf)
+            self._add_io(min(file.size, 2 * self.block_size), time.perf_counter() - start)
+        if self.cache is not None:
+            self.cache.put(file, self.block_size, partial=digest)
+        return digest
+    
+    def _full(self, file, io, buf):
+        """流式计算完整哈希并写入缓存"""
+        with io:
+            start = time.perf_counter()
+            digest = full_digest(file.path, self.chunk_size, buf, self._halt(), self.resume_event)
+            self._add_io(file.size, time.perf_counter() - start)
+        if self.cache is not None:
+            self.cache.put(file, self.block_size, full=digest)
+        return digest
+    
+    def compare(self, file1, file2):
+        """比较两个 FileRecord 的内容，返回 STATUS_* 之一"""
+        if file1.size != file2.size:
+            self._count("size")
+            return STATUS_SIZE_DIFFERS
+        wait_while_paused(self._halt(), self.resume_event)
+        io1, io2 = self.io_limits
+        buf1, buf2 = self._buffers()
+        try:
+            cached1 = self._cached(file1)
+            cached2 = self._cached(file2)
+            # 两边都有缓存的完整哈希时无需读取文件
+            if cached1[1] is not None and cached2[1] is not None:
+                self._count("full")
+                return STATUS_SAME if cached1[1] == cached2[1] else STATUS_CONTENT_DIFFERS
+            
+            # 快照一侧的文件不一定还在，直接进入完整哈希比较
+            if file1.digest is None and file2.digest is None:
+                if self._partial(file1, cached1, io1, buf1) != self._partial(file2, cached2, io2, buf2):
+                    self._count("partial")
+                    return STATUS_CONTENT_DIFFERS
+                if file1.size <= 2 * self.block_size:
+                    # 首尾块已覆盖整个文件
+                    self._count("partial")
+                    return STATUS_SAME
+            
+            self._count("full")
+            if cached1[1] is not None:
+                return STATUS_SAME if self._full(file2, io2, buf2) == cached1[1] else STATUS_CONTENT_DIFFERS
+            if cached2[1] is not None:
+                return STATUS_SAME if self._full(file1, io1, buf1) == cached2[1] else STATUS_CONTENT_DIFFERS
+            # 固定按 文件夹1 → 文件夹2 的顺序获取，避免互相等待
+            hasher = new_hasher() if self.cache is not None else None
+            with io1, io2:
+                start = time.perf_counter()
+                same = full_compare(file1.path, file2.path, self.chunk_size,
+                                    (buf1, buf2), self._halt(), hasher, self.resume_event)
+                # 内容不同时提前结束，读取量按两个完整文件估算的上限
+                self._add_io(2 * file1.size, time.perf_counter() - start)
+            if not same:
+                return STATUS_CONTENT_DIFFERS
+            if hasher is not None:
+                digest = hasher.digest()
+                self.cache.put(file1, self.block_size, full=digest)
+                self.cache.put(file2, self.block_size, full=digest)
+            return STATUS_SAME
+        except OSError:
+            self._count("error")
+            return STATUS_ERROR
+    
+    def compare_many(self, pairs, known=None):
+        """并发比较多对文件，按输入顺序产出 (key, status)
+        
+        pairs 为 (key, file1, file2) 的可迭代对象；同时在途的任务数有上限，
+        不会一次性为所有文件创建任务。结果按输入顺序产出，输入有序时输出也有序。
+        known(file1, file2) 返回已知的结论（例如检查点中记录的）时不再比较。
+        取消后抛出 CompareCancelled。
+        """
+        def quick(file1, file2):
+            # 大小不同无需读文件，直接得出结论
+            if file1.size != file2.size:
+                self._count("size")
+                return STATUS_SIZE_DIFFERS
+            status = known(file1, file2) if known is not None else None
+            if status is not None:
+                self._count("resumed")
+            return status
+        
+        return self._ordered(pairs, self.compare, quick, lambda file1, file2: STATUS_ERROR)
+    
+    def digest(self, file):
+        """返回文件的完整哈希，优先使用缓存；读取失败时返回 None"""
+        cached = self._cached(file)
+        if cached[1] is not None:
+            return cached[1]
+        try:
+            return self._full(file, self.io_limits[0], self._buffers()[0])
+        except OSError:
+            self._count("error")
+            return None
+    
+    def digest_many(self, files):
+        """并发计算多个文件的完整哈希，按输入顺序产出 (key, digest)；files 为 (key, file)"""
+        return self._ordered(files, self.digest)
+    
+    def quick_digest(self, file):
+        """返回用于初步分组的哈希: 不超过两个块的文件即为完整哈希，更大的文件为首尾块哈希；
+        优先使用缓存，读取失败时返回 None"""
+        cached = self._cached(file)
+        if file.size <= 2 * self.block_size and cached[1] is not None:
+            return cached[1]
+        try:
+            return self._partial(file, cached, self.io_limits[0], self._buffers()[0])
+        except OSError:
+            self._count("error")
+            return None
+    
+    def quick_digest_many(self, files):
+        """并发计算多个文件的 quick_digest，按输入顺序产出 (key, digest)"""
+        return self._ordered(files, self.quick_digest)
+    
+    def group(self, files):
+        """按内容给同名的多个文件分组，返回与 files 一一对应的组号（按首次出现从 0 编号），读取失败为 -1
+        
+        先按大小分组，只有大小相同的文件才读取；再依次按首尾块哈希和完整哈希细分，
+        不做两两比较，读取量与文件数成正比。来自快照的文件使用保存时的完整哈希。
+        """
+        by_size = {}
+        for k, file in enumerate(files):
+            by_size.setdefault(file.size, []).append(k)
+        keys = [None] * len(files)
+        for size, positions in by_size.items():
+            if len(positions) == 1:
+                keys[positions[0]] = (size,)
+                continue
+            candidates = [files[k] for k in positions]
+            stage = "full"
+            if any(file.digest is not None for file in candidates):
+                digests = [self.digest(file) for file in candidates]
+            else:
+                digests = [self.quick_digest(file) for file in candidates]
+                repeated = Counter(digest for digest in digests if digest is not None)
+                if size <= 2 * self.block_size or all(n == 1 for n in repeated.values()):
+                    stage = "partial"
+                else:
+                    # 首尾块哈希相同的还要比较完整哈希
+                    digests = [self.digest(file) if digest is not None and repeated[digest] > 1 else digest
+                               for file, digest in zip(candidates, digests)]
+            self._count(stage)
+            for k, digest in zip(positions, digests):
+                if digest is not None:
+                    keys[k] = (size, digest)
+        labels = {}
+        return [-1 if key is None else labels.setdefault(key, len(labels)) for key in keys]
+    
+    def group_many(self, items):
+        """并发对多组文件执行 group，按输入顺序产出 (key, 组号列表)；items 为 (key, [FileRecord, ...])"""
+        def quick(files):
+            # 大小各不相同时无需读取文件
+            if len({file.size for file in files}) == len(files):
+                if len(files) > 1:
+                    self._count("size")
+                return list(range(len(files)))
+            return None
+        
+        return self._ordered(items, self.group, quick, lambda files: [-1] * len(files))
+    
+    def _call(self, halt, func, args):
+        self._local.halt = halt
+        return func(*args)
+    
+    def _ordered(self, items, func, quick=None, failed=None):
+        """在线程池中对每个 (key, *args) 执行 func(*args)，按输入顺序产出 (key, 结果)
+        
+        quick(*args) 返回非 None 时直接作为结果，不提交任务。
+        某一项出现意外错误时计为读取失败，结果为 failed(*args)（未给出时为 None），其余各项照常进行；
+        只有用户取消才会中止整个运行。提前结束（调用方停止读取或出错）时通过本次调用
+        自己的停止信号让进行中的读取尽快退出，不影响 cancel_event。
+        """
+        stop = threading.Event()
+        halt = _StopSignal(self.cancel_event, stop)
+        # 按输入顺序排队的 [key, future, result, args]，future 为 None 表示已有结论
+        queue = deque()
+        max_queued = self.workers * 8
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                exhausted = False
+                while queue or not exhausted:
+                    wait_while_paused(self.cancel_event, self.resume_event)
+                    while not exhausted and len(queue) < max_queued:
+                        item = next(items, None)
+                        if item is None:
+                            exhausted = True
+                            break
+                        key, *args = item
+                        result = quick(*args) if quick is not None else None
+                        if result is not None:
+                            queue.append([key, None, result, args])
+                        else:
+                            queue.append([key, executor.submit(self._call, halt, func, args), None, args])
+                    if self.cancel_event.is_set():
+                        raise CompareCancelled()
+                    if not queue:
+                        continue
+                    key, future, result, args = queue[0]
+                    if future is not None:
+                        done, _ = wait([future], timeout=PROGRESS_INTERVAL)
+                        if not done:
+                            if self.on_idle is not None:
+                                self.on_idle()
+                            continue
+                        try:
+                            result = future.result()
+                        except CompareCancelled:
+                            raise
+                        except Exception:
+                            self._count("error")
+                            result = failed(*args) if failed is not None else None
+                    queue.popleft()
+                    yield key, result
+            except BaseException:
+                stop.set()
+                for _, future, _, _ in queue:
+                    if future is not None:
+                        future.cancel()
+                raise
+    
+    def summary(self):
+        text = (f"大小不同 {self.stats['size']} 个, 首尾块判定 {self.stats['partial']} 个, "
+                f"完整比较 {self.stats['full']} 个, 读取失败 {self.stats['error']} 个")
+        if self.stats["resumed"]:
+            text += f", 沿用检查点 {self.stats['resumed']} 个"
+        return text
+
+
+# ----------------------
+# 重命名检测
+# ----------------------
+# 重命名或移动的文件记录的 filename 为 "原路径 → 新路径"
+RENAME_SEPARATOR = " → "
+
+
+def find_renames(index1, only1, index2, only2, comparer):
+    """在两侧独有的文件中找出内容相同的文件对（重命名或移动），返回按原路径排序的 [(i, j)]
+    
+    only1 / only2 为 index1 / index2 中独有文件的下标。先按大小分组，只有两侧都出现的大小
+    才需要读取文件；再依次按首尾块哈希和完整哈希细分，每一步只保留两侧都有文件的组，
+    不做两两比较，读取量与候选文件数成正比。空文件不参与配对。
+    来自快照的文件必须带有保存时的哈希。
+    """
+    indexes = (index1, index2)
+    by_size = {}
+    for i in only1:
+        if index1.sizes[i]:
+            by_size.setdefault(index1.sizes[i], [index1.sizes[i], [], []])[1].append(i)
+    for j in only2:
+        group = by_size.get(index2.sizes[j])
+        if group is not None:
+            group[2].append(j)
+    # 每组为 [大小, 文件夹1中的下标, 文件夹2中的下标]
+    groups = [group for group in by_size.values() if group[2]]
+    del by_size
+    
+    def refine(groups, digest_many):
+        """按哈希把每组再细分，丢弃只剩一侧文件的组"""
+        items = (((g, side, pos), indexes[side].record(pos))
+                 for g, group in enumerate(groups) for side in (0, 1) for pos in group[side + 1])
+        refined = {}
+        for (g, side, pos), digest in digest_many(items):
+            if digest is not None:
+                refined.setdefault((g, digest), [groups[g][0], [], []])[side + 1].append(pos)
+        return [group for group in refined.values() if group[1] and group[2]]
+    
+    if index1.has_digests or index2.has_digests:
+        # 快照中只有完整哈希
+        groups = refine(groups, comparer.digest_many)
+    else:
+        groups = refine(groups, comparer.quick_digest_many)
+        # 不超过两个块的文件，首尾块哈希已覆盖全部内容
+        small = 2 * comparer.block_size
+        groups = ([group for group in groups if group[0] <= small]
+                  + refine([group for group in groups if group[0] > small], comparer.digest_many))
+    
+    pairs = []
+    for _, group1, group2 in groups:
+        # 同一组有多个候选时优先配对文件名相同的（移动到其他目录），其余按路径顺序配对
+        group1.sort(key=index1.key)
+        group2.sort(key=index2.key)
+        by_name = {}
+        for j in group2:
+            by_name.setdefault(os.path.basename(index2.name(j)), []).append(j)
+        rest1 = []
+        paired2 = set()
+        for i in group1:
+            same_name = by_name.get(os.path.basename(index1.name(i)))
+            if same_name:
+                j = same_name.pop(0)
+                pairs.append((i, j))
+                paired2.add(j)
+            else:
+                rest1.append(i)
+        pairs.extend(zip(rest1, (j for j in group2 if j not in paired2)))
+    pairs.sort(key=lambda pair: index1.key(pair[0]))
+    return pairs
+
+
+# ----------------------
+# 快照
+# ----------------------
+SNAPSHOT_EXTENSION = ".fcsnap"
+SNAPSHOT_MAGIC = b"FCSNAP\x00\x01"
+# 快照文件头: 魔数, 文件数, 名称缓冲区长度, 根目录长度, 每个哈希的字节数（0 表示不含哈希）, 保存时间
+SNAPSHOT_HEADER = struct.Struct("<8sQQIId")
+# 快照中各列的类型，按此顺序存放在文件头和根目录之后，每列按 8 字节对齐，统一为小端序
+SNAPSHOT_COLUMNS = (("sizes", "q"), ("mtimes", "d"), ("inodes", "Q"), ("modes", "I"))
+
+
+def _align8(n):
+    return (n + 7) & ~7
+
+
+def is_snapshot(path):
+    """path 是否为快照文件"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+    except OSError:
+        return False
+
+
+def write_snapshot(index, path, digests=None):
+    """把 FileIndex 按名称排序后写入快照文件
+    
+    digests 为按排序后顺序拼接的完整哈希（读取失败的文件为全零），None 表示不保存哈希。
+    先写入临时文件再替换，写入失败不会破坏已有快照。
+    """
+    index.sort()
+    count = len(index)
+    root = os.path.abspath(index.root).encode("utf-8", FileIndex.ENCODING_ERRORS)
+    digest_size = new_hasher().digest_size if digests is not None else 0
+    columns = [index.offsets] + [getattr(index, name) for name, _ in SNAPSHOT_COLUMNS]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        
+        def write_aligned(data):
+            f.write(data)
+            f.write(b"\0" * (_align8(f.tell()) - f.tell()))
+        
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, count, len(index.names), len(root),
+                                     digest_size, time.time()))
+        write_aligned(root)
+        for column in columns:
+            if sys.byteorder != "little":
+                column = array(column.typecode, column)
+                column.byteswap()
+            write_aligned(column.tobytes())
+        write_aligned(index.names)
+        if digests is not None:
+            f.write(digests)
+    os.replace(tmp_path, path)
+
+
+class SnapshotIndex(FileIndex):
+    """以只读内存映射方式载入的快照，可以像扫描得到的 FileIndex 一样参与比较
+    
+    各列直接是映射区域上的 memoryview，载入时只读取文件头，
+    数据由操作系统按需分页读入，远快于重新扫描目录树。
+    记录的路径指向保存快照时的原目录，该目录不一定还存在。
+    """
+    
+    def __init__(self, path):
+        self.snapshot_path = path
+        with open(path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"不是有效的快照文件: {path}")
+        self._views = []
+        try:
+            self._load()
+        except Exception:
+            self.close()
+            raise
+    
+    def _view(self, start, length, typecode=None):
+        """返回映射区域上的一段 memoryview，大端序平台上转换为 array 副本"""
+        if start + length > len(self._mmap):
+            raise ValueError(f"快照文件不完整: {self.snapshot_path}")
+        view = memoryview(self._mmap)[start:start + length]
+        self._views.append(view)
+        if typecode is None:
+            return view
+        if sys.byteorder != "little":
+            column = array(typecode)
+            column.frombytes(view)
+            column.byteswap()
+            return column
+        column = view.cast(typecode)
+        self._views.append(column)
+        return column
+    
+    def _load(self):
+        if len(self._mmap) < SNAPSHOT_HEADER.size:
+            raise ValueError(f"不是有效的快照文件: {self.snapshot_path}")
+        magic, count, names_len, root_len, self.digest_size, self.created = \
+            SNAPSHOT_HEADER.unpack_from(self._mmap)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"不是有效的快照文件: {self.snapshot_path}")
+        pos = SNAPSHOT_HEADER.size
+        self.root = bytes(self._mmap[pos:pos + root_len]).decode("utf-8", self.ENCODING_ERRORS)
+        pos = _align8(pos + root_len)
+        self.offsets = self._view(pos, (count + 1) * 8, "Q")
+        pos = _align8(pos + (count + 1) * 8)
+        for name, typecode in SNAPSHOT_COLUMNS:
+            size = count * array(typecode).itemsize
+            setattr(self, name, self._view(pos, size, typecode))
+            pos = _align8(pos + size)
+        self.names = self._view(pos, names_len)
+        pos = _align8(pos + names_len)
+        self.digests = self._view(pos, count * self.digest_size) if self.digest_size else None
+        self.is_sorted = True
+    
+    def add(self, rel_path, record):
+        raise TypeError("快照是只读的")
+    
+    def key(self, i):
+        return bytes(self.names[self.offsets[i]:self.offsets[i + 1]])
+    
+    def name(self, i):
+        return self.key(i).decode("utf-8", self.ENCODING_ERRORS)
+    
+    def describe(self):
+        created = datetime.datetime.fromtimestamp(self.created).strftime("%Y-%m-%d %H:%M:%S")
+        digests = "含哈希" if self.has_digests else "不含哈希"
+        return f"{self.root}（{created} 的快照, {len(self)} 个文件, {digests}）"
+    
+    def close(self):
+        """释放内存映射；之后不能再访问各列"""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+
+# ----------------------
+# 分类复制
+# ----------------------
+COPY_MODE_COPY = "copy"  # 完整复制（优先 reflink / copy_file_range）
+COPY_MODE_HARDLINK = "hardlink"  # 硬链接，不在同一磁盘时退回复制
+COPY_MODE_SYMLINK = "symlink"  # 符号链接，只引用源文件
+COPY_MODE_LABELS = {
+    COPY_MODE_COPY: "复制文件",
+    COPY_MODE_HARDLINK: "硬链接（同一磁盘）",
+    COPY_MODE_SYMLINK: "符号链接",
+}
+
+# Linux FICLONE ioctl，在 Btrfs/XFS 等文件系统上实现写时复制的 reflink
+FICLONE = 0x40049409
+# copy_file_range 单次调用复制的最大字节数，同时也是进度更新的粒度
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+DEFAULT_COPY_WORKERS = 8
+# 这些错误表示当前文件系统不支持某种快速复制方式，应改用下一种方式
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EPERM,
+                      getattr(errno, "EOPNOTSUPP", errno.EINVAL),
+                      getattr(errno, "ENOTSUP", errno.EINVAL),
+                      getattr(errno, "ENOTTY", errno.EINVAL)}
+# 硬链接的 EPERM 通常是真正的权限问题（例如 Linux 的 protected_hardlinks），按错误报告，不改用复制
+HARDLINK_UNSUPPORTED_ERRNOS = UNSUPPORTED_ERRNOS - {errno.EPERM}
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class CopyEngine:
+    """多线程复制引擎，按 mode 选择复制方式并统计已复制的字节数
+    
+    复制模式下依次尝试 reflink、copy_file_range 和 shutil.copy2；
+    某个源文件夹上不支持的方式失败一次后不再尝试。
+    """
+    
+    def __init__(self, mode=COPY_MODE_COPY, workers=DEFAULT_COPY_WORKERS, cancel_event=None,
+                 resume_event=None):
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        self.resume_event = resume_event
+        self.bytes_done = 0
+        self.files_done = 0
+        self.stats = {"reflink": 0, "copy_file_range": 0, "copy": 0, "hardlink": 0, "symlink": 0}
+        self.completed = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # 源文件夹 -> 不支持的快速复制方式
+        self._unsupported = {}
+    
+    def _halt(self):
+        """当前线程的复制循环应检查的停止信号: copy_all 的工作线程中为该次调用的 _StopSignal"""
+        return getattr(self._local, "halt", self.cancel_event)
+    
+    def _call(self, halt, task):
+        self._local.halt = halt
+        return self.copy_file(*task)
+    
+    def _add_bytes(self, n):
+        with self._lock:
+            self.bytes_done += n
+    
+    def _finish(self, method, remaining):
+        with self._lock:
+            self.stats[method] += 1
+            self.files_done += 1
+            self.bytes_done += remaining
+    
+    def _supported(self, source, method):
+        return method not in self._unsupported.get(source, ())
+    
+    def _mark_unsupported(self, source, method):
+        with self._lock:
+            self._unsupported.setdefault(source, set()).add(method)
+    
+    def _reflink(self, src, dst):
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    
+    def _copy_file_range(self, src, dst, size):
+        copied = 0
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            while copied < size:
+                wait_while_paused(self._halt(), self.resume_event)
+                n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(COPY_CHUNK_SIZE, size - copied))
+                if n == 0:
+                    break
+                copied += n
+                self._add_bytes(n)
+        return copied
+    
+    def copy_file(self, src, dst, size, source=None):
+        """复制单个文件，返回实际使用的方式"""
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if self.mode == COPY_MODE_SYMLINK:
+            self._link_over(os.symlink, os.path.abspath(src), dst)
+            self._finish("symlink", size)
+            return "symlink"
+        if self.mode == COPY_MODE_HARDLINK and self._supported(source, "hardlink"):
+            try:
+                self._link_over(os.link, src, dst)
+                self._finish("hardlink", size)
+                return "hardlink"
+            except OSError as e:
+                if e.errno not in HARDLINK_UNSUPPORTED_ERRNOS:
+                    raise
+                self._mark_unsupported(source, "hardlink")
+        
+        if os.path.islink(dst) or (os.path.exists(dst) and os.path.samefile(src, dst)):
+            # 以前用链接方式输出的文件: 先删除链接，否则截断目标时会连同源文件一起清空
+            os.unlink(dst)
+        if fcntl is not None and sys.platform.startswith("linux") and self._supported(source, "reflink"):
+            try:
+                self._reflink(src, dst)
+                shutil.copystat(src, dst)
+                self._finish("reflink", size)
+                return "reflink"
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                self._mark_unsupported(source, "reflink")
+        
+        if hasattr(os, "copy_file_range") and self._supported(source, "copy_file_range"):
+            copied = 0
+            try:
+                copied = self._copy_file_range(src, dst, size)
+                shutil.copystat(src, dst)
+                self._finish("copy_file_range", size - copied)
+                return "copy_file_range"
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                self._mark_unsupported(source, "copy_file_range")
+                self._add_bytes(-copied)
+        
+        # shutil.copy2 在 Linux 上使用 sendfile，在 macOS 上使用 fcopyfile
+        shutil.copy2(src, dst)
+        self._finish("copy", size)
+        return "copy"
+    
+    @staticmethod
+    def _link_over(make_link, target, dst):
+        """在临时名称上创建链接再替换 dst，目标位置已有文件时与复制一样直接覆盖
+        
+        增量模式下目标位置可能留有清单中没有的文件（上次失败的运行或更早的输出），
+        直接创建链接会因 EEXIST 失败。
+        """
+        tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.link"
+        try:
+            make_link(target, tmp)
+            os.replace(tmp, dst)
+        finally:
+            # dst 已经是指向同一 inode 的硬链接时 rename 什么也不做，临时名称仍然存在
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+    
+    def copy_all(self, tasks, on_progress=None, on_error=None, on_done=None):
+        """并发执行复制任务
+        
+        tasks 为 (源路径, 目标路径, 大小, 源文件夹) 的列表；on_progress(已复制字节, 总字节)
+        按固定频率调用，on_error(任务, 异常) 在单个文件复制失败时调用，
+        on_done(任务) 在单个文件复制完成时调用。回调都在调用 copy_all 的线程中执行。
+        提前结束（例如回调出错）时只通过本次调用自己的停止信号让进行中的复制退出，不影响 cancel_event。
+        """
+        stop = threading.Event()
+        halt = _StopSignal(self.cancel_event, stop)
+        total_bytes = sum(task[2] for task in tasks)
+        tasks = iter(tasks)
+        pending = set()
+        max_pending = self.workers * 4
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                exhausted = False
+                while pending or not exhausted:
+                    wait_while_paused(self.cancel_event, self.resume_event)
+                    while not exhausted and len(pending) < max_pending:
+                        task = next(tasks, None)
+                        if task is None:
+                            exhausted = True
+                            break
+                        future = executor.submit(self._call, halt, task)
+                        future.task = task
+                        pending.add(future)
+                    if self.cancel_event.is_set():
+                        raise CompareCancelled()
+                    if not pending:
+                        continue
+                    done, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        error = future.exception()
+                        if isinstance(error, CompareCancelled):
+                            raise error
+                        if error is None:
+                            self.completed.add(future.task[1])
+                            if on_done is not None:
+                                on_done(future.task)
+                        elif on_error is not None:
+                            on_error(future.task, error)
+                    if on_progress is not None:
+                        on_progress(self.bytes_done, total_bytes)
+            except BaseException:
+                stop.set()
+                for future in pending:
+                    future.cancel()
+                raise
+        return total_bytes
+    
+    def unfinished(self, tasks):
+        """返回未成功完成的任务（失败、取消或尚未执行）"""
+        return [task for task in tasks if task[1] not in self.completed]
+    
+    def summary(self):
+        return ", ".join(f"{name} {count} 个" for name, count in self.stats.items() if count)
+
+
+MANIFEST_NAME = ".folder_compare_manifest.json"
+# 分类复制时每个类别对应的子目录（OPTIONAL_CATEGORIES 中的只在有对应分组时创建）
+COPY_BUCKET_DIRS = {
+    "folder1_unique": "文件夹1独有的文件",
+    "folder2_unique": "文件夹2独有的文件",
+    "common": "共有的文件",
+    "renamed": "重命名或移动的文件",
+}
+
+
+class CopyManifest:
+    """增量输出目录中的复制清单，记录上一次运行复制的每个文件
+    
+    files: {目标相对路径: [源路径, 大小, 修改时间]}。源路径、大小和修改时间都与
+    清单一致的文件视为未变化，无需再次复制。
+    """
+    
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.files = {}
+    
+    def load(self):
+        """读取清单，不存在或损坏时视为空清单"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+        except (OSError, ValueError):
+            self.files = {}
+        return self
+    
+    def is_unchanged(self, dst_rel, file):
+        return self.files.get(dst_rel) == [file.path, file.size, file.mtime]
+    
+    def save(self, files):
+        """原子地写入新清单"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "files": files}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+
+# ----------------------
+# 检查点
+# ----------------------
+# 检查点写入磁盘的最长间隔（秒），中断时最多损失这段时间内的进度
+CHECKPOINT_INTERVAL = 10.0
+
+
+def default_checkpoint_dir():
+    """返回保存检查点的目录（与哈希缓存相邻）"""
+    return os.path.join(os.path.dirname(default_cache_path()), "checkpoints")
+
+
+class RunCheckpoint:
+    """长时间运行的比较的检查点，用于中断后从上次停下的地方继续
+    
+    以 JSON Lines 追加记录: 第一行为输出目录和时间戳，之后是已得出结论的共有文件
+    （两侧的路径、大小和修改时间以及内容状态）和已复制完成的文件。
+    继续时文件签名一致的记录直接沿用，不再比较或复制；运行成功结束后删除检查点。
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.output_dir = None
+        self.timestamp = None
+        self.resumed = False
+        # (路径1, 路径2) -> [大小1, 修改时间1, 大小2, 修改时间2, 状态]
+        self.statuses = {}
+        # 目标相对路径 -> [源路径, 大小, 修改时间]
+        self.copied = {}
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self.file = None
+    
+    @staticmethod
+    def path_for(directory, *options):
+        """按比较的文件夹和影响结果的选项确定检查点文件名"""
+        key = json.dumps(options, ensure_ascii=False, default=str)
+        return os.path.join(directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jsonl")
+    
+    def load(self):
+        """读取已有的检查点，返回是否找到；末尾写了一半的行会被忽略"""
+        try:
+            f = open(self.path, "r", encoding="utf-8")
+        except OSError:
+            return False
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                kind = entry.get("t")
+                if kind == "run":
+                    self.output_dir = entry.get("output_dir")
+                    self.timestamp = entry.get("timestamp")
+                elif kind == "status":
+                    self.statuses[(entry["p1"], entry["p2"])] = entry["sig"]
+                elif kind == "copied":
+                    self.copied[entry["dst"]] = entry["sig"]
+        self.resumed = True
+        return True
+    
+    def start(self, output_dir, timestamp):
+        """打开检查点文件；新的运行先写入输出目录和时间戳"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, "a" if self.resumed else "w", encoding="utf-8")
+        if not self.resumed:
+            self._write({"t": "run", "output_dir": output_dir, "timestamp": timestamp})
+            self.flush()
+    
+    def status(self, file1, file2):
+        """返回检查点中记录的内容状态，文件已变化或没有记录时返回 None"""
+        sig = self.statuses.get((file1.path, file2.path))
+        if sig is None or sig[:4] != [file1.size, file1.mtime, file2.size, file2.mtime]:
+            return None
+        return sig[4]
+    
+    def record_status(self, file1, file2, status):
+        if status == STATUS_ERROR or self.status(file1, file2) == status:
+            return
+        self._write({"t": "status", "p1": file1.path, "p2": file2.path,
+                     "sig": [file1.size, file1.mtime, file2.size, file2.mtime, status]})
+    
+    def is_copied(self, dst_rel, file):
+        return self.copied.get(dst_rel) == [file.path, file.size, file.mtime]
+    
+    def record_copied(self, dst_rel, file):
+        self._write({"t": "copied", "dst": dst_rel, "sig": [file.path, file.size, file.mtime]})
+    
+    def _write(self, entry):
+        if self.file is None:
+            return
+        self._pending.append(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        if time.monotonic() - self._last_flush >= CHECKPOINT_INTERVAL:
+            self.flush()
+    
+    def flush(self):
+        if self.file is None:
+            return
+        self.file.writelines(self._pending)
+        self._pending.clear()
+        self.file.flush()
+        self._last_flush = time.monotonic()
+    
+    def close(self):
+        """写入剩余记录并关闭，保留检查点供下次继续"""
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+    
+    def discard(self):
+        """运行已完成，删除检查点"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+# ----------------------
+# 性能统计
+# ----------------------
+PHASE_LABELS = {
+    "scan": "扫描",
+    "stat": "stat 调用（累计）",
+    "diff": "比较",
+    "hash": "内容读取/哈希（线程累计）",
+    "rename": "重命名检测",
+    "copy": "分类复制",
+    "report": "写报告",
+    "gui": "界面填充",
+}
+PHASE_ORDER = {name: i for i, name in enumerate(PHASE_LABELS)}
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss():
+    """返回本进程的峰值常驻内存（字节），无法获取时返回 None"""
+    if sys.platform.startswith("linux"):
+        # ru_maxrss 在 fork + exec 后沿用父进程的峰值，VmHWM 在 exec 时重新计算，只反映本进程
+        try:
+            with open("/proc/self/status", "rb") as f:
+                for line in f:
+                    if line.startswith(b"VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 上单位为 KB，macOS 上为字节
+        return peak if sys.platform == "darwin" else peak * 1024
+    if os.name == "nt":
+        from ctypes import wintypes
+        
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        try:
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.PeakWorkingSetSize
+        except (AttributeError, OSError):
+            pass
+    return None
+
+
+class PerfStats:
+    """按阶段累计耗时（秒）和计数，汇总为可导出的字典
+    
+    阶段之间可以重叠: 边扫描边比较时扫描和比较同时进行；
+    stat 和 hash 为所有线程的累计时间，可能超过总耗时。
+    """
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+    
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+    
+    def set(self, name, value):
+        self.counters[name] = value
+    
+    def to_dict(self):
+        wall = time.perf_counter() - self.started
+        counters = dict(self.counters)
+        rates = {"files_per_second": counters.get("files", 0) / wall if wall > 0 else 0.0}
+        if self.phases.get("diff") and counters.get("hash_bytes"):
+            rates["hash_bytes_per_second"] = counters["hash_bytes"] / self.phases["diff"]
+        if self.phases.get("copy") and counters.get("copy_bytes"):
+            rates["copy_bytes_per_second"] = counters["copy_bytes"] / self.phases["copy"]
+        return {
+            "wall_seconds": round(wall, 6),
+            "phases": {name: round(self.phases[name], 6)
+                       for name in sorted(self.phases, key=PHASE_ORDER.get)},
+            "counters": counters,
+            "rates": {name: round(rate, 3) for name, rate in rates.items()},
+            "peak_rss_bytes": peak_rss(),
+        }
+
+
+def format_perf(perf):
+    """把 PerfStats.to_dict() 的结果格式化为几行文字，用于日志和文本报告"""
+    phases = ", ".join(f"{PHASE_LABELS.get(name, name)} {seconds:.2f}s"
+                       for name, seconds in perf["phases"].items())
+    lines = [f"耗时: 总计 {perf['wall_seconds']:.2f}s" + (f" ({phases})" if phases else "")]
+    rates = perf["rates"]
+    throughput = [f"{rates['files_per_second']:.0f} 个文件/秒"]
+    if "hash_bytes_per_second" in rates:
+        throughput.append(f"内容读取 {format_size(rates['hash_bytes_per_second'])}/s")
+    if "copy_bytes_per_second" in rates:
+        throughput.append(f"复制 {format_size(rates['copy_bytes_per_second'])}/s")
+    lines.append("吞吐: " + ", ".join(throughput))
+    counters = perf["counters"]
+    line = f"系统调用: scandir {counters.get('scandir', 0)} 次, stat {counters.get('stat', 0)} 次"
+    if perf["peak_rss_bytes"]:
+        line += f"; 峰值内存: {format_size(perf['peak_rss_bytes'])}"
+    lines.append(line)
+    return lines
+
+
+# 结果批量发送: 每隔 BATCH_INTERVAL 秒或累积 BATCH_MAX_SIZE 条记录发送一次
+BATCH_INTERVAL = 0.05
+BATCH_MAX_SIZE = 5000
+# 进度更新的最小间隔（秒）
+PROGRESS_INTERVAL = 0.1
+
+# ----------------------
+# 报告
+# ----------------------
+REPORT_FORMATS = ("txt", "csv", "jsonl")
+# 报告写入缓冲区大小
+REPORT_BUFFER_SIZE = 1024 * 1024
+CATEGORY_ORDER = ("folder1_unique", "folder2_unique", "common", "renamed")
+CATEGORY_LABELS = {
+    "folder1_unique": "只在文件夹1中的文件",
+    "folder2_unique": "只在文件夹2中的文件",
+    "common": "两个文件夹都有的文件",
+    "renamed": "重命名或移动的文件",
+}
+# 只在开启重命名检测并且有结果时才出现在报告和输出目录中的类别
+OPTIONAL_CATEGORIES = ("renamed",)
+DIFFERENT_STATUSES = (STATUS_SIZE_DIFFERS, STATUS_CONTENT_DIFFERS, STATUS_ERROR)
+
+
+def format_mtime(mtime):
+    return datetime.datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ReportWriter:
+    """流式报告写入器: 比较结果逐条写入带缓冲的文件，无需在内存中保留完整列表"""
+    extension = None
+    
+    def __init__(self, path, folder1, folder2, ordered=True, presorted=True):
+        self.path = path
+        self.folder1 = folder1
+        self.folder2 = folder2
+        # ordered: 结果按类别依次到达；presorted: 同一类别内的结果按名称顺序到达
+        self.ordered = ordered
+        self.presorted = presorted
+        self.file = open(path, "w", encoding="utf-8", newline="", buffering=REPORT_BUFFER_SIZE)
+        self.write_header()
+    
+    def write_header(self):
+        pass
+    
+    def write(self, record):
+        raise NotImplementedError
+    
+    def close(self, summary):
+        """写入统计信息并关闭文件"""
+        self.file.close()
+
+
+class TextReportWriter(ReportWriter):
+    """文本报告，格式与界面中的三个分类一致
+    
+    结果按类别顺序到达时直接写入；各类别交错到达时（流式归并），
+    每个类别先写入临时文件，关闭时再按类别拼接。类别内的结果未按名称到达时
+    （边扫描边比较），关闭时在内存中按名称排序该类别。
+    """
+    extension = "txt"
+    
+    def write_header(self):
+        self.file.write("文件夹比较结果报告\n")
+        self.file.write("=" * 60 + "\n")
+        self.file.write(f"生成时间: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        self.file.write(f"文件夹1: {self.folder1}\n")
+        self.file.write(f"文件夹2: {self.folder2}\n")
+        self.file.write("=" * 60 + "\n")
+        # 已写出标题的分类数，有序时结果按 CATEGORY_ORDER 的顺序到达
+        self.sections = 0
+        self.section_empty = True
+        self.spools = None
+        if not self.ordered:
+            self.spools = {category: tempfile.TemporaryFile("w+", encoding="utf-8")
+                           for category in CATEGORY_ORDER}
+    
+    def start_section(self, category):
+        """写出直到 category 为止的分类标题，跳过的分类标记为 (无)"""
+        target = CATEGORY_ORDER.index(category) + 1
+        while self.sections < target:
+            if self.sections and self.section_empty:
+                self.file.write("  (无)\n")
+            self.file.write(f"\n{CATEGORY_LABELS[CATEGORY_ORDER[self.sections]]}:\n")
+            self.sections += 1
+            self.section_empty = True
+    
+    def format_line(self, record):
+        if record.category == "common":
+            file1, file2 = record.file1, record.file2
+            line = f"  {record.filename}  ({format_size(file1.size)}"
+            if file1.size != file2.size:
+                line += f" / {format_size(file2.size)}"
+            line += f", {format_mtime(file1.mtime)})"
+            if record.status in DIFFERENT_STATUSES:
+                line += f"  [{STATUS_LABELS[record.status]}]"
+        else:
+            file = record.file1 or record.file2
+            line = f"  {record.filename}  ({format_size(file.size)}, {format_mtime(file.mtime)})"
+        return line + "\n"
+    
+    def write(self, record):
+        if self.spools is not None:
+            line = self.format_line(record)
+            if not self.presorted:
+                # 文件名中不会出现 NUL，用作排序键与内容的分隔符
+                line = f"{record.filename}\0{line}"
+            self.spools[record.category].write(line)
+            return
+        self.start_section(record.category)
+        self.section_empty = False
+        self.file.write(self.format_line(record))
+    
+    def close(self, summary):
+        if self.spools is not None:
+            for category in CATEGORY_ORDER:
+                spool = self.spools[category]
+                if category in OPTIONAL_CATEGORIES and not spool.tell():
+                    spool.close()
+                    continue
+                self.start_section(category)
+                if spool.tell():
+                    spool.seek(0)
+                    if self.presorted:
+                        shutil.copyfileobj(spool, self.file)
+                    else:
+                        for line in sorted(spool, key=lambda line: line.split("\0", 1)[0]):
+                            self.file.write(line.split("\0", 1)[1])
+                    self.section_empty = False
+                spool.close()
+            self.spools = None
+        self.start_section("common")
+        if self.section_empty:
+            self.file.write("  (无)\n")
+        counts = summary["counts"]
+        statuses = summary["status_counts"]
+        self.file.write("\n" + "=" * 60 + "\n")
+        self.file.write("统计:\n")
+        renamed = counts.get("renamed", 0)
+        self.file.write(f"文件夹1中的文件总数: {counts['folder1_unique'] + counts['common'] + renamed}\n")
+        self.file.write(f"文件夹2中的文件总数: {counts['folder2_unique'] + counts['common'] + renamed}\n")
+        self.file.write(f"共同文件数: {counts['common']}\n")
+        self.file.write(f"差异文件数: {counts['folder1_unique'] + counts['folder2_unique']}\n")
+        if summary.get("detect_renames"):
+            self.file.write(f"重命名或移动的文件数: {renamed}\n")
+        self.file.write(f"大小不同的共同文件数: {statuses.get(STATUS_SIZE_DIFFERS, 0)}\n")
+        if summary["compare_content"]:
+            self.file.write(f"内容不同的共同文件数: {statuses.get(STATUS_CONTENT_DIFFERS, 0)}\n")
+            self.file.write(f"无法读取的共同文件数: {statuses.get(STATUS_ERROR, 0)}\n")
+        if summary.get("perf"):
+            self.file.write("\n性能统计:\n")
+            for line in format_perf(summary["perf"]):
+                self.file.write(f"{line}\n")
+        super().close(summary)
+
+
+class CsvReportWriter(ReportWriter):
+    """CSV 报告，每个文件一行"""
+    extension = "csv"
+    COLUMNS = ["category", "filename", "size1", "size2", "mtime1", "mtime2", "status", "path1", "path2"]
+    
+    def write_header(self):
+        # 带 BOM，Excel 可以直接识别 UTF-8
+        self.file.write("\ufeff")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.COLUMNS)
+    
+    def write(self, record):
+        file1, file2 = record.file1, record.file2
+        self.writer.writerow([
+            record.category, record.filename,
+            file1.size if file1 else "", file2.size if file2 else "",
+            format_mtime(file1.mtime) if file1 else "", format_mtime(file2.mtime) if file2 else "",
+            record.status or "",
+            file1.path if file1 else "", file2.path if file2 else "",
+        ])
+
+
+class JsonlReportWriter(ReportWriter):
+    """JSON Lines 报告: 每行一个 JSON 对象，最后一行为统计信息（type 为 summary）"""
+    extension = "jsonl"
+    
+    def write_header(self):
+        self.file.write(json.dumps({"type": "header", "folder1": self.folder1, "folder2": self.folder2,
+                                    "generated": datetime.datetime.now().isoformat(timespec="seconds")},
+                                   ensure_ascii=False) + "\n")
+    
+    def write(self, record):
+        item = {"type": "file", "category": record.category, "filename": record.filename}
+        for side, file in (("1", record.file1), ("2", record.file2)):
+            if file is not None:
+                item["path" + side] = file.path
+                item["size" + side] = file.size
+                item["mtime" + side] = file.mtime
+        if record.status is not None:
+            item["status"] = record.status
+        self.file.write(json.dumps(item, ensure_ascii=False) + "\n")
+    
+    def close(self, summary):
+        self.file.write(json.dumps({"type": "summary", "counts": summary["counts"],
+                                    "status_counts": summary["status_counts"],
+                                    "perf": summary.get("perf")},
+                                   ensure_ascii=False) + "\n")
+        super().close(summary)
+
+
+REPORT_WRITERS = {writer.extension: writer for writer in
+                  (TextReportWriter, CsvReportWriter, JsonlReportWriter)}
+
+
+# ----------------------
+# 实时监视
+# ----------------------
+# 最后一个事件之后等待多久再处理（文件可能仍在写入），以及事件持续不断时最多推迟多久
+WATCH_SETTLE_TIME = 0.5
+WATCH_MAX_DELAY = 5.0
+# 没有 inotify 时轮询的间隔（秒），每次轮询只 stat 文件，不读取内容
+WATCH_POLL_INTERVAL = 5.0
+
+# linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+# struct inotify_event: wd, mask, cookie, len，之后是 len 字节以 NUL 补齐的文件名
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_READ_SIZE = 64 * 1024
+
+
+class InotifyWatcher:
+    """通过 ctypes 直接调用 Linux inotify 监视目录树，不需要第三方库
+    
+    roots 中为 None 的一侧（快照）不监视。read() 返回 [(side, 相对路径, 是否为目录)]:
+    目录事件（新建、删除、移入移出、事件队列溢出）需要重新扫描该子树，其余只涉及单个文件。
+    新建或移入的子目录会自动加入监视，深度限制和忽略规则与 walk_files 相同，被忽略的目录不监视。
+    """
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+            | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    description = "inotify"
+    
+    def __init__(self, roots, recursive=False, follow_symlinks=True, max_depth=None, onerror=None,
+                 ignore=None):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.fd = fd
+        self.roots = roots
+        self.follow_symlinks = follow_symlinks
+        self.max_depth = max_depth if recursive else 0
+        self.onerror = onerror
+        self.ignore = ignore if ignore is not None and ignore.has_patterns else None
+        # 监视描述符 -> (side, 相对目录)，以及每侧 相对目录 -> 监视描述符
+        self.watches = {}
+        self.dirs = tuple({} for _ in roots)
+        try:
+            for side, root in enumerate(roots):
+                if root is not None:
+                    self.add_tree(side, "")
+        except BaseException:
+            self.close()
+            raise
+    
+    def depth(self, rel_dir):
+        """rel_dir 中的文件在 walk_files 中的深度"""
+        return rel_dir.count(os.sep) + 1 if rel_dir else 0
+    
+    def add_tree(self, side, rel_dir):
+        """为 rel_dir 及其下不超过最大深度的所有子目录添加监视"""
+        mask = self.MASK if self.follow_symlinks else self.MASK | IN_DONT_FOLLOW
+        stack = [rel_dir]
+        while stack:
+            rel = stack.pop()
+            path = os.path.join(self.roots[side], rel) if rel else self.roots[side]
+            wd = self._add_watch(self.fd, os.fsencode(path), mask)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    raise OSError(err, "inotify 监视数已达上限（fs.inotify.max_user_watches）")
+                error = OSError(err, os.strerror(err), path)
+                if rel == rel_dir:
+                    raise error
+                if self.onerror is not None:
+                    self.onerror(error)
+                continue
+            if self.watches.get(wd, (side, rel)) != (side, rel):
+                # 同一目录已经通过其他路径（符号链接）监视，不再重复进入，也避免链接成环
+                continue
+            self.watches[wd] = (side, rel)
+            self.dirs[side][rel] = wd
+            if self.max_depth is not None and self.depth(rel) >= self.max_depth:
+                continue
+            try:
+                with os.scandir(path) as it:
+                    entries = list(it)
+            except OSError as e:
+                if self.onerror is not None:
+                    self.onerror(e)
+                continue
+            for entry in entries:
+                try:
+                    if not self.follow_symlinks and entry.is_symlink():
+                        continue
+                    if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                        child = os.path.join(rel, entry.name) if rel else entry.name
+                        if self.ignore is None or not self.ignore.ignored(child, entry.name, True):
+                            stack.append(child)
+                except OSError:
+                    pass
+    
+    def remove_tree(self, side, rel_dir):
+        """移除 rel_dir 及其子目录的监视（目录被删除或移走）"""
+        prefix = rel_dir + os.sep
+        for rel in [rel for rel in self.dirs[side] if rel == rel_dir or rel.startswith(prefix)]:
+            wd = self.dirs[side].pop(rel)
+            self.watches.pop(wd, None)
+            self._rm_watch(self.fd, wd)
+    
+    def read(self, timeout):
+        """等待最多 timeout 秒，返回这段时间内的事件"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, INOTIFY_READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                events.extend(self.translate(wd, mask, name))
+        return events
+    
+    def translate(self, wd, mask, name):
+        """把一个 inotify 事件转换为 [(side, 相对路径, 是否为目录)]"""
+        if mask & IN_Q_OVERFLOW:
+            # 事件队列溢出，丢失了哪些变化无从得知，重新扫描整棵树
+            return [(side, "", True) for side, root in enumerate(self.roots) if root is not None]
+        if mask & IN_IGNORED:
+            location = self.watches.pop(wd, None)
+            if location is not None and self.dirs[location[0]].get(location[1]) == wd:
+                del self.dirs[location[0]][location[1]]
+            return []
+        location = self.watches.get(wd)
+        if location is None:
+            return []
+        side, rel_dir = location
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # 子目录的删除和移动由上级目录的事件处理，这里只关心根目录本身
+            return [] if rel_dir else [(side, "", True)]
+        rel_path = os.path.join(rel_dir, name) if rel_dir else name
+        if self.ignore is not None and self.ignore.ignored(rel_path, name, bool(mask & IN_ISDIR)):
+            return []
+        if not mask & IN_ISDIR:
+            return [(side, rel_path, False)]
+        if self.max_depth is not None and self.depth(rel_dir) >= self.max_depth:
+            return []
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            self.remove_tree(side, rel_path)
+        elif mask & (IN_CREATE | IN_MOVED_TO):
+            try:
+                self.add_tree(side, rel_path)
+            except OSError as e:
+                if self.onerror is not None:
+                    self.onerror(e)
+        else:
+            return []
+        return [(side, rel_path, True)]
+    
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """没有 inotify 时的退路: 每隔 interval 秒把每一侧整棵树重新 stat 一遍
+    
+    与 InotifyWatcher 接口相同，只产出根目录的目录事件，由调用方找出变化的文件。
+    """
+    
+    def __init__(self, roots, interval=WATCH_POLL_INTERVAL):
+        self.sides = [side for side, root in enumerate(roots) if root is not None]
+        self.interval = interval
+        self.next_poll = time.monotonic() + interval
+        self.description = f"每 {interval:g} 秒轮询"
+    
+    def read(self, timeout):
+        remaining = self.next_poll - time.monotonic()
+        if remaining > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(remaining, 0))
+        self.next_poll = time.monotonic() + self.interval
+        return [(side, "", True) for side in self.sides]
+    
+    def close(self):
+        pass
+
+
+class LiveComparison:
+    """监视模式下的比较状态，由首次比较发送的结果建立
+    
+    保存每侧 相对路径 -> FileRecord、共有文件的内容状态和重命名配对。文件变化时只重新归类
+    受影响的路径（变化的文件、另一侧的同名文件、原来与之配对的文件），不重新扫描文件夹。
+    roots 中为 None 的一侧是快照，不会变化。
+    """
+    
+    def __init__(self, roots, detect_renames=False):
+        self.roots = roots
+        self.files = ({}, {})
+        self.statuses = {}
+        # 重命名配对: 相对路径 -> 另一侧的相对路径
+        self.renamed = ({}, {})
+        # 检测重命名时按大小查找候选文件: 大小 -> {相对路径}
+        self.by_size = ({}, {}) if detect_renames else None
+    
+    def add_record(self, record):
+        """载入首次比较发送的一条结果"""
+        if record.category == "renamed":
+            name1, name2 = self.split_rename(record)
+            self.renamed[0][name1] = name2
+            self.renamed[1][name2] = name1
+            self._put(0, name1, record.file1)
+            self._put(1, name2, record.file2)
+            return
+        if record.file1 is not None:
+            self._put(0, record.filename, record.file1)
+        if record.file2 is not None:
+            self._put(1, record.filename, record.file2)
+        if record.category == "common":
+            self.statuses[record.filename] = record.status
+    
+    def split_rename(self, record):
+        """从 "原路径 → 新路径" 中拆出两侧的相对路径；路径本身可能含有分隔符，按实际路径定位"""
+        if self.roots[0] is not None:
+            name1 = os.path.relpath(record.file1.path, self.roots[0])
+            return name1, record.filename[len(name1) + len(RENAME_SEPARATOR):]
+        name2 = os.path.relpath(record.file2.path, self.roots[1])
+        return record.filename[:-len(name2) - len(RENAME_SEPARATOR)], name2
+    
+    def has_digests(self, side):
+        """快照一侧是否带有保存时的哈希"""
+        return any(record.digest is not None for record in self.files[side].values())
+    
+    def _put(self, side, rel_path, record):
+        old = self.files[side].get(rel_path)
+        if self.by_size is not None:
+            if old is not None:
+                names = self.by_size[side][old.size]
+                names.discard(rel_path)
+                if not names:
+                    del self.by_size[side][old.size]
+            if record is not None:
+                self.by_size[side].setdefault(record.size, set()).add(rel_path)
+        if record is None:
+            self.files[side].pop(rel_path, None)
+        else:
+            self.files[side][rel_path] = record
+    
+    @staticmethod
+    def same_file(old, new):
+        """大小、修改时间、inode 和权限位都没变时视为未变化"""
+        if old is None or new is None:
+            return old is new
+        return old[1:5] == new[1:5]
+    
+    def is_unique(self, side, rel_path):
+        return rel_path not in self.files[1 - side] and rel_path not in self.renamed[side]
+    
+    def row(self, side, rel_path):
+        """rel_path 当前所在的结果行（CompareRecord），文件不存在时返回 None"""
+        files = self.files
+        record = files[side].get(rel_path)
+        if record is None:
+            return None
+        partner = self.renamed[side].get(rel_path)
+        if partner is not None:
+            name1, name2 = (rel_path, partner) if side == 0 else (partner, rel_path)
+            return CompareRecord("renamed", f"{name1}{RENAME_SEPARATOR}{name2}",
+                                 files[0][name1], files[1][name2], STATUS_SAME)
+        other = files[1 - side].get(rel_path)
+        if other is not None:
+            file1, file2 = (record, other) if side == 0 else (other, record)
+            return CompareRecord("common", rel_path, file1, file2, self.statuses.get(rel_path))
+        if side == 0:
+            return CompareRecord("folder1_unique", rel_path, record, None)
+        return CompareRecord("folder2_unique", rel_path, None, record)
+    
+    def _collect(self, rows, side, rel_path):
+        row = self.row(side, rel_path)
+        if row is not None:
+            rows[(row.category, row.filename)] = row
+    
+    def update(self, changes, common_statuses, comparer=None):
+        """应用 {(side, 相对路径): FileRecord 或 None}，返回 (受影响的旧结果行, 新的结果行)
+        
+        新结果行中类别和名称与旧结果行相同的是原地更新，旧结果行中其余的需要撤下。
+        common_statuses 与 FolderComparator.common_statuses 相同，为变化后的共有文件重新确定状态；
+        comparer 不为 None 时在新出现的独有文件中检测重命名。
+        """
+        files = self.files
+        changes = {key: record for key, record in changes.items()
+                   if not self.same_file(files[key[0]].get(key[1]), record)}
+        if not changes:
+            return [], []
+        affected = set()
+        for side, rel_path in changes:
+            affected.add((side, rel_path))
+            affected.add((1 - side, rel_path))
+        for side, rel_path in list(affected):
+            partner = self.renamed[side].get(rel_path)
+            if partner is not None:
+                affected.add((1 - side, partner))
+        old_rows = {}
+        for side, rel_path in affected:
+            self._collect(old_rows, side, rel_path)
+        
+        # 拆开受影响的重命名配对，写入新的文件状态
+        for side, rel_path in affected:
+            partner = self.renamed[side].pop(rel_path, None)
+            if partner is not None:
+                self.renamed[1 - side].pop(partner, None)
+        for (side, rel_path), record in changes.items():
+            self._put(side, rel_path, record)
+        
+        # 重新归类: 两侧都有的重新比较，只剩一侧的成为独有文件（可能与另一侧配对为重命名）
+        common = sorted({rel_path for _, rel_path in affected
+                         if rel_path in files[0] and rel_path in files[1]})
+        for _, rel_path in affected:
+            if rel_path not in common:
+                self.statuses.pop(rel_path, None)
+        pairs = ((rel_path, files[0][rel_path], files[1][rel_path]) for rel_path in common)
+        for rel_path, status in common_statuses(pairs):
+            self.statuses[rel_path] = status
+        if comparer is not None:
+            unique = ([], [])
+            for side, rel_path in affected:
+                if rel_path in files[side] and self.is_unique(side, rel_path):
+                    unique[side].append(rel_path)
+            for name1, name2 in self.pair_renames(unique, comparer):
+                # 配对的另一方可能是之前就存在的独有文件，撤下它原来的行
+                for side, rel_path in ((0, name1), (1, name2)):
+                    if (side, rel_path) not in affected:
+                        self._collect(old_rows, side, rel_path)
+                        affected.add((side, rel_path))
+                self.renamed[0][name1] = name2
+                self.renamed[1][name2] = name1
+        
+        new_rows = {}
+        for side, rel_path in sorted(affected):
+            self._collect(new_rows, side, rel_path)
+        return list(old_rows.values()), list(new_rows.values())
+    
+    def pair_renames(self, unique, comparer):
+        """在 unique（每侧新成为独有的路径）与另一侧大小相同的独有文件之间检测重命名，
+        返回 [(文件夹1中的路径, 文件夹2中的路径)]，至少一方来自 unique"""
+        if not unique[0] and not unique[1]:
+            return []
+        files = self.files
+        indexes = (FileIndex(self.roots[0] or ""), FileIndex(self.roots[1] or ""))
+        for side in (0, 1):
+            names = set(unique[side])
+            for size in {files[1 - side][rel_path].size for rel_path in unique[1 - side]}:
+                if size:
+                    names.update(rel_path for rel_path in self.by_size[side].get(size, ())
+                                 if self.is_unique(side, rel_path))
+            for rel_path in sorted(names):
+                indexes[side].add(rel_path, files[side][rel_path])
+        new = (set(unique[0]), set(unique[1]))
+        pairs = []
+        for i, j in find_renames(indexes[0], range(len(indexes[0])), indexes[1], range(len(indexes[1])),
+                                 comparer):
+            name1, name2 = indexes[0].name(i), indexes[1].name(j)
+            if name1 in new[0] or name2 in new[1]:
+                pairs.append((name1, name2))
+        return pairs
+
+
+# ----------------------
+# 比较引擎
+# ----------------------
+def _ignore(*args):
+    pass
+
+
+class FolderComparator:
+    """比较两个文件夹，并按需保存报告和分类复制文件
+    
+    所有输出都通过回调传出，不依赖任何界面库:
+      log(消息, 颜色)、progress(当前, 总数, 状态)、
+      copy_progress(已复制字节, 总字节, 字节/秒)、on_records([CompareRecord, ...])、
+      on_changes([旧结果行], [新结果行])（监视模式）。
+    ignore 为 IgnoreRules 时，扫描、监视和载入快照时排除匹配的文件和目录。
+    比较结果按批次通过 on_records 流式产出，同时逐条写入 report_formats 指定格式的报告，
+    run() 结束时只返回计数汇总。watch 为 True 时 run() 完成后可调用 run_watch() 持续监视变化。
+    可以在其他线程中调用 cancel() 取消。
+    """
+    
+    def __init__(self, folder1, folder2, save_report=False, classify_files=False,
+                 recursive=False, follow_symlinks=True, max_depth=None, compare_content=False,
+                 workers=DEFAULT_WORKERS, io_limit=DEFAULT_IO_LIMIT, use_cache=True,
+                 copy_mode=COPY_MODE_COPY, copy_workers=DEFAULT_COPY_WORKERS,
+                 incremental_dir=None, remove_stale=True, output_root=None, report_formats=("txt",),
+                 sort_chunk=None, resume=False, checkpoint_dir=None, progressive=True, perf_json=None,
+                 detect_renames=False, watch=False, poll_interval=None, ignore=None, log=None, progress=None,
+                 copy_progress=None, on_records=None, on_changes=None):
+        self.folder1 = folder1
+        self.folder2 = folder2
+        self.save_report = save_report
+        self.classify_files = classify_files
+        self.recursive = recursive
+        self.follow_symlinks = follow_symlinks
+        self.max_depth = max_depth
+        self.compare_content = compare_content
+        self.workers = workers
+        self.io_limit = io_limit
+        self.use_cache = use_cache
+        self.copy_mode = copy_mode
+        self.copy_workers = copy_workers
+        self.incremental_dir = incremental_dir
+        self.remove_stale = remove_stale
+        # 非增量模式下，带时间戳的输出目录创建在 output_root 中
+        self.output_root = output_root or os.getcwd()
+        self.report_formats = [fmt for fmt in report_formats if fmt in REPORT_WRITERS] or ["txt"]
+        # 设置后使用外部排序 + 归并的流式比较，每侧内存中最多保留 sort_chunk 条记录
+        self.sort_chunk = sort_chunk
+        # 两侧都是文件夹且未使用外部排序时，同时扫描两侧并边扫描边输出结果
+        self.progressive = progressive
+        # 运行结束后把性能统计写入这个 JSON 文件
+        self.perf_json = perf_json
+        # 在两侧独有的文件中按大小和哈希配对内容相同的文件，作为 renamed 类别发送
+        self.detect_renames = detect_renames
+        # 比较完成后由 run_watch() 监视两侧的变化；poll_interval 不为 None 时不使用 inotify，按该间隔轮询
+        self.watch = watch
+        self.poll_interval = poll_interval
+        self.live = None
+        self.watcher = None
+        # 没有任何规则时按不使用忽略规则处理，扫描时不做额外判断
+        self.ignore = ignore or None
+        self.perf = PerfStats()
+        self._report_time = 0.0
+        # 比较内容或分类复制时写入检查点；resume 为 True 时从上次中断的检查点继续
+        self.resume = resume
+        self.checkpoint_dir = checkpoint_dir or default_checkpoint_dir()
+        self.checkpoint = None
+        self.log = log or _ignore
+        self.progress = progress or _ignore
+        self.copy_progress = copy_progress or _ignore
+        self.on_records = on_records or _ignore
+        self.on_changes = on_changes or _ignore
+        self.cancel_event = threading.Event()
+        # 清除时暂停，扫描、比较和复制都会在下一个检查位置等待
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+        self.syscalls = SyscallCounter()
+        self.output_dir = None
+        self.comparer = None
+        self.cache = None
+        self.processed = 0
+        self.reports = []
+        self.counts = dict.fromkeys(CATEGORY_ORDER, 0)
+        self.status_counts = {}
+        self._batch = []
+        self._last_flush = 0.0
+        self._last_progress = 0.0
+    
+    def emit_file(self, record):
+        """统计并写入报告，然后将文件信息加入批次，按时间或数量阈值批量发送"""
+        self.count_record(record)
+        if self.live is not None:
+            self.live.add_record(record)
+        if self.reports:
+            start = time.perf_counter()
+            for report in self.reports:
+                report.write(record)
+            self._report_time += time.perf_counter() - start
+        self._batch.append(record)
+        if len(self._batch) >= BATCH_MAX_SIZE or time.monotonic() - self._last_flush >= BATCH_INTERVAL:
+            self.flush_files()
+    
+    def count_record(self, record, delta=1):
+        """按类别和内容状态计数，delta 为 -1 时撤销一条结果的计数"""
+        self.counts[record.category] += delta
+        if record.status is not None and record.category == "common":
+            self.status_counts[record.status] = self.status_counts.get(record.status, 0) + delta
+    
+    def flush_files(self):
+        """发送当前批次中的所有文件信息"""
+        if self._batch:
+            self.on_records(self._batch)
+            self._batch = []
+        self._last_flush = time.monotonic()
+    
+    def flush_due(self):
+        """距上次发送已超过 BATCH_INTERVAL 时发送当前批次
+        
+        生产者阻塞（完整比较一个大文件、慢速目录读取）时由等待循环定期调用，
+        已得出的结果不会一直留在批次中等下一条记录。
+        """
+        if self._batch and time.monotonic() - self._last_flush >= BATCH_INTERVAL:
+            self.flush_files()
+    
+    def emit_progress(self, current, total, status, force=False):
+        """按固定频率发送进度，避免淹没GUI事件队列；暂停时在这里等待
+        
+        total 为 0 表示总数未知（例如扫描仍在进行）。
+        """
+        self.check_paused()
+        self.flush_due()
+        now = time.monotonic()
+        if force or 0 < total <= current or now - self._last_progress >= PROGRESS_INTERVAL:
+            self._last_progress = now
+            self.progress(current, total, status)
+    
+    def cancel(self):
+        """请求取消正在进行的比较"""
+        self.cancel_event.set()
+        self.resume_event.set()
+    
+    def pause(self):
+        """暂停: 扫描、比较和复制在下一个检查位置等待，直到 resume() 或 cancel()"""
+        if self.cancel_event.is_set():
+            return
+        self.resume_event.clear()
+        self.log("⏸ 已暂停", "orange")
+    
+    def resume_run(self):
+        """继续已暂停的运行"""
+        if not self.resume_event.is_set():
+            self.resume_event.set()
+            self.log("▶ 继续运行", "blue")
+    
+    @property
+    def is_paused(self):
+        return not self.resume_event.is_set()
+    
+    def check_paused(self):
+        """暂停时阻塞，已取消时抛出 CompareCancelled"""
+        if self.cancel_event.is_set() or not self.resume_event.is_set():
+            wait_while_paused(self.cancel_event, self.resume_event)
+    
+    def scan_folder(self, folder):
+        """扫描文件夹，返回 FileIndex"""
+        def on_scan_error(e):
+            self.log(f"⚠ 无法访问子文件夹: {e}", "orange")
+        
+        index = FileIndex(folder)
+        for rel_path, record in walk_files(folder, self.recursive, self.follow_symlinks,
+                                           self.max_depth, on_scan_error, self.syscalls,
+                                           self.check_paused, self.ignore):
+            index.add(rel_path, record)
+        return index
+
+    def load_listing(self, folder):
+        """扫描文件夹: 默认返回内存中的 FileIndex，设置了 sort_chunk 时返回 SortedListing；
+        folder 为快照文件时直接映射载入，返回 SnapshotIndex"""
+        if is_snapshot(folder):
+            snapshot = SnapshotIndex(folder)
+            self.log(f"已载入快照: {snapshot.describe()}", "blue")
+            if self.compare_content and not snapshot.has_digests:
+                self.log("⚠ 快照不含哈希，内容比较需要读取快照原目录中的文件", "orange")
+            if self.ignore:
+                return self.filter_snapshot(snapshot)
+            return snapshot
+        if not self.sort_chunk:
+            return self.scan_folder(folder)
+        
+        def on_scan_error(e):
+            self.log(f"⚠ 无法访问子文件夹: {e}", "orange")
+        
+        listing = SortedListing(folder, walk_files(folder, self.recursive, self.follow_symlinks,
+                                                   self.max_depth, on_scan_error, self.syscalls,
+                                                   self.check_paused, self.ignore),
+                                self.sort_chunk)
+        if listing.is_external:
+            self.log(f"文件数 {listing.count} 超过 {self.sort_chunk}，已使用外部排序（{len(listing.runs)} 个临时文件）", "blue")
+        return listing
+    
+    def filter_snapshot(self, snapshot):
+        """按忽略规则筛选快照中的记录，返回内存中的 FileIndex 并关闭快照
+        
+        快照保存时可能没有使用相同的规则，不筛选的话被忽略的文件会显示为只在快照一侧存在。
+        """
+        try:
+            index = FileIndex(snapshot.root)
+            for i in range(len(snapshot)):
+                name = snapshot.name(i)
+                if not self.ignore.excludes(name, snapshot.sizes[i], snapshot.mtimes[i]):
+                    index.add(name, snapshot.record(i))
+            self.syscalls.ignored += len(snapshot) - len(index)
+        finally:
+            snapshot.close()
+        return index
+    
+    def log_ignore(self):
+        if self.ignore:
+            self.log(f"🚫 忽略规则: {self.ignore.describe()}", "blue")
+    
+    def run(self):
+        """执行比较，返回结果汇总（见 summary()）；失败或取消时返回 None"""
+        files1 = files2 = None
+        completed = False
+        progressive = (self.progressive and not self.sort_chunk
+                       and not is_snapshot(self.folder1) and not is_snapshot(self.folder2))
+        self.log_ignore()
+        try:
+            if self.watch:
+                # 扫描前就开始监视，扫描期间发生的变化在 run_watch() 中补上
+                self.open_watcher()
+            if progressive:
+                self.log(f"正在同时扫描文件夹1: {self.folder1} 和文件夹2: {self.folder2}", "blue")
+                # 扫描在创建输出目录之后才开始，先确认两个根目录都能读取，避免失败时留下空的输出目录
+                for side, folder in enumerate((self.folder1, self.folder2)):
+                    try:
+                        os.scandir(folder).close()
+                    except OSError as e:
+                        raise RootScanError(side, e)
+            else:
+                # 获取文件夹1中的文件列表
+                self.log(f"正在扫描文件夹1: {self.folder1}", "blue")
+                try:
+                    with self.perf.phase("scan"):
+                        files1 = self.load_listing(self.folder1)
+                except CompareCancelled:
+                    raise
+                except Exception as e:
+                    self.log(f"❌ 无法访问文件夹1: {e}", "red")
+                    return
+                
+                # 获取文件夹2中的文件列表
+                self.log(f"正在扫描文件夹2: {self.folder2}", "blue")
+                try:
+                    with self.perf.phase("scan"):
+                        files2 = self.load_listing(self.folder2)
+                except CompareCancelled:
+                    raise
+                except Exception as e:
+                    self.log(f"❌ 无法访问文件夹2: {e}", "red")
+                    return
+            
+            # 准备输出目录和报告，比较结果边产生边写入报告
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            checkpoint = self.open_checkpoint()
+            if checkpoint is not None and checkpoint.timestamp:
+                # 继续上次的运行: 沿用同一输出目录，报告按原文件名重新生成
+                timestamp = checkpoint.timestamp
+            if self.save_report or self.classify_files:
+                if self.incremental_dir:
+                    # 增量模式: 始终输出到同一目录，只复制变化的文件
+                    self.output_dir = self.incremental_dir
+                elif checkpoint is not None and checkpoint.output_dir:
+                    self.output_dir = checkpoint.output_dir
+                else:
+                    self.output_dir = os.path.join(self.output_root, f"文件夹比较分析_{timestamp}")
+                try:
+                    os.makedirs(self.output_dir, exist_ok=True)
+                    if self.save_report:
+                        self.open_reports(timestamp, ordered=not progressive and self.is_indexed(files1, files2),
+                                          presorted=not progressive)
+                except OSError as e:
+                    self.log(f"❌ 创建输出目录失败: {e}", "red")
+                    self.close_reports(None)
+                    self.output_dir = None
+            if checkpoint is not None:
+                try:
+                    checkpoint.start(self.output_dir, timestamp)
+                except OSError as e:
+                    self.log(f"⚠ 无法创建检查点，本次运行中断后无法继续: {e}", "orange")
+                    self.checkpoint = None
+            
+            # 计算文件差异并发送文件信息到主界面
+            self.log("正在比较文件...", "blue")
+            self._last_flush = time.monotonic()
+            if self.compare_content:
+                self.open_comparer()
+            try:
+                with self.perf.phase("diff"):
+                    if progressive:
+                        buckets = self.diff_progressive()
+                    elif self.is_indexed(files1, files2):
+                        buckets = self.diff_indexed(files1, files2)
+                    else:
+                        buckets = self.diff_streamed(files1, files2)
+            finally:
+                if self.cache is not None:
+                    self.cache.close()
+            self.flush_files()
+            
+            # 分类复制文件（先于关闭报告，报告中的性能统计包含复制阶段）
+            if self.classify_files and self.output_dir:
+                if isinstance(files1, SnapshotIndex) or isinstance(files2, SnapshotIndex):
+                    self.log("快照一侧的文件无法复制，已跳过", "orange")
+                with self.perf.phase("copy"):
+                    copied = self.copy_and_classify_files(buckets, self.output_dir)
+                if copied:
+                    self.log("✅ 文件分类复制完成!", "green")
+            
+            # 关闭报告
+            summary = self.summary()
+            report_paths = self.close_reports(summary)
+            for report_path in report_paths:
+                self.log(f"✅ 报告已保存: {report_path}", "green")
+            summary["report_paths"] = report_paths
+            self.log_stats(summary)
+            self.log(f"✅ 比较完成! 共处理 {sum(self.counts.values())} 个文件", "green")
+            completed = True
+            return summary
+            
+        except CompareCancelled:
+            self.flush_files()
+            self.close_reports(self.summary())
+            self.log("⚠ 比较已取消", "orange")
+        except RootScanError as e:
+            self.close_reports(None)
+            self.log(f"❌ 无法访问文件夹{e.side + 1}: {e.error}", "red")
+        except Exception as e:
+            self.close_reports(None)
+            self.log(f"❌ 比较过程中出现错误: {e}", "red")
+        finally:
+            for listing in (files1, files2):
+                if isinstance(listing, (SortedListing, SnapshotIndex)):
+                    listing.close()
+            self.close_checkpoint(completed)
+            if not completed:
+                self.close_watcher()
+    
+    def log_stats(self, summary):
+        """输出内容比较、缓存、系统调用和各阶段耗时的统计，并按需导出性能数据"""
+        if self.comparer and self.compare_content:
+            self.log(f"📊 内容比较: {self.comparer.summary()}", "black")
+        if self.cache is not None:
+            self.log(f"📊 哈希缓存: {self.cache.summary()}", "black")
+        self.log(f"📊 文件系统调用: {self.syscalls}", "black")
+        if self.ignore:
+            self.log(f"📊 忽略规则排除了 {self.syscalls.ignored} 个文件和文件夹", "black")
+        for line in format_perf(summary["perf"]):
+            self.log(f"⏱ {line}", "black")
+        self.export_perf(summary["perf"])
+    
+    def open_checkpoint(self):
+        """比较内容或分类复制时创建检查点；resume 为 True 时读取上次中断留下的检查点"""
+        if not (self.compare_content or self.classify_files):
+            return None
+        path = RunCheckpoint.path_for(
+            self.checkpoint_dir, os.path.abspath(self.folder1), os.path.abspath(self.folder2),
+            self.recursive, self.follow_symlinks, self.max_depth, self.compare_content,
+            self.save_report, self.classify_files, self.copy_mode, self.incremental_dir, self.detect_renames,
+            self.ignore.key() if self.ignore else None)
+        self.checkpoint = RunCheckpoint(path)
+        if self.resume:
+            if self.checkpoint.load():
+                self.log(f"从检查点继续: 已比较 {len(self.checkpoint.statuses)} 个文件, "
+                         f"已复制 {len(self.checkpoint.copied)} 个文件", "blue")
+            else:
+                self.log("没有找到上次中断的检查点，将重新开始", "orange")
+        return self.checkpoint
+    
+    def close_checkpoint(self, completed):
+        """运行完成时删除检查点，中断时保留供下次继续"""
+        checkpoint, self.checkpoint = self.checkpoint, None
+        if checkpoint is None or checkpoint.file is None:
+            return
+        try:
+            if completed:
+                checkpoint.discard()
+            else:
+                checkpoint.close()
+                self.log("进度已保存到检查点，下次选择继续即可从中断处开始", "blue")
+        except OSError as e:
+            self.log(f"⚠ 无法保存检查点: {e}", "orange")
+    
+    @staticmethod
+    def is_indexed(files1, files2):
+        """两侧都是内存（或映射）中的索引时按类别依次比较，否则使用流式归并"""
+        return isinstance(files1, FileIndex) and isinstance(files2, FileIndex)
+    
+    def save_snapshot(self, path, with_digests=False):
+        """扫描文件夹1并保存为快照，返回保存的文件数；失败或取消时返回 None
+        
+        with_digests 为 True 时同时保存每个文件的完整哈希，之后与快照比较内容时无需原目录中的文件。
+        """
+        self.log_ignore()
+        self.log(f"正在扫描文件夹: {self.folder1}", "blue")
+        try:
+            index = self.scan_folder(self.folder1)
+            digests = self.snapshot_digests(index) if with_digests else None
+            write_snapshot(index, path, digests)
+        except CompareCancelled:
+            self.log("⚠ 保存快照已取消", "orange")
+            return None
+        except Exception as e:
+            self.log(f"❌ 保存快照失败: {e}", "red")
+            return None
+        self.log(f"✅ 快照已保存: {path}（{len(index)} 个文件）", "green")
+        return len(index)
+    
+    def snapshot_digests(self, index):
+        """按排序后的顺序并发计算索引中所有文件的完整哈希，读取失败的文件记为全零"""
+        index.sort()
+        self.open_comparer()
+        digests = bytearray()
+        empty = bytes(new_hasher().digest_size)
+        total = len(index)
+        try:
+            for i, digest in self.comparer.digest_many((i, index.record(i)) for i in range(total)):
+                digests += digest or empty
+                self.emit_progress(i + 1, total, "正在计算文件哈希...")
+        finally:
+            if self.cache is not None:
+                self.cache.close()
+        if self.comparer.stats["error"]:
+            self.log(f"⚠ {self.comparer.stats['error']} 个文件无法读取，快照中不含其哈希", "orange")
+        return digests
+    
+    def open_comparer(self):
+        """创建内容比较器（以及哈希缓存）"""
+        if self.use_cache:
+            try:
+                self.cache = HashCache()
+            except (OSError, sqlite3.Error) as e:
+                self.log(f"⚠ 无法打开哈希缓存，将不使用缓存: {e}", "orange")
+        self.comparer = ContentComparer(workers=self.workers, io_limit=self.io_limit,
+                                        cancel_event=self.cancel_event, cache=self.cache,
+                                        resume_event=self.resume_event)
+        self.comparer.on_idle = self.flush_due
+    
+    def common_statuses(self, pairs):
+        """为共有文件确定内容状态，按输入顺序产出 (key, status)
+        
+        pairs 为 (key, file1, file2)；未开启内容比较时只比较大小。
+        """
+        if self.compare_content:
+            if self.checkpoint is not None:
+                return self.checkpointed_statuses(pairs, self.checkpoint)
+            return self.comparer.compare_many(pairs)
+        return ((key, STATUS_SIZE_DIFFERS if file1.size != file2.size else STATUS_UNCHECKED)
+                for key, file1, file2 in pairs)
+    
+    def checkpointed_statuses(self, pairs, checkpoint):
+        """比较内容并把结论记录到检查点，检查点中已有结论且文件未变化的直接沿用"""
+        pairs = (((key, file1, file2), file1, file2) for key, file1, file2 in pairs)
+        for (key, file1, file2), status in self.comparer.compare_many(pairs, checkpoint.status):
+            checkpoint.record_status(file1, file2, status)
+            yield key, status
+    
+    def can_detect_renames(self, listing1=None, listing2=None):
+        """是否检测重命名: 需要开启该选项，快照一侧还必须带有保存时的哈希"""
+        if not self.detect_renames:
+            return False
+        for side, listing in enumerate((listing1, listing2)):
+            if isinstance(listing, SnapshotIndex) and not listing.has_digests:
+                self.log(f"⚠ 文件夹{side + 1}的快照不含哈希，无法检测重命名或移动的文件", "orange")
+                return False
+        return True
+    
+    def split_renames(self, index1, only1, index2, only2):
+        """从两侧独有的文件中找出重命名或移动的文件对，返回 (剩余的1中下标, 剩余的2中下标, [(i, j)])"""
+        if not len(only1) or not len(only2):
+            return only1, only2, []
+        if self.comparer is None:
+            self.open_comparer()
+        self.emit_progress(self.processed, 0, "正在检测重命名或移动的文件...", force=True)
+        with self.perf.phase("rename"):
+            renames = find_renames(index1, only1, index2, only2, self.comparer)
+        if not renames:
+            return only1, only2, renames
+        paired1 = {i for i, _ in renames}
+        paired2 = {j for _, j in renames}
+        self.log(f"检测到 {len(renames)} 个重命名或移动的文件", "blue")
+        return (array("q", (i for i in only1 if i not in paired1)),
+                array("q", (j for j in only2 if j not in paired2)), renames)
+    
+    def emit_unique_files(self, index1, only1, index2, only2, total, copy_indexes=None):
+        """依次发送两侧独有的文件；copy_indexes 中有对应类别时同时记录需要复制的文件"""
+        for side, category, index, positions in ((1, "folder1_unique", index1, only1),
+                                                 (2, "folder2_unique", index2, only2)):
+            for i in positions:
+                self.processed += 1
+                self.emit_progress(self.processed, total, f"正在处理文件夹{side}独有文件...")
+                name, record = index.name(i), index.record(i)
+                file1, file2 = (record, None) if side == 1 else (None, record)
+                self.emit_file(CompareRecord(category, name, file1, file2))
+                if copy_indexes is not None and category in copy_indexes:
+                    copy_indexes[category].add(name, record)
+    
+    def emit_renames(self, index1, index2, renames, total, copy_indexes=None, copy_side=0):
+        """发送重命名或移动的文件对；copy_indexes 中记录 copy_side 一侧（0 为文件夹1）的版本"""
+        for i, j in renames:
+            self.processed += 2
+            self.emit_progress(self.processed, total, "正在处理重命名或移动的文件...")
+            name1, name2 = index1.name(i), index2.name(j)
+            file1, file2 = index1.record(i), index2.record(j)
+            self.emit_file(CompareRecord("renamed", f"{name1}{RENAME_SEPARATOR}{name2}", file1, file2,
+                                         STATUS_SAME))
+            if copy_indexes is not None and "renamed" in copy_indexes:
+                if copy_side == 0:
+                    copy_indexes["renamed"].add(name1, file1)
+                else:
+                    copy_indexes["renamed"].add(name2, file2)
+    
+    def diff_indexed(self, files1, files2):
+        """内存索引模式: 归并得到三类下标后按类别依次发送，返回分类复制用的分组"""
+        only1, only2, common1, common2 = diff_indexes(files1, files2)
+        total_files = len(common1) + len(only1) + len(only2)
+        renames = []
+        if self.can_detect_renames(files1, files2):
+            only1, only2, renames = self.split_renames(files1, only1, files2, only2)
+        
+        # 发送两侧独有的文件
+        self.emit_unique_files(files1, only1, files2, only2, total_files)
+        
+        # 发送共有文件（可选并发比较内容）
+        status_text = "正在比较文件内容..." if self.comparer else "正在处理共有文件..."
+        pairs = ((i, files1.record(i), files2.record(j)) for i, j in zip(common1, common2))
+        for (i, status), j in zip(self.common_statuses(pairs), common2):
+            self.processed += 1
+            self.emit_progress(self.processed, total_files, status_text)
+            self.emit_file(CompareRecord("common", files1.name(i), files1.record(i),
+                                         files2.record(j), status))
+        
+        # 发送重命名或移动的文件
+        self.emit_renames(files1, files2, renames, total_files)
+        
+        buckets = [("folder1_unique", files1, only1, self.folder1),
+                   ("folder2_unique", files2, only2, self.folder2)]
+        # 共有的文件默认复制文件夹1中的版本，文件夹1为快照时复制文件夹2中的版本；
+        # 重命名的文件只复制一份，同样优先取文件夹1中的版本
+        if isinstance(files1, SnapshotIndex):
+            buckets.append(("common", files2, common2, self.folder2))
+            if renames:
+                buckets.append(("renamed", files2, [j for _, j in renames], self.folder2))
+        else:
+            buckets.append(("common", files1, common1, self.folder1))
+            if renames:
+                buckets.append(("renamed", files1, [i for i, _ in renames], self.folder1))
+        # 快照一侧的文件不一定还在，不参与复制
+        return [bucket for bucket in buckets if not isinstance(bucket[1], SnapshotIndex)]
+    
+    def diff_progressive(self):
+        """并发扫描模式: 两个文件夹各在一个线程中扫描，边扫描边发送结果
+        
+        名称在两侧都出现后立即作为共有文件发送（需要时比较内容）；只在一侧出现的名称
+        要等两侧都扫描完才能确定，最后按名称顺序发送。内存中只保留尚未配对的文件。
+        """
+        # 尚未在另一侧出现的文件: 相对路径 -> FileRecord
+        pending = ({}, {})
+        scan_started = time.perf_counter()
+        scanned = [0, 0]
+        counters = (SyscallCounter(), SyscallCounter())
+        scan_done = False
+        total = 0
+        status_text = "正在比较文件内容..." if self.comparer else "正在处理文件..."
+        copy_indexes = None
+        if self.classify_files and self.output_dir:
+            copy_indexes = {"folder1_unique": FileIndex(self.folder1),
+                            "folder2_unique": FileIndex(self.folder2),
+                            "common": FileIndex(self.folder1)}
+            if self.detect_renames:
+                copy_indexes["renamed"] = FileIndex(self.folder1)
+        
+        def on_scan_error(e):
+            self.log(f"⚠ 无法访问子文件夹: {e}", "orange")
+        
+        def common_pairs():
+            nonlocal scan_done, total
+            batches = scan_concurrently((self.folder1, self.folder2), self.recursive, self.follow_symlinks,
+                                        self.max_depth, on_scan_error, counters, self.check_paused, self.ignore,
+                                        self.flush_due)
+            for side, batch in batches:
+                mine, other = pending[side], pending[1 - side]
+                scanned[side] += len(batch)
+                for rel_path, record in batch:
+                    match = other.pop(rel_path, None)
+                    if match is None:
+                        mine[rel_path] = record
+                    elif side == 0:
+                        yield (rel_path, record, match), record, match
+                    else:
+                        yield (rel_path, match, record), match, record
+                self.emit_progress(scanned[0] + scanned[1], 0,
+                                   f"已扫描 {scanned[0]} / {scanned[1]} 个文件...")
+            
+            # 两侧都扫描完成，剩下未配对的就是各自独有的文件，按名称顺序转入紧凑索引
+            scan_done = True
+            self.perf.add_time("scan", time.perf_counter() - scan_started)
+            total = scanned[0] + scanned[1]
+            unique = (FileIndex(self.folder1), FileIndex(self.folder2))
+            for side in (0, 1):
+                files = pending[side]
+                for rel_path in sorted(files):
+                    unique[side].add(rel_path, files.pop(rel_path))
+            only1, only2, renames = range(len(unique[0])), range(len(unique[1])), []
+            if self.can_detect_renames():
+                only1, only2, renames = self.split_renames(unique[0], only1, unique[1], only2)
+            self.emit_unique_files(unique[0], only1, unique[1], only2, total, copy_indexes)
+            self.emit_renames(unique[0], unique[1], renames, total, copy_indexes)
+        
+        try:
+            for (rel_path, file1, file2), status in self.common_statuses(common_pairs()):
+                self.processed += 2
+                if scan_done:
+                    self.emit_progress(self.processed, total, status_text)
+                self.emit_file(CompareRecord("common", rel_path, file1, file2, status))
+                if copy_indexes is not None:
+                    copy_indexes["common"].add(rel_path, file1)
+        finally:
+            for counter in counters:
+                self.syscalls.add(counter)
+        
+        if copy_indexes is None:
+            return []
+        # 没有配对到重命名时不创建空的 重命名或移动的文件 目录
+        return [(category, index, range(len(index)), index.root)
+                for category, index in copy_indexes.items()
+                if len(index) or category not in OPTIONAL_CATEGORIES]
+    
+    def diff_streamed(self, listing1, listing2):
+        """流式模式: 对两个有序列表做一次归并，边读边发送，不在内存中保留两侧的完整列表
+        
+        结果按名称顺序交错到达。开启分类复制时，只把需要复制的文件记录到紧凑索引中。
+        """
+        # 两侧各读一遍，共有文件同时消耗两侧各一条
+        total = len(listing1) + len(listing2)
+        status_text = "正在比较文件内容..." if self.comparer else "正在处理文件..."
+        copy_indexes = None
+        live1 = not isinstance(listing1, SnapshotIndex)
+        live2 = not isinstance(listing2, SnapshotIndex)
+        if self.classify_files and self.output_dir:
+            copy_indexes = {}
+            if live1:
+                copy_indexes["folder1_unique"] = FileIndex(listing1.root)
+            if live2:
+                copy_indexes["folder2_unique"] = FileIndex(listing2.root)
+            if live1 or live2:
+                copy_indexes["common"] = FileIndex((listing1 if live1 else listing2).root)
+                if self.detect_renames:
+                    copy_indexes["renamed"] = FileIndex((listing1 if live1 else listing2).root)
+        # 检测重命名时独有的文件要等归并结束后才能确定类别，先记录到紧凑索引中
+        unique = None
+        if self.can_detect_renames(listing1, listing2):
+            unique = (FileIndex(listing1.root), FileIndex(listing2.root))
+        
+        def common_pairs():
+            for category, key, file1, file2 in merge_join(listing1.items(), listing2.items()):
+                name = key.decode("utf-8", FileIndex.ENCODING_ERRORS)
+                if category == "common":
+                    yield (name, file1, file2), file1, file2
+                    continue
+                if unique is not None:
+                    unique[0 if file1 else 1].add(name, file1 or file2)
+                    continue
+                self.processed += 1
+                self.emit_progress(self.processed, total, status_text)
+                self.emit_file(CompareRecord(category, name, file1, file2))
+                if copy_indexes is not None and category in copy_indexes:
+                    copy_indexes[category].add(name, file1 or file2)
+        
+        for (name, file1, file2), status in self.common_statuses(common_pairs()):
+            self.processed += 2
+            self.emit_progress(self.processed, total, status_text)
+            self.emit_file(CompareRecord("common", name, file1, file2, status))
+            if copy_indexes is not None and "common" in copy_indexes:
+                copy_indexes["common"].add(name, file1 if live1 else file2)
+        
+        if unique is not None:
+            only1, only2, renames = self.split_renames(unique[0], range(len(unique[0])),
+                                                       unique[1], range(len(unique[1])))
+            self.emit_unique_files(unique[0], only1, unique[1], only2, total, copy_indexes)
+            self.emit_renames(unique[0], unique[1], renames, total, copy_indexes, 0 if live1 else 1)
+        
+        if copy_indexes is None:
+            return []
+        # 没有配对到重命名时不创建空的 重命名或移动的文件 目录
+        return [(category, index, range(len(index)), index.root)
+                for category, index in copy_indexes.items()
+                if len(index) or category not in OPTIONAL_CATEGORIES]
+    
+    def open_watcher(self):
+        """建立实时状态并开始监视两侧文件夹（优先 inotify，不可用时定时轮询）"""
+        roots = tuple(None if is_snapshot(folder) else folder for folder in (self.folder1, self.folder2))
+        self.live = LiveComparison(roots, self.detect_renames)
+        if not any(roots):
+            return
+        
+        def on_watch_error(e):
+            self.log(f"⚠ 无法监视子文件夹: {e}", "orange")
+        
+        if self.poll_interval is None and sys.platform.startswith("linux"):
+            try:
+                self.watcher = InotifyWatcher(roots, self.recursive, self.follow_symlinks, self.max_depth,
+                                              on_watch_error, self.ignore)
+                return
+            except (OSError, AttributeError) as e:
+                self.log(f"⚠ 无法使用 inotify，改为定时轮询: {e}", "orange")
+        self.watcher = PollingWatcher(roots, self.poll_interval or WATCH_POLL_INTERVAL)
+    
+    def close_watcher(self):
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+    
+    def run_watch(self):
+        """run() 完成后持续监视两侧文件夹，直到 cancel()
+        
+        文件变化时只重新归类受影响的路径（需要时重新比较内容），通过 on_changes 发送，
+        不重新扫描整个文件夹。报告和分类复制的文件不随之更新。
+        """
+        if self.watcher is None:
+            if self.live is not None:
+                self.log("两侧都是快照，没有需要监视的文件夹", "orange")
+            return
+        live = self.live
+        detect = self.detect_renames and all(root is not None or live.has_digests(side)
+                                             for side, root in enumerate(live.roots))
+        comparer = None
+        if self.compare_content or detect:
+            self.open_comparer()
+            if detect:
+                comparer = self.comparer
+        self.log(f"👀 正在监视文件变化（{self.watcher.description}），报告和分类复制的文件不会随之更新", "blue")
+        # 等待处理的事件: (side, 相对路径) -> 是否为目录；文件可能仍在写入，事件停止一段时间后再处理
+        pending = {}
+        first = last = 0.0
+        try:
+            while True:
+                self.check_paused()
+                events = self.watcher.read(PROGRESS_INTERVAL)
+                now = time.monotonic()
+                if events:
+                    if not pending:
+                        first = now
+                    last = now
+                    for side, rel_path, is_dir in events:
+                        pending[(side, rel_path)] = pending.get((side, rel_path), False) or is_dir
+                if pending and (now - last >= WATCH_SETTLE_TIME or now - first >= WATCH_MAX_DELAY):
+                    events, pending = pending, {}
+                    self.apply_watch_events(events, comparer)
+        except CompareCancelled:
+            self.log("⏹ 已停止监视", "orange")
+        except Exception as e:
+            self.log(f"❌ 监视过程中出现错误: {e}", "red")
+        finally:
+            self.close_watcher()
+            if self.cache is not None:
+                self.cache.close()
+    
+    def apply_watch_events(self, events, comparer=None):
+        """把一批监视事件转换为文件变化，更新实时状态和计数，并发送变化的结果行"""
+        changes = {}
+        for (side, rel_path), is_dir in events.items():
+            changes.update(self.watch_changes(side, rel_path, is_dir))
+        old_rows, new_rows = self.live.update(changes, self.common_statuses, comparer)
+        if not old_rows and not new_rows:
+            return
+        for record in old_rows:
+            self.count_record(record, -1)
+        for record in new_rows:
+            self.count_record(record)
+        kept = {(record.category, record.filename) for record in new_rows}
+        removed = sum((record.category, record.filename) not in kept for record in old_rows)
+        self.log(f"🔄 文件发生变化: 更新 {len(new_rows)} 行结果, 移除 {removed} 行", "blue")
+        self.on_changes(old_rows, new_rows)
+    
+    def watch_changes(self, side, rel_path, is_dir):
+        """重新 stat 一个路径，目录则重新扫描该子树，返回 {(side, 相对路径): FileRecord 或 None}"""
+        root = self.live.roots[side]
+        known = self.live.files[side]
+        path = os.path.join(root, rel_path) if rel_path else root
+        try:
+            st = os.stat(path, follow_symlinks=self.follow_symlinks)
+        except OSError:
+            st = None
+        prefix = rel_path + os.sep if rel_path else ""
+        is_dir_now = st is not None and stat.S_ISDIR(st.st_mode)
+        if rel_path and self.ignore and self.ignore.excludes(rel_path, is_dir=is_dir_now):
+            return {}
+        if not is_dir_now:
+            if not rel_path:
+                self.log(f"⚠ 无法访问文件夹{side + 1}: {path}", "orange")
+                return {}
+            record = None
+            if st is not None and stat.S_ISREG(st.st_mode):
+                if not self.ignore or self.ignore.accepts(st.st_size, st.st_mtime):
+                    record = FileRecord(path, st.st_size, st.st_mtime, st.st_ino, st.st_mode)
+            changes = {(side, rel_path): record}
+            if is_dir:
+                # 目录被删除、移走或换成了同名文件，其中原有的文件都已不在
+                changes.update(((side, name), None) for name in known if name.startswith(prefix))
+            return changes
+        
+        # 现在是目录: 重新扫描该子树，只保留与已知状态不同的文件
+        changes = {(side, rel_path): None} if rel_path in known else {}
+        recursive, max_depth = self.recursive, self.max_depth
+        if rel_path:
+            depth = rel_path.count(os.sep) + 1
+            if not recursive or (max_depth is not None and depth > max_depth):
+                return changes
+            max_depth = None if max_depth is None else max_depth - depth
+        
+        def on_scan_error(e):
+            self.log(f"⚠ 无法访问子文件夹: {e}", "orange")
+        
+        gone = {name for name in known if name.startswith(prefix)} if prefix else set(known)
+        try:
+            for name, record in walk_files(path, recursive, self.follow_symlinks, max_depth, on_scan_error,
+                                           self.syscalls, self.check_paused, self.ignore, rel_path):
+                gone.discard(name)
+                if not LiveComparison.same_file(known.get(name), record):
+                    changes[(side, name)] = record
+        except OSError as e:
+            self.log(f"⚠ 无法重新扫描 {path}: {e}", "orange")
+            return {}
+        changes.update(((side, name), None) for name in gone)
+        return changes
+    
+    def summary(self):
+        """返回轻量的结果汇总（只包含计数，不包含文件列表）"""
+        return {
+            "folder1": self.folder1,
+            "folder2": self.folder2,
+            "counts": dict(self.counts),
+            "status_counts": dict(self.status_counts),
+            "compare_content": self.compare_content,
+            "detect_renames": self.detect_renames,
+            "output_dir": self.output_dir,
+            "report_paths": [],
+            "perf": self.collect_perf(),
+        }
+    
+    def collect_perf(self):
+        """汇总各阶段耗时和计数，返回 PerfStats.to_dict() 的结果"""
+        perf = self.perf
+        if self._report_time:
+            perf.phases["report"] = self._report_time
+        perf.phases["stat"] = self.syscalls.stat_time
+        perf.set("files", sum(self.counts.values()))
+        perf.set("scandir", self.syscalls.scandir)
+        perf.set("stat", self.syscalls.stat)
+        if self.ignore:
+            perf.set("ignored", self.syscalls.ignored)
+        if self.comparer is not None:
+            perf.phases["hash"] = self.comparer.busy_time
+            perf.set("hash_bytes", self.comparer.bytes_read)
+        return perf.to_dict()
+    
+    def export_perf(self, perf):
+        """按 perf_json 选项把性能统计写入 JSON 文件"""
+        if not self.perf_json:
+            return
+        try:
+            with open(self.perf_json, "w", encoding="utf-8") as f:
+                json.dump(perf, f, ensure_ascii=False, indent=2)
+            self.log(f"✅ 性能统计已保存: {self.perf_json}", "green")
+        except OSError as e:
+            self.log(f"⚠ 无法保存性能统计: {e}", "orange")
+    
+    def open_reports(self, timestamp, ordered=True, presorted=True):
+        """按所选格式创建流式报告写入器；ordered 为 False 表示各类别的结果会交错到达，
+        presorted 为 False 表示同一类别内的结果不按名称顺序到达"""
+        for fmt in self.report_formats:
+            report_path = os.path.join(self.output_dir, f"文件夹比较报告_{timestamp}.{fmt}")
+            self.reports.append(REPORT_WRITERS[fmt](report_path, self.folder1, self.folder2,
+                                                    ordered, presorted))
+    
+    def close_reports(self, summary):
+        """写入统计信息并关闭所有报告，返回报告路径；summary 为 None 时直接关闭"""
+        paths = []
+        for report in self.reports:
+            try:
+                if summary is None:
+                    report.file.close()
+                else:
+                    report.close(summary)
+                    paths.append(report.path)
+            except OSError as e:
+                self.log(f"❌ 保存报告失败: {e}", "red")
+        self.reports = []
+        return paths
+    
+    def copy_and_classify_files(self, buckets, output_dir):
+        """将文件分类复制到新目录
+        
+        buckets 为 (类别, FileIndex, 下标序列, 源文件夹) 的列表。
+        """
+        try:
+            # 创建子目录
+            categories = {bucket[0] for bucket in buckets}
+            bucket_dirs = {category: os.path.join(output_dir, name)
+                           for category, name in COPY_BUCKET_DIRS.items()
+                           if category not in OPTIONAL_CATEGORIES or category in categories}
+            for dir_path in bucket_dirs.values():
+                os.makedirs(dir_path, exist_ok=True)
+            
+            manifest = CopyManifest(output_dir).load() if self.incremental_dir else None
+            checkpoint = self.checkpoint
+            tasks = []
+            new_files = {}
+            # 需要写入检查点的文件签名: 目标路径 -> FileRecord
+            pending_records = {}
+            skipped = 0
+            resumed = 0
+            for category, files, positions, source in buckets:
+                bucket_dir = bucket_dirs[category]
+                for i in positions:
+                    file = files.record(i)
+                    dst = os.path.join(bucket_dir, files.name(i))
+                    if manifest is not None:
+                        dst_rel = os.path.relpath(dst, output_dir)
+                        new_files[dst_rel] = [file.path, file.size, file.mtime]
+                        if manifest.is_unchanged(dst_rel, file):
+                            skipped += 1
+                            continue
+                        if dst_rel in manifest.files:
+                            # 已变化的文件先删除旧副本（链接模式无法覆盖已有文件）
+                            self.remove_output_file(dst)
+                    if checkpoint is not None:
+                        dst_rel = os.path.relpath(dst, output_dir)
+                        if checkpoint.resumed:
+                            if checkpoint.is_copied(dst_rel, file) and os.path.lexists(dst):
+                                resumed += 1
+                                continue
+                            # 上次中断时可能留下不完整的副本
+                            self.remove_output_file(dst)
+                        pending_records[dst] = file
+                    tasks.append((file.path, dst, file.size, source))
+            
+            if manifest is not None:
+                self.log(f"增量输出: {skipped} 个文件未变化, {len(tasks)} 个文件需要复制", "blue")
+                self.handle_stale_files(manifest, new_files, output_dir)
+            
+            if resumed:
+                self.log(f"从检查点继续: {resumed} 个文件已复制，跳过", "blue")
+            engine = CopyEngine(self.copy_mode, self.copy_workers, self.cancel_event, self.resume_event)
+            self.log(
+                f"正在分类复制 {len(tasks)} 个文件（{COPY_MODE_LABELS.get(self.copy_mode, self.copy_mode)}）...", "blue")
+            start = time.monotonic()
+            
+            def on_progress(done, total):
+                elapsed = time.monotonic() - start
+                self.copy_progress(done, total, done / elapsed if elapsed > 0 else 0.0)
+            
+            def on_error(task, e):
+                self.log(f"⚠ 复制失败 {task[0]}: {e}", "orange")
+                # 失败的文件可能留下不完整的副本
+                self.remove_output_file(task[1])
+            
+            def on_done(task):
+                if checkpoint is not None:
+                    checkpoint.record_copied(os.path.relpath(task[1], output_dir),
+                                             pending_records.pop(task[1]))
+            
+            try:
+                total_bytes = engine.copy_all(tasks, on_progress, on_error, on_done)
+                on_progress(engine.bytes_done, total_bytes)
+            finally:
+                self.perf.set("copy_bytes", engine.bytes_done)
+                self.perf.set("copied_files", engine.files_done)
+                if manifest is not None:
+                    # 复制失败或未完成的文件不写入清单，下次运行时重新复制
+                    for task in engine.unfinished(tasks):
+                        new_files.pop(os.path.relpath(task[1], output_dir), None)
+                    manifest.save(new_files)
+            self.log(f"📊 复制方式: {engine.summary() or '无'}", "black")
+            return True
+        except CompareCancelled:
+            raise
+        except Exception as e:
+            self.log(f"❌ 文件分类复制失败: {e}", "red")
+            return False
+    
+    def remove_output_file(self, path):
+        """删除输出目录中的文件或链接，不存在时忽略"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.log(f"⚠ 无法删除 {path}: {e}", "orange")
+    
+    def handle_stale_files(self, manifest, new_files, output_dir):
+        """处理上一次运行复制、本次已不存在的文件: 删除或记录到列表中"""
+        stale = sorted(dst_rel for dst_rel in manifest.files if dst_rel not in new_files)
+        if not stale:
+            return
+        if self.remove_stale:
+            for dst_rel in stale:
+                self.remove_output_file(os.path.join(output_dir, dst_rel))
+            self.log(f"增量输出: 已删除 {len(stale)} 个已不存在的文件", "blue")
+        else:
+            stale_list = os.path.join(output_dir, "已移除的文件.txt")
+            with open(stale_list, "a", encoding="utf-8") as f:
+                f.write(f"# {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+                for dst_rel in stale:
+                    f.write(f"{dst_rel}\n")
+            self.log(f"增量输出: {len(stale)} 个文件已不存在，已记录到 {stale_list}", "orange")
+
+
+# ----------------------
+# 多文件夹比较
+# ----------------------
+# 多文件夹比较的结果: mask 的第 k 位表示出现在第 k 个文件夹中；files 为各文件夹中的 FileRecord
+# （不存在时为 None）；variants 为各文件夹中版本的组号，组号相同表示大小相同（比较内容时为内容相同），
+# 不存在为 None，无法读取为 -1；status 为出现在多个文件夹中时的整体状态（见 STATUS_*）
+MultiRecord = namedtuple("MultiRecord", ["filename", "mask", "files", "variants", "status"])
+# 位掩码按 64 位存放
+MAX_FOLDERS = 64
+VARIANT_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+def format_mask(mask, count):
+    """把位掩码转换为从 1 开始的文件夹编号，如 "1,2,4\""""
+    return ",".join(str(side + 1) for side in range(count) if mask >> side & 1)
+
+
+def format_variants(variants):
+    """每个文件夹一个字符: "." 为不存在，"!" 为无法读取，其余为版本字母，字母相同表示版本相同"""
+    return "".join("." if variant is None else "!" if variant < 0
+                   else VARIANT_LETTERS[variant] if variant < len(VARIANT_LETTERS) else "*"
+                   for variant in variants)
+
+
+def size_groups(files):
+    """只按大小分组，返回与 files 一一对应的组号（按首次出现从 0 编号）"""
+    labels = {}
+    return [labels.setdefault(file.size, len(labels)) for file in files]
+
+
+class SharedIndex:
+    """多个文件夹共用的名称索引: 每个名称一个编号和出现位置的位掩码
+    
+    各文件夹的文件按到达顺序存放在各自的 FileIndex 中，slots[side][编号] 为其中的位置（不存在为 -1）。
+    """
+    
+    def __init__(self, roots):
+        self.ids = {}
+        self.masks = array("Q")
+        self.indexes = [FileIndex(root) for root in roots]
+        self.slots = [array("q") for _ in roots]
+    
+    def __len__(self):
+        return len(self.masks)
+    
+    def add(self, side, rel_path, record):
+        key = self.ids.get(rel_path)
+        if key is None:
+            key = self.ids[rel_path] = len(self.masks)
+            self.masks.append(0)
+            for slots in self.slots:
+                slots.append(-1)
+        self.masks[key] |= 1 << side
+        index = self.indexes[side]
+        self.slots[side][key] = len(index)
+        index.add(rel_path, record)
+    
+    def files(self, key):
+        """编号为 key 的名称在各文件夹中的 FileRecord（不存在时为 None）"""
+        return tuple(None if slots[key] < 0 else index.record(slots[key])
+                     for index, slots in zip(self.indexes, self.slots))
+
+
+class MultiReportWriter(ReportWriter):
+    """多文件夹比较的报告写入器，结果按名称顺序到达"""
+    
+    def __init__(self, path, folders):
+        self.folders = folders
+        super().__init__(path, folders[0], folders[1])
+
+
+class MultiTextReportWriter(MultiReportWriter):
+    """多文件夹比较的文本报告: 每个名称一行，前面是各文件夹中的版本（见 format_variants）"""
+    extension = "txt"
+    
+    def write_header(self):
+        self.file.write("多文件夹比较结果报告\n")
+        self.file.write("=" * 60 + "\n")
+        self.file.write(f"生成时间: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        for side, folder in enumerate(self.folders):
+            self.file.write(f"文件夹{side + 1}: {folder}\n")
+        self.file.write("=" * 60 + "\n")
+        self.file.write("\n文件列表（每个文件夹一列: . 不存在, ! 无法读取, 字母相同表示版本相同）:\n")
+    
+    def write(self, record):
+        line = f"  {format_variants(record.variants)}  {record.filename}"
+        if record.status in DIFFERENT_STATUSES:
+            line += f"  [{STATUS_LABELS[record.status]}]"
+        self.file.write(line + "\n")
+    
+    def close(self, summary):
+        counts = summary["counts"]
+        statuses = summary["status_counts"]
+        self.file.write("\n" + "=" * 60 + "\n")
+        self.file.write("统计:\n")
+        self.file.write(f"名称总数: {counts['in_all'] + counts['partial']}\n")
+        self.file.write(f"所有文件夹都有的: {counts['in_all']}\n")
+        self.file.write(f"只在部分文件夹中的: {counts['partial']}\n")
+        self.file.write(f"各文件夹版本大小不同的: {statuses.get(STATUS_SIZE_DIFFERS, 0)}\n")
+        if summary["compare_content"]:
+            self.file.write(f"各文件夹版本内容不同的: {statuses.get(STATUS_CONTENT_DIFFERS, 0)}\n")
+            self.file.write(f"无法读取的: {statuses.get(STATUS_ERROR, 0)}\n")
+        self.file.write("\n按所在文件夹统计:\n")
+        for folders, count in summary["subset_counts"].items():
+            self.file.write(f"  文件夹 {folders}: {count}\n")
+        if summary.get("perf"):
+            self.file.write("\n性能统计:\n")
+            for line in format_perf(summary["perf"]):
+                self.file.write(f"{line}\n")
+        super().close(summary)
+
+
+class MultiCsvReportWriter(MultiReportWriter):
+    """多文件夹比较的 CSV 报告，每个名称一行，每个文件夹各有大小和修改时间两列"""
+    extension = "csv"
+    
+    def write_header(self):
+        self.file.write("\ufeff")
+        self.writer = csv.writer(self.file)
+        columns = ["filename", "folders", "variants", "status"]
+        for side in range(len(self.folders)):
+            columns += [f"size{side + 1}", f"mtime{side + 1}"]
+        self.writer.writerow(columns)
+    
+    def write(self, record):
+        row = [record.filename, format_mask(record.mask, len(self.folders)),
+               format_variants(record.variants), record.status or ""]
+        for file in record.files:
+            row += [file.size, format_mtime(file.mtime)] if file else ["", ""]
+        self.writer.writerow(row)
+
+
+class MultiJsonlReportWriter(MultiReportWriter):
+    """多文件夹比较的 JSON Lines 报告，最后一行为统计信息（type 为 summary）"""
+    extension = "jsonl"
+    
+    def write_header(self):
+        self.file.write(json.dumps({"type": "header", "folders": self.folders,
+                                    "generated": datetime.datetime.now().isoformat(timespec="seconds")},
+                                   ensure_ascii=False) + "\n")
+    
+    def write(self, record):
+        item = {"type": "file", "filename": record.filename,
+                "folders": [side + 1 for side, file in enumerate(record.files) if file is not None],
+                "variants": format_variants(record.variants),
+                "sizes": [file.size if file else None for file in record.files]}
+        if record.status is not None:
+            item["status"] = record.status
+        self.file.write(json.dumps(item, ensure_ascii=False) + "\n")
+    
+    def close(self, summary):
+        self.file.write(json.dumps({"type": "summary", "counts": summary["counts"],
+                                    "subset_counts": summary["subset_counts"],
+                                    "status_counts": summary["status_counts"],
+                                    "perf": summary.get("perf")},
+                                   ensure_ascii=False) + "\n")
+        super().close(summary)
+
+
+MULTI_REPORT_WRITERS = {writer.extension: writer for writer in
+                        (MultiTextReportWriter, MultiCsvReportWriter, MultiJsonlReportWriter)}
+
+
+class MultiFolderComparator(FolderComparator):
+    """同时比较 N 个文件夹（任意一个都可以是快照）
+    
+    所有文件夹在各自的线程中并发扫描，共用一个名称索引，每个名称记录出现在哪些文件夹中（位掩码）；
+    出现在多个文件夹中的名称再按大小（比较内容时按哈希）把各文件夹的版本分组。每个文件只扫描一次、
+    最多读取一次，耗时与文件夹数成线性关系，不需要两两比较。
+    结果为 MultiRecord，按名称顺序通过 on_records 分批发送。不支持分类复制、重命名检测和监视。
+    """
+    
+    def __init__(self, folders, save_report=False, **options):
+        if not 2 <= len(folders) <= MAX_FOLDERS:
+            raise ValueError(f"多文件夹比较需要 2 到 {MAX_FOLDERS} 个文件夹")
+        super().__init__(folders[0], folders[1], save_report, **options)
+        self.folders = list(folders)
+        self.classify_files = False
+        self.detect_renames = False
+        self.watch = False
+        self.counts = {"in_all": 0, "partial": 0}
+        # 位掩码 -> 名称数
+        self.subset_counts = {}
+    
+    def count_record(self, record, delta=1):
+        full = (1 << len(self.folders)) - 1
+        self.counts["in_all" if record.mask == full else "partial"] += delta
+        self.subset_counts[record.mask] = self.subset_counts.get(record.mask, 0) + delta
+        if record.status is not None:
+            self.status_counts[record.status] = self.status_counts.get(record.status, 0) + delta
+    
+    def run(self):
+        """执行比较，返回结果汇总（见 summary()）；失败或取消时返回 None"""
+        snapshots = []
+        try:
+            self.log_ignore()
+            self.log(f"正在同时扫描 {len(self.folders)} 个文件夹", "blue")
+            with self.perf.phase("scan"):
+                shared = self.scan_all(snapshots)
+            
+            if self.save_report:
+                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                self.output_dir = self.incremental_dir or os.path.join(self.output_root,
+                                                                        f"文件夹比较分析_{timestamp}")
+                try:
+                    os.makedirs(self.output_dir, exist_ok=True)
+                    self.open_reports(timestamp)
+                except OSError as e:
+                    self.log(f"❌ 创建输出目录失败: {e}", "red")
+                    self.close_reports(None)
+                    self.output_dir = None
+            
+            self.log("正在比较文件...", "blue")
+            self._last_flush = time.monotonic()
+            if self.compare_content:
+                self.open_comparer()
+            try:
+                with self.perf.phase("diff"):
+                    self.emit_names(shared)
+            finally:
+                if self.cache is not None:
+                    self.cache.close()
+            self.flush_files()
+            
+            summary = self.summary()
+            report_paths = self.close_reports(summary)
+            for report_path in report_paths:
+                self.log(f"✅ 报告已保存: {report_path}", "green")
+            summary["report_paths"] = report_paths
+            self.log_stats(summary)
+            self.log(f"✅ 比较完成! 共处理 {len(shared)} 个名称", "green")
+            return summary
+        
+        except CompareCancelled:
+            self.flush_files()
+            self.close_reports(self.summary())
+            self.log("⚠ 比较已取消", "orange")
+        except RootScanError as e:
+            self.close_reports(None)
+            self.log(f"❌ 无法访问文件夹{e.side + 1}: {e.error}", "red")
+        except Exception as e:
+            self.close_reports(None)
+            self.log(f"❌ 比较过程中出现错误: {e}", "red")
+        finally:
+            for snapshot in snapshots:
+                snapshot.close()
+    
+    def scan_all(self, snapshots):
+        """并发扫描所有文件夹，快照直接载入（追加到 snapshots 中，由调用方关闭），返回 SharedIndex"""
+        roots = list(self.folders)
+        loaded = []
+        for side, folder in enumerate(self.folders):
+            if is_snapshot(folder):
+                try:
+                    snapshot = SnapshotIndex(folder)
+                except Exception as e:
+                    raise RootScanError(side, e)
+                snapshots.append(snapshot)
+                loaded.append((side, snapshot))
+                roots[side] = snapshot.root
+                self.log(f"已载入快照: {snapshot.describe()}", "blue")
+        shared = SharedIndex(roots)
+        for side, snapshot in loaded:
+            for i in range(len(snapshot)):
+                name = snapshot.name(i)
+                if self.ignore and self.ignore.excludes(name, snapshot.sizes[i], snapshot.mtimes[i]):
+                    self.syscalls.ignored += 1
+                    continue
+                shared.add(side, name, snapshot.record(i))
+        
+        def on_scan_error(e):
+            self.log(f"⚠ 无法访问子文件夹: {e}", "orange")
+        
+        sides = [side for side, folder in enumerate(self.folders) if not is_snapshot(folder)]
+        counters = [SyscallCounter() for _ in sides]
+        scanned = 0
+        try:
+            batches = scan_concurrently([self.folders[side] for side in sides], self.recursive,
+                                        self.follow_symlinks, self.max_depth, on_scan_error, counters,
+                                        self.check_paused, self.ignore, self.flush_due)
+            for position, batch in batches:
+                side = sides[position]
+                for rel_path, record in batch:
+                    shared.add(side, rel_path, record)
+                scanned += len(batch)
+                self.emit_progress(scanned, 0, f"已扫描 {scanned} 个文件...")
+        except RootScanError as e:
+            raise RootScanError(sides[e.side], e.error)
+        finally:
+            for counter in counters:
+                self.syscalls.add(counter)
+        return shared
+    
+    def emit_names(self, shared):
+        """按名称顺序确定每个名称在各文件夹中的版本分组，并发送结果"""
+        total = len(shared)
+        status_text = "正在比较文件内容..." if self.compare_content else "正在处理文件..."
+        
+        def items():
+            for name in sorted(shared.ids):
+                key = shared.ids[name]
+                files = shared.files(key)
+                yield (name, shared.masks[key], files), [file for file in files if file is not None]
+        
+        if self.compare_content:
+            results = self.comparer.group_many(items())
+        else:
+            results = ((key, size_groups(present)) for key, present in items())
+        for (name, mask, files), labels in results:
+            labels = iter(labels)
+            variants = tuple(None if file is None else next(labels) for file in files)
+            self.processed += 1
+            self.emit_progress(self.processed, total, status_text)
+            self.emit_file(MultiRecord(name, mask, files, variants, self.multi_status(files, variants)))
+    
+    def multi_status(self, files, variants):
+        """出现在多个文件夹中的名称的整体状态，只出现在一个文件夹中时为 None"""
+        present = [variant for variant in variants if variant is not None]
+        if len(present) < 2:
+            return None
+        if -1 in present:
+            return STATUS_ERROR
+        if max(present) == 0:
+            return STATUS_SAME if self.compare_content else STATUS_UNCHECKED
+        if len({file.size for file in files if file is not None}) > 1:
+            return STATUS_SIZE_DIFFERS
+        return STATUS_CONTENT_DIFFERS
+    
+    def summary(self):
+        count = len(self.folders)
+        subsets = sorted(self.subset_counts.items(), key=lambda item: (-item[1], item[0]))
+        return {
+            "folders": self.folders,
+            "counts": dict(self.counts),
+            "subset_counts": {format_mask(mask, count): n for mask, n in subsets if n},
+            "status_counts": dict(self.status_counts),
+            "compare_content": self.compare_content,
+            "output_dir": self.output_dir,
+            "report_paths": [],
+            "perf": self.collect_perf(),
+        }
+    
+    def open_reports(self, timestamp, ordered=True, presorted=True):
+        for fmt in self.report_formats:
+            report_path = os.path.join(self.output_dir, f"文件夹比较报告_{timestamp}.{fmt}")
+            self.reports.append(MULTI_REPORT_WRITERS[fmt](report_path, self.folders))
+
+
+# ----------------------
+# 工具函数
+# ----------------------
+def format_size(size_bytes):
+    """格式化文件大小"""
+    if size_bytes == 0:
+        return "0 B"
+    
+    size_names = ["B", "KB", "MB", "GB", "TB"]
+    i = 0
+    while size_bytes >= 1024 and i < len(size_names) - 1:
+        size_bytes /= 1024.0
+        i += 1
+    
+    return f"{size_bytes:.2f} {size_names[i]}"
+
+
+def format_age(seconds):
+    """把秒数格式化为 7 天、12 小时这样的时长"""
+    for unit, label in ((7 * 86400, "周"), (86400, "天"), (3600, "小时"), (60, "分钟")):
+        if seconds >= unit and seconds % unit == 0:
+            return f"{seconds // unit:g} {label}"
+    return f"{seconds:g} 秒"
+
+
+def compare_folders(folder1, folder2, **options):
+    """以库的方式比较两个文件夹，返回结果汇总（失败或取消时为 None）
+    
+    options 与 FolderComparator 的参数相同，例如 recursive=True、compare_content=True、
+    on_records=回调函数 用于流式接收比较结果。
+    """
+    return FolderComparator(folder1, folder2, **options).run()
+
+
+def compare_many_folders(folders, **options):
+    """以库的方式同时比较多个文件夹，返回结果汇总（失败或取消时为 None）
+    
+    options 与 MultiFolderComparator 的参数相同；结果以 MultiRecord 通过 on_records 回调流式发送。
+    """
+    return MultiFolderComparator(folders, **options).run()
+
+
+def save_snapshot(folder, path, with_digests=False, **options):
+    """扫描文件夹并保存为快照文件，返回保存的文件数（失败或取消时为 None）
+    
+    快照可以代替比较中的任意一侧文件夹；options 中的扫描选项（recursive、max_depth 等）
+    与 FolderComparator 相同。
+    """
+    return FolderComparator(folder, None, **options).save_snapshot(path, with_digests)